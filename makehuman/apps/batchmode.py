@@ -0,0 +1,879 @@
+#!/usr/bin/python2.7
+# -*- coding: utf-8 -*-
+
+"""
+**Project Name:**      MakeHuman
+
+**Product Home Page:** http://www.makehuman.org/
+
+**Code Home Page:**    https://bitbucket.org/MakeHuman/makehuman/
+
+**Copyright(c):**      MakeHuman Team 2001-2017
+
+**Licensing:**         AGPL3
+
+    This file is part of MakeHuman (www.makehuman.org).
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as
+    published by the Free Software Foundation, either version 3 of the
+    License, or (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+Abstract
+--------
+
+Headless batch generation of human models.
+
+The basemesh, modifiers, macro targets, reference skeleton and the proxy,
+skeleton, pose and material libraries are loaded once, after which a stream of
+models described by MHM files or JSON parameter sets is built and exported
+without starting the Qt GUI. Everything that is loaded for one model (targets,
+proxies, rigs, poses, materials) stays cached for the next one.
+
+A JSON parameter set is an object whose keys are MHM property keywords and
+whose values are the remainder of the corresponding MHM line, or a list of them
+for properties that can occur more than once (such as clothes). Modifiers can
+be given as an object mapping modifier names to values. The optional "name" key
+determines the name of the exported file::
+
+    {"name": "model0001",
+     "modifier": {"macrodetails/Gender": 1.0, "macrodetails/Age": 0.5},
+     "eyes": "HighPolyEyes 2c12f43b-1303-432c-b7ce-d78346baf2e6",
+     "skinMaterial": "skins/default.mhmat"}
+
+Jobs are read from an MHM file, a JSON file (containing one parameter set or a
+list of them) or a text file (or stdin) with one job per line, each line being
+either the path of an MHM or JSON file or an inline JSON parameter set.
+"""
+
+import os
+import sys
+import time
+import json
+from codecs import open
+
+import numpy as np
+
+from core import G
+import log
+import getpath
+import filecache
+import files3d
+import algos3d
+import targets
+import human
+import humanmodifier
+import skeleton
+import animation
+import bvh
+import proxy
+import material
+import libraryhandlers
+import export
+import wavefront
+from makehuman import getShortVersion
+
+
+class NullCamera(object):
+    """
+    Stand-in for the model camera. MHM files store camera settings, which have
+    no meaning without a viewport.
+    """
+    def __init__(self):
+        self.translation = [0.0, 0.0, 0.0]
+        self.zoomFactor = 1.0
+        self._rotation = [0.0, 0.0, 0.0]
+
+    def setRotation(self, rot):
+        self._rotation = list(rot)
+
+    def getRotation(self):
+        return self._rotation
+
+    def setZoomFactor(self, zoom):
+        self.zoomFactor = zoom
+
+
+class ProxyLibrary(filecache.MetadataCacher, libraryhandlers.ProxyLibraryHandlers):
+    """
+    Headless counterpart of the proxy chooser libraries. Resolves proxies
+    referenced by UUID in MHM properties and attaches them to the human.
+    Loaded proxies and their meshes are kept between models, so that every
+    proxy file is parsed only once per batch.
+    """
+
+    def __init__(self, human, proxyName, saveName=None, multiProxy=False, fileExtensions=None):
+        if fileExtensions is None:
+            fileExtensions = ['mhpxy', 'mhclo']
+        filecache.MetadataCacher.__init__(self, fileExtensions, proxyName + '_filecache.mhc')
+        self.human = human
+        self.proxyName = proxyName
+        self.saveName = saveName or proxyName
+        self.multiProxy = multiProxy
+        self.paths = [getpath.getDataPath(proxyName), getpath.getSysDataPath(proxyName)]
+
+        self.selectedProxies = []
+        self._proxyFilePerUuid = None
+        self._loaded = {}   # Proxy file -> (proxy, object)
+
+    def getMetadataImpl(self, filename):
+        return proxy.peekMetadata(filename, self.getProxyType())
+
+    def getTagsFromMetadata(self, metadata):
+        uuid, tags = metadata
+        return tags
+
+    def getSearchPaths(self):
+        return self.paths
+
+    def getSaveName(self):
+        return self.saveName
+
+    def getProxyType(self):
+        return self.proxyName.capitalize()
+
+    def getSelection(self):
+        return list(self.selectedProxies)
+
+    def findProxyByUuid(self, uuid):
+        """
+        Find proxy file in this library by UUID, returns None if it is not
+        found.
+        """
+        if self._filecache is None:
+            self.loadCache()
+            self.updateFileCache(self.getSearchPaths(), self.getFileExtensions(), True)
+
+        if self._proxyFilePerUuid is None or (uuid is not None and uuid not in self._proxyFilePerUuid):
+            # Lazily refresh the lookup table, files might have been added
+            if self._proxyFilePerUuid is not None:
+                self.updateFileCache(self.getSearchPaths(), self.getFileExtensions(), True)
+            self._proxyFilePerUuid = dict( (values[1], path) for (path, values) in self._filecache.items() )
+
+        return self._proxyFilePerUuid.get(uuid, None)
+
+    def loadProxyFile(self, mhclofile):
+        """
+        Load a proxy and its mesh, or return them from the cache of loaded
+        proxies. Returns (proxy, object), or None if the mesh cannot be loaded.
+        """
+        if mhclofile not in self._loaded:
+            log.message('Loading proxy file "%s" from %s library.', mhclofile, self.proxyName)
+            pxy = proxy.loadProxy(self.human, mhclofile, type=self.getProxyType())
+            if self.proxyName == 'proxymeshes':
+                pxy.z_depth = self.human.getSeedMesh().priority
+            mesh, obj = pxy.loadMeshAndObject(self.human)
+            if not mesh:
+                return None
+            self._loaded[mhclofile] = (pxy, obj)
+        return self._loaded[mhclofile]
+
+    def preload(self):
+        """
+        Load all proxy files available in this library.
+        """
+        self.findProxyByUuid(None)
+        for mhclofile in sorted(set(self._proxyFilePerUuid.values())):
+            try:
+                self.loadProxyFile(mhclofile)
+            except Exception:
+                log.warning('Failed to preload proxy file "%s".', mhclofile, exc_info=True)
+
+    def selectProxy(self, mhclofile):
+        for pxy in self.selectedProxies:
+            if pxy.file == mhclofile:
+                return
+
+        if not self.multiProxy and self.selectedProxies:
+            self.deselectProxy(self.selectedProxies[0])
+
+        loaded = self.loadProxyFile(mhclofile)
+        if loaded is None:
+            return
+        pxy, obj = loaded
+        pxy.object = obj
+
+        # Fitting is done when the targets are applied after loading
+        self.selectedProxies.append(pxy)
+        self.proxySelected(pxy)
+
+    def deselectProxy(self, pxy):
+        self.selectedProxies.remove(pxy)
+        self.proxyDeselected(pxy)
+        pxy.object = None
+
+    def proxySelected(self, pxy):
+        if self.proxyName == 'proxymeshes':
+            self.human.setProxy(pxy)
+        elif self.multiProxy:
+            self.human.addClothesProxy(pxy)
+        else:
+            setattr(self.human, self.proxyName + 'Proxy', pxy)
+
+    def proxyDeselected(self, pxy):
+        if self.proxyName == 'proxymeshes':
+            self.human.setProxy(None)
+        elif self.multiProxy:
+            self.human.removeClothesProxy(pxy.getUuid())
+        else:
+            setattr(self.human, self.proxyName + 'Proxy', None)
+
+    def adaptProxyToHuman(self, pxy, coords=None):
+        if self.proxyName == 'proxymeshes':
+            # The human updates its own proxy mesh
+            return
+        pxy.update(pxy.object.getSeedMesh(), coords=coords)
+
+    def adaptAllProxies(self, event=None):
+        if self.proxyName == 'proxymeshes' or not self.selectedProxies:
+            return
+        # Fit in one pass, shared with the other libraries handling this event
+        coords = proxy.fitProxies(self.human, self.selectedProxies, event=event)
+        for pxy, pxyCoords in zip(self.selectedProxies, coords):
+            self.adaptProxyToHuman(pxy, pxyCoords)
+
+    def onHumanChanged(self, event):
+        if event.change == 'reset':
+            # The human drops all its proxies when reset, except its topology proxy
+            if self.proxyName == 'proxymeshes' and self.selectedProxies:
+                self.human.setProxy(None)
+            for pxy in self.selectedProxies:
+                pxy.object = None
+            self.selectedProxies = []
+        elif event.change == 'targets':
+            self.adaptAllProxies(event)
+
+
+class ClothesLibrary(ProxyLibrary, libraryhandlers.ClothesLibraryHandlers):
+    """
+    Clothes library, additionally hides the faces of the body and of lower
+    clothing layers that are covered by clothes.
+    """
+
+    def __init__(self, human):
+        super(ClothesLibrary, self).__init__(human, 'clothes', multiProxy=True)
+        self.faceHiding = True
+        self.blockFaceMasking = False
+
+    def isFaceHiding(self):
+        return self.faceHiding
+
+    def setFaceHiding(self, enabled):
+        self.faceHiding = enabled
+
+    def updateFaceMasks(self, enableFaceHiding=True):
+        if self.blockFaceMasking:
+            return
+
+        human = self.human
+        if not enableFaceHiding:
+            human.changeVertexMask(None)
+            for pxy in self.selectedProxies:
+                pxy.object.changeVertexMask(None)
+            return
+
+        vertsMask = np.ones(human.meshData.getVertexCount(), dtype=bool)
+
+        for pxy in sorted(self.selectedProxies, key=lambda p: p.z_depth, reverse=True):
+            # Apply accumulated mask from previous clothes layers on this clothing piece
+            pxy.object.changeVertexMask(proxy.transferVertexMaskToProxy(vertsMask, pxy))
+            if pxy.deleteVerts is not None:
+                vertsMask[pxy.deleteVerts] = False
+
+        human.changeVertexMask(vertsMask)
+
+    def onHumanChanged(self, event):
+        super(ClothesLibrary, self).onHumanChanged(event)
+        if event.change == 'reset':
+            self.faceHiding = True
+
+
+class SkeletonLibrary(libraryhandlers.SkeletonLibraryHandlers):
+    """
+    Loads the user skeleton referenced in MHM files. Skeletons are cached per
+    file, their joint positions are updated for every model by the human.
+    """
+
+    def __init__(self, human):
+        self.human = human
+        self.paths = [getpath.getDataPath('rigs'), getpath.getSysDataPath('rigs')]
+        self.selectedRig = None
+        self._loaded = {}
+
+    def chooseSkeleton(self, filename):
+        self.selectedRig = filename
+        if not filename:
+            if self.human.getSkeleton():
+                self.human.setSkeleton(None)
+            return
+
+        if filename not in self._loaded:
+            baseSkel = self.human.getBaseSkeleton()
+            skel = skeleton.load(filename, self.human.meshData)
+            skel.autoBuildWeightReferences(baseSkel)
+            skel.getVertexWeights(baseSkel.getVertexWeights(), force_remap=False)
+            skel.addReferencePlanes(baseSkel)
+            self._loaded[filename] = skel
+        self.human.setSkeleton(self._loaded[filename])
+
+    def onHumanChanged(self, event):
+        if event.change == 'reset':
+            self.chooseSkeleton(None)
+
+
+class PoseLibrary(libraryhandlers.PoseLibraryHandlers):
+    """
+    Poses the human with the BVH or MHP pose referenced in MHM files. Parsed
+    BVH files are cached, the animation is rebuilt for every model because
+    its root translation is scaled to the leg length of the human.
+    """
+
+    def __init__(self, human):
+        self.human = human
+        self.paths = [getpath.getDataPath('poses'), getpath.getSysDataPath('poses')]
+        self.currentPose = None
+        self.bvh_bone_length = None
+        self.bvh_root_translation = None
+        self._bvhFiles = {}
+
+    def loadPose(self, filepath):
+        self.currentPose = filepath
+        if os.path.splitext(filepath)[1].lower() == '.mhp':
+            anim = animation.loadPoseFromMhpFile(filepath, self.human.getBaseSkeleton())
+            self.bvh_bone_length = None
+            self.bvh_root_translation = None
+        else:
+            if filepath not in self._bvhFiles:
+                self._bvhFiles[filepath] = bvh.load(filepath, convertFromZUp="auto")
+            bvh_file = self._bvhFiles[filepath]
+            anim = bvh_file.createAnimationTrack(self.human.getBaseSkeleton())
+            self.setAutoScaleReference(bvh_file, anim)
+            self.autoScaleAnim(anim)
+
+        self.human.addAnimation(anim)
+        self.human.setActiveAnimation(anim.name)
+        self.human.setToFrame(0, update=False)
+        self.human.setPosed(True)
+
+    def onHumanChanged(self, event):
+        if event.change == 'reset':
+            self.currentPose = None
+            self.bvh_bone_length = None
+            self.bvh_root_translation = None
+        elif event.change == 'targets':
+            anim = self.human.getActiveAnimation()
+            if anim:
+                self.autoScaleAnim(anim)
+
+
+class MaterialLibrary(libraryhandlers.MaterialLibraryHandlers):
+    """
+    Applies skin and proxy materials referenced in MHM files. Parsed
+    materials are cached per file.
+    """
+
+    def __init__(self, human):
+        self.human = human
+        self._loaded = {}
+
+    def loadMaterial(self, filepath):
+        if filepath not in self._loaded:
+            self._loaded[filepath] = material.fromFile(filepath)
+        return self._loaded[filepath]
+
+
+class BatchApplication(object):
+    """
+    Minimal application object that takes the place of the GUI application
+    (G.app) when generating models in batch.
+    """
+
+    def __init__(self, settings=None):
+        self.selectedHuman = None
+        self.loadHandlers = {}
+        self.saveHandlers = []
+        self.libraries = []
+        self.modelCamera = NullCamera()
+        # No GUI elements to send log messages to
+        self.splash = None
+        self.statusBar = None
+        self.log_window = None
+        self._settings = dict(settings or {})
+
+    def getSetting(self, setting_name):
+        return self._settings.get(setting_name, None)
+
+    def setSetting(self, setting_name, value):
+        self._settings[setting_name] = value
+
+    def addLoadHandler(self, keyword, handler):
+        self.loadHandlers[keyword] = handler
+
+    def addSaveHandler(self, handler, priority=None):
+        if priority is None:
+            self.saveHandlers.append(handler)
+        else:
+            self.saveHandlers.insert(priority, handler)
+
+    def progress(self, *args, **kwargs):
+        pass
+
+    def redraw(self):
+        pass
+
+    def loadHuman(self):
+        """
+        Load the basemesh, its modifiers and reference skeleton and preload
+        the macro targets. This is done once for an entire batch.
+        """
+        cacheSize = self.getSetting('targetCacheSize')
+        if cacheSize is not None:
+            algos3d.setTargetCacheSize(cacheSize * 1024 * 1024)
+
+        self.selectedHuman = human.Human(files3d.loadMesh(getpath.getSysDataPath("3dobjs/base.obj"), maxFaces = 5))
+
+        try:
+            base_skel = skeleton.load(getpath.getSysDataPath('rigs/default.mhskel'), self.selectedHuman.meshData)
+            self.selectedHuman.setBaseSkeleton(base_skel)
+        except Exception:
+            log.warning("Could not load the reference skeleton, skeletons and poses are not available in this batch.", exc_info=True)
+
+        humanmodifier.loadModifiers(getpath.getSysDataPath('modifiers/modeling_modifiers.json'), self.selectedHuman)
+        humanmodifier.loadModifiers(getpath.getSysDataPath('modifiers/measurement_modifiers.json'), self.selectedHuman)
+
+        for target in targets.getTargets().findTargets('macrodetails'):
+            algos3d.getTarget(self.selectedHuman.meshData, target.path)
+
+        self.selectedHuman.updateMacroModifiers()
+        self.selectedHuman.applyAllTargets()
+
+    def loadLibraries(self):
+        """
+        Register the load and save handlers for all MHM properties that are
+        supported in batch mode, in the same order as the GUI libraries.
+        """
+        hm = self.selectedHuman
+
+        self.libraries = [ ProxyLibrary(hm, 'proxymeshes', 'proxy', fileExtensions=['mhpxy', 'proxy']),
+                           ClothesLibrary(hm) ]
+        for proxyName in ['eyes', 'hair', 'eyebrows', 'eyelashes', 'teeth', 'tongue']:
+            self.libraries.append(ProxyLibrary(hm, proxyName))
+        for library in self.libraries:
+            self.addLoadHandler(library.getSaveName(), library.loadHandler)
+            self.addSaveHandler(library.saveHandler, priority=2)
+        self.addLoadHandler('clothesHideFaces', self.libraries[1].loadHandler)
+
+        skelLibrary = SkeletonLibrary(hm)
+        self.addLoadHandler('skeleton', skelLibrary.loadHandler)
+        self.addSaveHandler(skelLibrary.saveHandler, priority=5)
+        self.libraries.append(skelLibrary)
+
+        poseLibrary = PoseLibrary(hm)
+        self.addLoadHandler('pose', poseLibrary.loadHandler)
+        self.addSaveHandler(poseLibrary.saveHandler, priority=6)
+        self.libraries.append(poseLibrary)
+
+        matLibrary = MaterialLibrary(hm)
+        self.addLoadHandler('skinMaterial', matLibrary.loadHandler)
+        self.addLoadHandler('material', matLibrary.loadHandler)
+        self.addSaveHandler(matLibrary.saveHandler)
+
+        @hm.mhEvent
+        def onChanged(event):
+            for library in self.libraries:
+                library.onHumanChanged(event)
+
+    def preloadAssets(self):
+        """
+        Load all targets and all proxies of the proxy libraries. Used before
+        forking worker processes, so that the workers share these assets
+        instead of each loading them on demand.
+        """
+        for target in targets.getTargets().targets:
+            algos3d.getTarget(self.selectedHuman.meshData, target.path)
+
+        for library in self.libraries:
+            if isinstance(library, ProxyLibrary):
+                library.preload()
+
+    def storeCaches(self):
+        for library in self.libraries:
+            if isinstance(library, filecache.MetadataCacher):
+                library.storeCache()
+
+
+class BatchGenerator(object):
+    """
+    Builds and exports models one after the other, reusing everything that
+    was loaded for previous models.
+    """
+
+    def __init__(self, outputDir, strict=False, settings=None):
+        self.outputDir = outputDir
+        self.strict = strict
+
+        self.app = BatchApplication(settings)
+        G.app = self.app
+        self.app.loadHuman()
+        self.app.loadLibraries()
+
+        self.exportConfig = export.ExportConfig()
+        self.exportConfig.setHuman(self.human)
+        self.exportConfig.useNormals = True
+
+        self.count = 0
+        self.failed = 0
+        self.elapsed = 0.0
+
+    @property
+    def human(self):
+        return self.app.selectedHuman
+
+    def build(self, job):
+        """
+        Build the human from a job, which is either the path of an MHM file or
+        a dict of MHM properties.
+        """
+        if isinstance(job, dict):
+            self.human.loadLines(parametersToLines(job), job.get('name'), True, self.strict)
+        else:
+            self.human.load(job, True, self.strict)
+
+    def export(self, name):
+        """
+        Export the current human as Wavefront OBJ file to the output folder.
+        Returns the path of the written file. If the export fails, the
+        partially written OBJ and MTL files are removed.
+        """
+        filepath = os.path.join(self.outputDir, name + '.obj')
+        self.exportConfig.setupTexFolder(filepath)
+        meshes = [obj.mesh for obj in self.human.getObjects(excludeZeroFaceObjs=True)]
+        try:
+            wavefront.writeObjFile(filepath, meshes, True, self.exportConfig)
+        except Exception:
+            for path in [filepath, os.path.splitext(filepath)[0] + '.mtl']:
+                try:
+                    if os.path.isfile(path):
+                        os.remove(path)
+                except OSError:
+                    log.warning("Could not remove partially exported file %s.", path, exc_info=True)
+            raise
+        return filepath
+
+    def generate(self, job, name):
+        """
+        Build and export a single model. Returns the path of the exported file,
+        or None if the job failed.
+        """
+        t0 = time.time()
+        try:
+            self.build(job)
+            filepath = self.export(name)
+        except Exception:
+            if self.strict:
+                raise
+            log.error("Failed to generate model %s.", name, exc_info=True)
+            filepath = None
+            self.failed += 1
+        else:
+            self.count += 1
+        self.elapsed += time.time() - t0
+        return filepath
+
+    def run(self, jobs):
+        """
+        Generate all (name, job) pairs from the jobs iterable.
+        """
+        if not os.path.isdir(self.outputDir):
+            os.makedirs(self.outputDir)
+
+        for name, job in jobs:
+            filepath = self.generate(job, name)
+            if filepath:
+                log.message("Exported %s", filepath)
+
+        self.app.storeCaches()
+        return self.report()
+
+    def runParallel(self, jobs, workers, maxPending=None):
+        """
+        Generate all (name, job) pairs from the jobs iterable with a pool of
+        worker processes.
+        All targets and proxies are loaded before the workers are forked, so
+        that the workers share these (read-only) assets with this process
+        copy-on-write instead of each loading them again. At most maxPending
+        jobs (by default twice the number of workers) are queued ahead of the
+        workers, so a job stream is read only as fast as models are generated.
+        """
+        import multiprocessing
+        import Queue
+
+        if not hasattr(os, 'fork'):
+            log.warning("Worker processes require fork(), generating models in a single process.")
+            return self.run(jobs)
+
+        if not os.path.isdir(self.outputDir):
+            os.makedirs(self.outputDir)
+
+        if maxPending is None:
+            maxPending = 2 * workers
+
+        self.app.preloadAssets()
+        self.app.storeCaches()
+        log.message("Assets loaded, starting %d workers. Memory use: %s.", workers, formatMemoryUsage(getMemoryUsage()))
+
+        jobQueue = multiprocessing.Queue(maxPending)
+        resultQueue = multiprocessing.Queue()
+        processes = [ multiprocessing.Process(target=_worker, args=(self, workerId, jobQueue, resultQueue)) \
+                      for workerId in xrange(workers) ]
+        workerStats = [ {'count': 0, 'failed': 0, 'memory': (None, None), 'done': False, 'cache': None} for _ in processes ]
+
+        def _collect(timeout=None):
+            """
+            Process worker results, waits at most timeout seconds for the
+            first one. Returns False if the wait timed out.
+            """
+            try:
+                result = resultQueue.get(timeout is not None, timeout)
+            except Queue.Empty:
+                return False
+            while True:
+                workerId, name, filepath, memory = result
+                stats = workerStats[workerId]
+                stats['memory'] = memory
+                if name is None:
+                    stats['done'] = True
+                    stats['cache'] = filepath
+                elif filepath:
+                    stats['count'] += 1
+                    log.message("Exported %s (worker %d)", filepath, workerId)
+                else:
+                    stats['failed'] += 1
+                try:
+                    result = resultQueue.get(False)
+                except Queue.Empty:
+                    return True
+
+        t0 = time.time()
+        for p in processes:
+            p.start()
+
+        submitted = 0
+        for item in jobs:
+            submitted += 1
+            while True:
+                try:
+                    jobQueue.put(item, True, 0.1)
+                    break
+                except Queue.Full:
+                    _collect()
+                    if not any(p.is_alive() for p in processes):
+                        raise RuntimeError("All batch workers exited unexpectedly.")
+            _collect()
+
+        for _ in processes:
+            jobQueue.put(None)
+        while not all(stats['done'] for stats in workerStats):
+            if not _collect(1.0) and not any(p.is_alive() for p in processes):
+                # Drain results of workers that died without signalling
+                _collect()
+                break
+        for p in processes:
+            p.join()
+
+        self.elapsed = time.time() - t0
+        self.count = sum(stats['count'] for stats in workerStats)
+        self.failed = sum(stats['failed'] for stats in workerStats)
+        # Jobs lost by workers that exited unexpectedly failed as well
+        self.failed = max(self.failed, submitted - self.count)
+
+        for workerId, stats in enumerate(workerStats):
+            log.message("Worker %d: %d models (%d failed)%s, memory use: %s.", workerId, stats['count'], stats['failed'],
+                        "" if stats['done'] else ", exited unexpectedly", formatMemoryUsage(stats['memory']))
+            if stats['cache']:
+                log.message("Worker %d: %s", workerId, formatTargetCacheStats(stats['cache']))
+        return self.report(cacheStats=False)
+
+    def report(self, cacheStats=True):
+        """
+        Log and return a summary of the throughput of this batch.
+        """
+        if cacheStats:
+            log.message(formatTargetCacheStats(algos3d.getTargetCacheStats()))
+        if self.elapsed > 0:
+            rate = 60.0 * self.count / self.elapsed
+        else:
+            rate = 0.0
+        text = "Generated %d models (%d failed) in %.1f seconds: %.1f models/minute." % (self.count, self.failed, self.elapsed, rate)
+        log.message(text)
+        return text
+
+
+def _worker(generator, workerId, jobQueue, resultQueue):
+    """
+    Main loop of a batch worker process. Results are sent back as
+    (workerId, name, filepath, memory) tuples. When the worker is finished
+    it sends (workerId, None, targetCacheStats, memory).
+    """
+    for name, job in iter(jobQueue.get, None):
+        filepath = generator.generate(job, name)
+        resultQueue.put((workerId, name, filepath, getMemoryUsage()))
+    # The final message carries the target cache statistics of the worker
+    resultQueue.put((workerId, None, algos3d.getTargetCacheStats(), getMemoryUsage()))
+
+
+def getMemoryUsage():
+    """
+    Return (resident, shared) memory of this process in bytes. For forked
+    workers, shared memory includes the pages still shared with the parent.
+    Values that cannot be determined on this platform are None.
+    """
+    try:
+        # Linux: shared pages are those not private to this process
+        values = {}
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                words = line.split()
+                if len(words) == 3 and words[2] == 'kB':
+                    values[words[0]] = 1024 * int(words[1])
+        private = values['Private_Clean:'] + values['Private_Dirty:']
+        return values['Rss:'], values['Rss:'] - private
+    except (IOError, OSError, ValueError, KeyError):
+        pass
+
+    try:
+        import resource
+        # Peak resident size, in bytes on OS X and in kilobytes elsewhere
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss * (1 if sys.platform == 'darwin' else 1024), None
+    except ImportError:
+        return None, None
+
+
+def formatMemoryUsage(memory):
+    resident, shared = memory
+    if resident is None:
+        return "unknown"
+    if shared is None:
+        return "%.1f MB resident" % (resident / 1048576.0)
+    return "%.1f MB resident (%.1f MB shared)" % (resident / 1048576.0, shared / 1048576.0)
+
+
+def formatTargetCacheStats(stats):
+    return "Target cache: %d targets, %.1f MB, %d hits, %d misses, %d evictions, %d target stacks, %.1f MB." % \
+           (stats['targets'], stats['bytes'] / 1048576.0, stats['hits'], stats['misses'], stats['evictions'],
+            stats['stacks'], stats['stackBytes'] / 1048576.0)
+
+
+def parametersToLines(params):
+    """
+    Convert a JSON parameter set to MHM property lines.
+    """
+    lines = ['version %s' % getShortVersion(noSub=True)]
+    for key, value in params.items():
+        if key in ['name', 'version']:
+            continue
+        if key == 'modifier' and isinstance(value, dict):
+            for mName, mValue in value.items():
+                lines.append('modifier %s %f' % (mName, float(mValue)))
+            continue
+        if not isinstance(value, list):
+            value = [value]
+        for v in value:
+            lines.append('%s %s' % (key, v))
+    return lines
+
+
+def readJobs(source):
+    """
+    Generator that yields (name, job) pairs from a job source, which is an MHM
+    file, a JSON file, a text file with one job per line, or '-' for standard
+    input. Jobs are yielded as they are read, so that the input can be a
+    stream produced by another process.
+    Job names, which name the exported files, are unique: a name that was
+    already used (such as two MHM files with the same name in different
+    folders) gets a numbered suffix.
+    """
+    def _parameterJobs(params, prefix):
+        if isinstance(params, dict):
+            params = [params]
+        for params_ in params:
+            index = next(counter)
+            yield params_.get('name', '%s%05d' % (prefix, index)), params_
+
+    def _fileJobs(path):
+        ext = os.path.splitext(path)[1].lower()
+        if ext == '.mhm':
+            next(counter)
+            yield os.path.splitext(os.path.basename(path))[0], path
+        elif ext == '.json':
+            with open(path, 'rU', encoding="utf-8") as f:
+                params = json.load(f)
+            for job in _parameterJobs(params, os.path.splitext(os.path.basename(path))[0]):
+                yield job
+        else:
+            with open(path, 'rU', encoding="utf-8") as f:
+                for job in _streamJobs(f):
+                    yield job
+
+    def _streamJobs(f):
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('{'):
+                for job in _parameterJobs(json.loads(line), 'model'):
+                    yield job
+            else:
+                for job in _fileJobs(line):
+                    yield job
+
+    def _uniqueJobs(jobs):
+        used = set()
+        for name, job in jobs:
+            if name in used:
+                base = name
+                suffix = itertools.count(2)
+                while name in used:
+                    name = '%s_%d' % (base, next(suffix))
+                log.warning('Duplicate job name %s, exporting job as %s.', base, name)
+            used.add(name)
+            yield name, job
+
+    import itertools
+    counter = itertools.count()
+
+    if source in [None, '-']:
+        return _uniqueJobs(_streamJobs(iter(sys.stdin.readline, '')))
+    return _uniqueJobs(_fileJobs(source))
+
+
+def run(args):
+    """
+    Entry point for the --batch command line option. Returns the number of
+    models that failed to generate.
+    """
+    settings = {}
+    if args.get('batch_target_cache', None) is not None:
+        settings['targetCacheSize'] = args['batch_target_cache']
+    generator = BatchGenerator(args['batch'], strict=args.get('strict', False), settings=settings)
+    jobs = readJobs(args.get('mhmFile'))
+
+    workers = args.get('batch_workers', 1)
+    if workers == 0:
+        import multiprocessing
+        workers = multiprocessing.cpu_count()
+    if workers > 1:
+        generator.runParallel(jobs, workers)
+    else:
+        generator.run(jobs)
+    return generator.failed
@@ -40,20 +40,35 @@ TODO
 
 __docformat__ = 'restructuredtext'
 
+import os
+import hashlib
+import glob
+from collections import OrderedDict
+
 import numpy as np
 
 from module3d import Object3D
 from progress import Progress
+import files3d
+import getpath
 import log
 
 class SubdivisionObject(Object3D):
-    def __init__(self, object, staticFaceMask=None):
+    def __init__(self, object, staticFaceMask=None, refineFaceMask=None):
         """
-        If staticFaceMask is specified (which is a face mask valid on object), 
+        If staticFaceMask is specified (which is a face mask valid on object),
         the masked faces and their vertices are not included as geometry in
         this subdivision object (higher performance).
         After building a subdivision object, a (dynamic) face mask can still be
         set on the faces of the subdiv mesh.
+
+        If refineFaceMask is specified (a face mask valid on object), only
+        those faces are subdivided, the other faces are included unaltered.
+        The verts on the border of the refined region stay in place, and the
+        edges on that border are split at their midpoint, so that the refined
+        faces connect to the unrefined ones without gaps.
+
+        Object can itself be a subdivision object, to subdivide more levels.
         """
         name = object.name + '.sub'
         super(SubdivisionObject, self).__init__(name, 4)
@@ -70,10 +85,25 @@ class SubdivisionObject(Object3D):
             self._staticFaceMask = np.ones(object.getFaceCount(), dtype=bool)
         else:
             self._staticFaceMask = staticFaceMask
+        if refineFaceMask is None:
+            self._refineFaceMask = np.ones(object.getFaceCount(), dtype=bool)
+        else:
+            self._refineFaceMask = np.asarray(refineFaceMask, dtype=bool)
+
+        if isinstance(object, SubdivisionObject):
+            self.level = object.level + 1
+            self.root = object.root
+        else:
+            self.level = 1
+            self.root = object
 
     def create(self):
         log.debug('Applying Catmull-Clark subdivision on %s.', self.parent.name)
 
+        key = self._topologyKey()
+        if self._loadTopology(key):
+            return
+
         # Progress bar will be updated only through the parent Progress.
         progress = Progress([0, 0, 16, 0, 15, 63, 0, 0, 0, 93,
             16, 0, 0, 343, 141, 15, 109, 328, 31, 281],
@@ -97,6 +127,12 @@ class SubdivisionObject(Object3D):
         nfaces = len(self.face_map)
         self.face_rmap[self.face_map] = np.arange(nfaces)
 
+        # Faces that are refined, and faces that are included unaltered
+        refine = self.refineFaceMask[self.face_map]
+        self.refine_map = self.face_map[refine]
+        keep_map = self.face_map[~refine]
+        nrefined = len(self.refine_map)
+
         progress.step()
 
         verts = parent.fvert[face_mask]
@@ -108,6 +144,15 @@ class SubdivisionObject(Object3D):
         vtx_rmap[self.vtx_map] = np.arange(nverts)
         self.vtx_rmap = vtx_rmap
 
+        # Verts of unrefined faces, and verts that were kept in place on the
+        # border of the refined region by a previous level, stay in place
+        pinned = np.zeros(len(parent.coord), dtype=bool)
+        pinned[parent.fvert[keep_map]] = True
+        if isinstance(parent, SubdivisionObject):
+            pinned |= parent.pinned_verts
+        self._base_pinned = pinned[self.vtx_map]
+        del pinned
+
         progress.step()
 
         uvs = parent.fuvs[face_mask]
@@ -120,17 +165,17 @@ class SubdivisionObject(Object3D):
 
         progress.step()
 
-        fvert = vtx_rmap[parent.fvert[self.face_map]]
+        fvert = vtx_rmap[parent.fvert[self.refine_map]]
         vedges = np.dstack((fvert,np.roll(fvert,-1,axis=1)))  # All 4 edges belonging to each face
 
-        fuv = uv_rmap[parent.fuvs[self.face_map]]
+        fuv = uv_rmap[parent.fuvs[self.refine_map]]
         tedges = np.dstack((fuv,np.roll(fuv,-1,axis=1)))
 
-        self.cbase = nverts            # Index of first subdivided vert
-        self.ebase = nverts + nfaces   # Edge base index 
+        self.cbase = nverts              # Index of first subdivided vert
+        self.ebase = nverts + nrefined   # Edge base index
 
         self.tcbase = ntexco
-        self.tebase = ntexco + nfaces
+        self.tebase = ntexco + nrefined
 
         progress.step()
 
@@ -166,7 +211,7 @@ class SubdivisionObject(Object3D):
 
         progress.step()
 
-        nfaces = len(self.face_map)
+        nfaces = nrefined
 
         self.fvert = np.empty((nfaces,4,4), dtype=np.uint32)
         self.fuvs  = np.empty((nfaces,4,4), dtype=np.uint32)
@@ -186,8 +231,8 @@ class SubdivisionObject(Object3D):
         self.fuvs[:,:,0] = fuv
         self.fuvs[:,:,2] = np.arange(nfaces)[:,None] + self.tcbase
 
-        self.group[...] = parent.group[self.face_map][:,None]
-        self.face_mask[...] = parent.face_mask[self.face_map][:,None]
+        self.group[...] = parent.group[self.refine_map][:,None]
+        self.face_mask[...] = parent.face_mask[self.refine_map][:,None]
 
         progress.step()
 
@@ -210,26 +255,23 @@ class SubdivisionObject(Object3D):
         self.evert = np.asarray(vedgelist, dtype = np.uint32)
         self.etexc = np.asarray(tedgelist, dtype = np.uint32)
 
-        # TODO document
-        self.vedge = np.zeros((nverts, self.MAX_FACES), dtype=np.uint32)
-        self.nedges = np.zeros(nverts, dtype=np.uint8)
+        # Edges on the border of the refined region are split at their
+        # midpoint, the edge verts stay in place on the next levels
+        inedge = (self.evert[:,1,0] == self.evert[:,1,1])
+        pinned_edges = inedge & self._base_pinned[self.evert[:,0,0]] & self._base_pinned[self.evert[:,0,1]]
+        self.pinned_verts = np.hstack((self._base_pinned,
+                                       np.zeros(nrefined, dtype=bool),
+                                       pinned_edges))
+        del inedge, pinned_edges
 
         progress.step()
 
-        map_ = np.argsort(self.evert[:,0,:].flat)
-        vi = self.evert[:,0,:].flat[map_]
-        ei = np.mgrid[:len(self.evert),:2][0].flat[map_].astype(np.uint32)
-        del map_
-        ix, first = np.unique(vi, return_index=True)
-        n = first[1:] - first[:-1]
-        n = np.hstack((n, np.array([len(vi) - first[-1]])))
-        self.nedges[ix] = n.astype(np.uint8)
-        try:
-            for i in xrange(len(ix)):
-                self.vedge[ix[i],:n[i]] = ei[first[i]:][:n[i]]
-        except ValueError as e:
-            raise RuntimeError("Pole-count too low, try increasing max_pole: %s" % e)
-        del vi, ei, ix, n, first
+        # The refinement is a constant linear map for a given topology,
+        # build it once as sparse operators on the parent coordinates and UVs
+        operators = _operatorCache.get(key)
+        if operators is None:
+            operators = (self._buildCoordOperator(), self._buildUVOperator())
+        self._setOperators(key, operators)
 
         progress.step()
 
@@ -263,6 +305,24 @@ class SubdivisionObject(Object3D):
         self.fuvs  = self.fuvs.reshape((nfaces,4))
         self.group = self.group.reshape(nfaces)
         self.face_mask = self.face_mask.reshape(nfaces)
+
+        # Unrefined faces follow the refined ones
+        # face_parent[i] is the parent face of which face i is part
+        self.face_parent = np.repeat(self.refine_map, 4)
+        self.refined_face_mask = np.ones(nfaces, dtype=bool)
+        if len(keep_map):
+            self.fvert = np.vstack((self.fvert, vtx_rmap[parent.fvert[keep_map]].astype(np.uint32)))
+            self.fuvs = np.vstack((self.fuvs, uv_rmap[parent.fuvs[keep_map]].astype(np.uint32)))
+            self.group = np.hstack((self.group, parent.group[keep_map].astype(np.uint16)))
+            self.face_mask = np.hstack((self.face_mask, parent.face_mask[keep_map]))
+            self.face_parent = np.hstack((self.face_parent, keep_map))
+            self.refined_face_mask = np.hstack((self.refined_face_mask, np.zeros(len(keep_map), dtype=bool)))
+            nfaces += len(keep_map)
+        if isinstance(parent, SubdivisionObject):
+            self.face_root = parent.face_root[self.face_parent]
+        else:
+            self.face_root = self.face_parent
+
         self.fnorm = np.zeros((nfaces,3))
 
         progress.step()
@@ -310,7 +370,7 @@ class SubdivisionObject(Object3D):
         # Map base verts onto themselves
         self._parent_map[:self.cbase, 0] = self.vtx_map[:]
         # Face-center verts are mapped to the 4 base verts connected to the face
-        self._parent_map[self.cbase:self.ebase, :4] = self.vtx_map[parent.fvert[self.face_map]]
+        self._parent_map[self.cbase:self.ebase, :4] = self.vtx_map[parent.fvert[self.refine_map]]
         # Edge-center verts are mapped to the 2 base verts that are endpoints of the edge
         self._parent_map[self.ebase:, :2] = self.evert[:,0,:]
 
@@ -349,32 +409,246 @@ class SubdivisionObject(Object3D):
 
         progress.step()
 
-    @property
-    def parent_map_weights(self):
-        # TODO populate in deferred form, make this a getter (and retrieve recursively)
-        return self._parent_map_weights
+        self._saveTopology(key)
 
-    def update_uvs(self):
+    def _topologyKey(self):
+        """
+        Key identifying the topology of this subdivision: the topology of the
+        parent mesh, the static face mask and the refined region. Used for
+        the refinement operators in memory and the topology cache on disk.
+        """
         parent = self.parent
+        digest = hashlib.sha1()
+        digest.update(str( (TOPOLOGY_CACHE_VERSION, self.MAX_FACES,
+                            len(parent.coord), len(parent.texco)) ))
+        digest.update(np.ascontiguousarray(parent.fvert, dtype=np.uint32).tostring())
+        digest.update(np.ascontiguousarray(parent.fuvs, dtype=np.uint32).tostring())
+        digest.update(np.ascontiguousarray(self.staticFaceMask, dtype=bool).tostring())
+        digest.update(np.ascontiguousarray(self.refineFaceMask, dtype=bool).tostring())
+        if isinstance(parent, SubdivisionObject):
+            # Verts kept in place by the previous levels
+            digest.update(np.ascontiguousarray(parent.pinned_verts, dtype=bool).tostring())
+        return digest.hexdigest()
+
+    def _setOperators(self, key, operators):
+        """
+        Use the (coordinate, UV) refinement operators for this level, and
+        keep them in memory for other subdivisions of the same topology.
+        """
+        _operatorCache.pop(key, None)
+        _operatorCache[key] = operators
+        while len(_operatorCache) > MAX_CACHED_OPERATORS:
+            _operatorCache.popitem(last=False)
+        self._coordOperator, self._uvOperator = operators
+        self._vertexMapping = None
+        # Further levels are refined from the unsubdivided mesh by applying
+        # the operators of all levels in turn
+        if isinstance(self.parent, SubdivisionObject):
+            self._coordOperators = self.parent._coordOperators + [self._coordOperator]
+            self._uvOperators = self.parent._uvOperators + [self._uvOperator]
+        else:
+            self._coordOperators = [self._coordOperator]
+            self._uvOperators = [self._uvOperator]
 
-        btexc = self.texco[:self.tcbase]
-        ctexc = self.texco[self.tcbase:self.tebase]
-        etexc = self.texco[self.tebase:]
+    def _saveTopology(self, key):
+        """
+        Store the topology derived by create() in the topology cache, so that
+        subdividing the same mesh again only has to map it from disk.
+        """
+        cachedir = getTopologyCachePath()
+        path = os.path.join(cachedir, key + '.mhsub')
+        header = dict((name, int(getattr(self, name))) for name in _TOPOLOGY_SCALARS)
+        header['version'] = TOPOLOGY_CACHE_VERSION
+        arrays = [(name, getattr(self, name)) for name in _TOPOLOGY_ARRAYS]
+        for prefix, operator in [('coord', self._coordOperator), ('uv', self._uvOperator)]:
+            header[prefix + '_shape'] = [int(n) for n in operator.shape]
+            arrays.extend([(prefix + '_rows', operator.rows),
+                           (prefix + '_cols', operator.cols),
+                           (prefix + '_weights', operator.weights)])
+        # Write to a temporary file first, so other processes (eg. batch mode
+        # workers) never map an incomplete file
+        tmppath = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            if not os.path.isdir(cachedir):
+                os.makedirs(cachedir)
+            files3d.saveMappedArrays(tmppath, TOPOLOGY_CACHE_MAGIC, header, arrays)
+            if os.path.isfile(path):
+                os.remove(path)
+            os.rename(tmppath, path)
+        except Exception:
+            log.notice('unable to save subdivision topology cache: %s', path, exc_info=True)
+            if os.path.isfile(tmppath):
+                os.remove(tmppath)
+            return
+        _pruneTopologyCache(cachedir)
+
+    def _loadTopology(self, key):
+        """
+        Set up this subdivision from the topology cache, if it holds the
+        topology identified by key. Returns False if it does not, in which
+        case the topology has to be derived.
+        """
+        path = os.path.join(getTopologyCachePath(), key + '.mhsub')
+        if not os.path.isfile(path):
+            return False
+        try:
+            header, arrays = files3d.loadMappedArrays(path, TOPOLOGY_CACHE_MAGIC)
+            if header.get('version') != TOPOLOGY_CACHE_VERSION:
+                raise RuntimeError('subdivision topology cache out of date: %s' % path)
+            operators = _operatorCache.get(key)
+            if operators is None:
+                operators = tuple(SparseOperator(tuple(header[prefix + '_shape']),
+                                                 arrays[prefix + '_rows'],
+                                                 arrays[prefix + '_cols'],
+                                                 arrays[prefix + '_weights'])
+                                  for prefix in ['coord', 'uv'])
+            topology = dict((name, arrays[name]) for name in _TOPOLOGY_ARRAYS)
+            scalars = dict((name, header[name]) for name in _TOPOLOGY_SCALARS)
+        except Exception:
+            log.notice('unable to load subdivision topology cache: %s', path, exc_info=True)
+            return False
+
+        progress = Progress(4, None, logging=True, timing=True)
+        progress.firststep()
+
+        parent = self.parent
+        for g in parent._faceGroups:
+            self.createFaceGroup(g.name)
+        for name, value in topology.items() + scalars.items():
+            setattr(self, name, value)
+        self._setOperators(key, operators)
+
+        self.group = parent.group[self.face_parent].astype(np.uint16)
+        self.face_mask = parent.face_mask[self.face_parent]
+        if isinstance(parent, SubdivisionObject):
+            self.face_root = parent.face_root[self.face_parent]
+        else:
+            self.face_root = self.face_parent
+
+        progress.step()
+
+        nverts = len(self.vface)
+        self.coord = np.zeros((nverts, 3), dtype=np.float32)
+        self.vnorm = np.zeros((nverts, 3), dtype=np.float32)
+        self.vtang = np.zeros((nverts, 4), dtype=np.float32)
+        self.color = np.zeros((nverts, 4), dtype=np.uint8) + 255
+        self.texco = np.zeros((self._uvOperator.shape[0], 2), dtype=np.float32)
+        self.fnorm = np.zeros((len(self.fvert), 3))
+
+        self.ucoor = False
+        self.unorm = False
+        self.utang = False
+        self.ucolr = False
+        self.utexc = False
+
+        self.setIndexBufferVerts(self.vmap, self.tmap, self.r_faces)
+        self.updateIndexBufferFaces()
 
-        ctexc[...] = np.sum(parent.texco[parent.fuvs[self.face_map]], axis=1) / 4
+        progress.step()
 
-        iva = self.etexc[:,0]
-        ivb = self.etexc[:,1]
+        self.update_uvs()
+        self.update_coords()
+        self.calcNormals()
 
-        ptexco = parent.texco[self.uv_map]
+        progress.step()
 
-        ta = ptexco[iva]
-        tb = ptexco[ivb]
-        etexc[...] = (ta + tb) / 2
-        del iva, ivb, ta, tb
+        self.sync_all()
+        os.utime(path, None)    # Mark as recently used
 
-        # TODO these UVs should be averaged in the same way as bvert in update_coords
-        btexc[...] = ptexco
+        progress.step()
+        return True
+
+    def _buildCoordOperator(self):
+        """
+        Build the sparse operator that maps the parent coordinates to the
+        coordinates of the subdivided mesh.
+        """
+        parent = self.parent
+        nbase = self.cbase
+        entries = _SparseEntries()
+
+        pfvert = parent.fvert[self.face_map]    # Parent verts of each face
+        prvert = parent.fvert[self.refine_map]  # Parent verts of each refined face
+        evert = self.evert[:,0,:]               # Base verts at the ends of each edge
+        efaces = self.evert[:,1,:]              # Faces on both sides of each edge
+        eends = self.vtx_map[evert]             # Parent verts at the ends of each edge
+        inedge = (efaces[:,0] == efaces[:,1])   # Edges bordering only one face
+
+        # Face center verts: average of the face verts
+        entries.add(self.cbase + np.arange(len(prvert))[:,None], prvert, 1.0/4)
+
+        # Edge verts: average of the edge ends when at edge, else average of
+        # the edge ends and the centers of both faces
+        erows = self.ebase + np.arange(len(evert))
+        entries.add(erows[:,None], eends, np.where(inedge, 1.0/2, 1.0/4)[:,None])
+        inner = np.flatnonzero(~inedge)
+        for side in [0, 1]:
+            entries.add(erows[inner,None], prvert[efaces[inner,side]], 1.0/16)
+
+        # Base verts: weighted average of the original vert, the midpoints of
+        # its edges and the centers of its faces, pinned verts stay in place
+        nedges = np.bincount(evert.ravel(), minlength=nbase).astype(np.float64)
+        nvedge = np.bincount(evert[inedge].ravel(), minlength=nbase).astype(np.float64)
+        nvface = parent.nfaces[self.vtx_map].astype(np.float64)
+        pinned = self._base_pinned
+        valid = (nvface >= 3) & ~pinned
+        regular = valid & (nedges == nvface)
+        boundary = valid & ~regular
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Weight per end of each edge, of each edge at the edge of the mesh,
+            # per vert of each face, and of the original vert
+            edgewt = np.where(regular, 1 / (nedges * nvface), np.where(boundary | pinned, 0, 3 / (4 * nedges)))
+            inedgewt = np.where(boundary, 1 / (2 * (nvedge + 1)), 0)
+            facewt = np.where(regular, 1 / (4 * nvface ** 2), np.where(boundary | pinned, 0, -1 / (8 * nvface)))
+            vertwt = np.where(regular, (nvface - 3) / nvface, np.where(boundary, 1 / (nvedge + 1), np.where(pinned, 1, 0)))
+
+        for side in [0, 1]:
+            v = evert[:,side]
+            entries.add(v[:,None], eends, (edgewt[v] + inedgewt[v] * inedge)[:,None])
+
+        vface = parent.vface[self.vtx_map]
+        vrows, vslots = np.nonzero(np.arange(vface.shape[1])[None,:] < nvface[:,None])
+        # Faces outside of the static face mask map to -1, like face_rmap
+        # indexing of the face center verts does
+        faces = self.face_rmap[vface[vrows, vslots]]
+        entries.add(vrows[:,None], pfvert[faces], facewt[vrows][:,None])
+
+        entries.add(np.arange(nbase), self.vtx_map, vertwt)
+
+        return entries.compile((self.ebase + len(self.evert), len(parent.coord)))
+
+    def _buildUVOperator(self):
+        """
+        Build the sparse operator that maps the parent UVs to the UVs of the
+        subdivided mesh.
+        """
+        parent = self.parent
+        entries = _SparseEntries()
+
+        # Base UVs are copied
+        entries.add(np.arange(self.tcbase), self.uv_map, 1.0)
+        # Face center UVs: average of the face UVs
+        pfuvs = parent.fuvs[self.refine_map]
+        entries.add(self.tcbase + np.arange(len(pfuvs))[:,None], pfuvs, 1.0/4)
+        # Edge UVs: average of the edge ends
+        eends = self.uv_map[self.etexc]
+        entries.add(self.tebase + np.arange(len(eends))[:,None], eends, 1.0/2)
+
+        return entries.compile((self.tebase + len(self.etexc), len(parent.texco)))
+
+    @property
+    def parent_map_weights(self):
+        # TODO populate in deferred form, make this a getter (and retrieve recursively)
+        return self._parent_map_weights
+
+    def update_uvs(self):
+        parent = self.parent
+
+        # TODO base UVs should be averaged in the same way as base verts in update_coords
+        texco = self.root.texco
+        for operator in self._uvOperators:
+            texco = operator.dot(texco)
+        self.texco[...] = texco
 
         self.markUVs()
 
@@ -393,61 +667,63 @@ class SubdivisionObject(Object3D):
         with vi base verts at interpolated positions (bvert)
         with c newly introduced center verts in the center of each face (cvert)
         with ei newly introduced verts at the centers of the poly edges (evert)
-        """
-        parent = self.parent
-
-        bvert = self.coord[:self.cbase]            # Base verts
-        cvert = self.coord[self.cbase:self.ebase]  # Poly center verts
-        evert = self.coord[self.ebase:]            # Edge verts
-
-        cvert[...] = np.sum(parent.coord[parent.fvert[self.face_map]], axis=1) / 4
-
-        pcoord = parent.coord[self.vtx_map]
-
-        iva = self.evert[:,0,0]  # References to base verts
-        ivb = self.evert[:,0,1]
-        ic1 = self.evert[:,1,0]  # References to center verts
-        ic2 = self.evert[:,1,1]
-
-        va = pcoord[iva]
-        vb = pcoord[ivb]
-        mvert = va + vb
-        del iva, ivb, va, vb
-
-        vc1 = cvert[ic1]
-        vc2 = cvert[ic2]
-        vc = vc1 + vc2
-        del vc1, vc2
-
-        inedge = (ic1 == ic2)
-
-        # Calculate edge vert coordinates: average two e verts when at edge, else average over 4
-        evert[...] = np.where(inedge[:,None], mvert / 2, (mvert + vc) / 4)
-        del ic1, ic2, vc
-
-        nvface = parent.nfaces[self.vtx_map]
 
-        # comment: this code could really do with some comments
-        edgewt = np.arange(self.MAX_FACES)[None,:,None] < self.nedges[:,None,None]
-        edgewt2 = edgewt * inedge[self.vedge][:,:,None]
-        edgewt = edgewt / self.nedges.astype(np.float32)[:,None,None]
-        nvedge = np.sum(edgewt2, axis=1)
-        oevert = np.sum(mvert[self.vedge] * edgewt / 2, axis=1)
-        oevert2 = np.sum(mvert[self.vedge] * edgewt2 / 2, axis=1)
-        facewt = np.arange(self.MAX_FACES)[None,:,None] < nvface[:,None,None]
-        facewt = facewt / nvface.astype(np.float32)[:,None,None]
-        ofvert = np.sum(cvert[self.face_rmap[parent.vface[self.vtx_map]]] * facewt, axis=1)
-        opvert = pcoord
-
-        valid = nvface >= 3
+        All of them are calculated in one sparse matrix product with the
+        parent coordinates (see _buildCoordOperator). When subdividing more
+        than one level, the operators of all levels are applied in turn to the
+        coordinates of the unsubdivided mesh, the intermediate levels are not
+        updated.
+        """
+        coord = self.refineCoords(self.root.coord)
+        # Mark only the moved vertices, so that only the normals around them
+        # are recalculated (see calcNormals)
+        moved = (self.coord != coord)
+        moved = np.flatnonzero(moved[:,0] | moved[:,1] | moved[:,2])
+        if len(moved) == len(coord):
+            self.changeCoords(coord)
+        else:
+            self.changeCoords(coord[moved], moved)
 
-        bvert[...] = np.where(valid[:,None],
-                              np.where((self.nedges == nvface)[:,None],
-                                       (ofvert + 2 * oevert + (nvface[:,None] - 3) * opvert) / nvface[:,None],
-                                       (oevert2 + opvert) / (nvedge + 1)),
-                              (3 * oevert - ofvert) / 2)
+    def refineCoords(self, coord):
+        """
+        Calculate the coordinates of this mesh for the specified coordinates
+        of the unsubdivided mesh (self.root), eg. its rest pose coordinates.
+        """
+        for operator in self._coordOperators:
+            coord = operator.dot(coord)
+        return coord
 
-        self.markCoords(coor=True)
+    def getVertexMapping(self):
+        """
+        The sparse matrix mapping the vertices of the unsubdivided mesh
+        (self.root) to the vertices of this mesh, the refinement operators of
+        all levels combined. Returns (rows, cols, weights) coordinate format,
+        with rows vertex indices of this mesh.
+        """
+        if self._vertexMapping is None:
+            operator = self._coordOperators[0]
+            for other in self._coordOperators[1:]:
+                operator = other.compose(operator)
+            self._vertexMapping = (operator.rows, operator.cols, operator.weights)
+        return self._vertexMapping
+
+    def getTransferredVertexWeights(self, parentWeights):
+        """
+        Map armature weights of the unsubdivided mesh (self.root) to this
+        mesh, by transferring them through the subdivision (see
+        getVertexMapping). The result can be compiled to skin this mesh
+        directly, this is only used when subdivided meshes are skinned
+        (AnimatedMesh.skinSubdivided). Exporters use getVertexWeights().
+        If this is a subdivided proxy mesh, parentWeights should be the
+        weights mapped through the proxy.getVertexWeights() method first.
+
+        Where the refinement operator has negative coefficients, transferred
+        weights would become negative. These (and negligible weights) are
+        dropped and the remaining weights of the vertex are normalized, so
+        there the skinned mesh slightly deviates from subdividing the skinned
+        mesh.
+        """
+        return parentWeights.transferred(self.getVertexMapping(), self.getVertexCount())
 
     def update(self):
         self.update_coords()
@@ -457,20 +733,18 @@ class SubdivisionObject(Object3D):
         """
         Change face mask of subdivided mesh.
         If remapFromUnsubdivided is True (default), the mask parameter is
-        expected to be a face mask for the original mesh (self.parent).
-        In this case a remapping to the subdivided faces will occur (indices 
+        expected to be a face mask for the original mesh (self.root, which is
+        self.parent for one level of subdivision).
+        In this case a remapping to the subdivided faces will occur (indices
         parameter is ignored).
 
         If remapFromUnsubdivided is False, a facemask can be applied directly
         on the subdivided mesh faces.
         """
         if remapFromUnsubdivided:
-            nBaseFaces = len(self.face_map)
-
-            # Duplicate the facemask to 4 faces per seedmesh face
-            subdiv_face_mask = np.zeros((nBaseFaces, 4), dtype=bool)
-            subdiv_face_mask[:] = mask[self.face_map][:,None]
-            subdiv_face_mask = subdiv_face_mask.reshape(4*nBaseFaces)
+            # Apply the mask of each seedmesh face to all faces it was
+            # subdivided into
+            subdiv_face_mask = np.asarray(mask, dtype=bool)[self.face_root]
 
             super(SubdivisionObject, self).changeFaceMask(subdiv_face_mask)
         else:
@@ -480,21 +754,166 @@ class SubdivisionObject(Object3D):
     def staticFaceMask(self):
         return self._staticFaceMask
 
+    @property
+    def refineFaceMask(self):
+        return self._refineFaceMask
+
     def clone(self, scale=1.0, filterMaskedVerts=False):
+        # The first level holds the masks set on the seed mesh
+        first = self
+        while isinstance(first.parent, SubdivisionObject):
+            first = first.parent
         # First clone the seed mesh
-        otherSeed = self.parent.clone(scale, filterMaskedVerts)
+        otherSeed = self.root.clone(scale, filterMaskedVerts)
         # Then generate a subdivision for it
+        refineFaceMask = first.refineFaceMask
         if filterMaskedVerts:
             # All masked vertices, static and dynamic are filtered out from parent
             staticFaceMask = None
+            refineFaceMask = refineFaceMask[self.root.face_mask]
         else:
-            staticFaceMask = self.staticFaceMask
-        return createSubdivisionObject(otherSeed, staticFaceMask)
+            staticFaceMask = first.staticFaceMask
+        return createSubdivisionObject(otherSeed, staticFaceMask, self.level, refineFaceMask)
+
+
+class _SparseEntries(object):
+    """
+    Collects the entries of a sparse matrix in coordinate format.
+    """
 
+    def __init__(self):
+        self.rows = []
+        self.cols = []
+        self.weights = []
+
+    def add(self, rows, cols, weights):
+        """
+        Add entries, rows, cols and weights are broadcast against each other.
+        """
+        rows, cols, weights = np.broadcast_arrays(rows, cols, weights)
+        self.rows.append(rows.ravel())
+        self.cols.append(cols.ravel())
+        self.weights.append(weights.ravel())
+
+    def compile(self, shape):
+        """
+        Sum the weights of duplicate entries, and return the matrix as a
+        SparseOperator.
+        """
+        rows = np.concatenate(self.rows).astype(np.int64)
+        cols = np.concatenate(self.cols).astype(np.int64)
+        weights = np.concatenate(self.weights).astype(np.float64)
+        keys = rows * shape[1] + cols
+        order = np.argsort(keys)
+        keys = keys[order]
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = (keys[1:] != keys[:-1])
+        weights = np.bincount(np.cumsum(first) - 1, weights[order])
+        keys = keys[first]
+        nonzero = (weights != 0)
+        keys = keys[nonzero]
+        return SparseOperator(shape, keys // shape[1], keys % shape[1], weights[nonzero])
+
+
+class SparseOperator(object):
+    """
+    Sparse matrix in coordinate format, with its entries sorted by row. Maps
+    per-vertex data of a mesh (coordinates, UVs) to per-vertex data of another.
+    """
+
+    def __init__(self, shape, rows, cols, weights):
+        self.shape = shape
+        self.rows = np.asarray(rows, dtype=np.uint32)
+        self.cols = np.asarray(cols, dtype=np.uint32)
+        self.weights = np.asarray(weights, dtype=np.float64)
+
+    @property
+    def nbytes(self):
+        return self.rows.nbytes + self.cols.nbytes + self.weights.nbytes
+
+    def compose(self, other):
+        """
+        Multiply this matrix with other, a SparseOperator. Returns the
+        operator that maps by other first, and then by this one.
+        """
+        # The entries of other are sorted by row, expand every entry of this
+        # matrix to the entries of the row of other its column refers to
+        counts = np.bincount(other.rows, minlength=other.shape[0])
+        starts = np.cumsum(counts) - counts
+        n = counts[self.cols]
+        idxs = np.repeat(starts[self.cols] - (np.cumsum(n) - n), n) + np.arange(np.sum(n))
+
+        entries = _SparseEntries()
+        entries.add(np.repeat(self.rows, n), other.cols[idxs],
+                    np.repeat(self.weights, n) * other.weights[idxs])
+        return entries.compile((self.shape[0], other.shape[1]))
+
+    def dot(self, values):
+        """
+        Multiply this matrix with values, a (shape[1], n) array.
+        Returns a (shape[0], n) float32 array.
+        """
+        values = values[self.cols]
+        result = np.empty((self.shape[0], values.shape[1]), dtype=np.float32)
+        for i in xrange(values.shape[1]):
+            result[:,i] = np.bincount(self.rows, self.weights * values[:,i], minlength=self.shape[0])
+        return result
+
+# Refinement operators by topology, shared between subdivisions of the same
+# mesh (eg. toggling smoothing, clones)
+MAX_CACHED_OPERATORS = 8
+_operatorCache = OrderedDict()
+
+# Derived topology stored in the topology cache
+TOPOLOGY_CACHE_MAGIC = 'MHSUBD\x00\x01'
+TOPOLOGY_CACHE_VERSION = 1
+# Disk space budget of the topology cache in bytes (None for no limit)
+MAX_TOPOLOGY_CACHE_BYTES = 256 * 1024 * 1024
+_TOPOLOGY_SCALARS = ['cbase', 'ebase', 'tcbase', 'tebase']
+_TOPOLOGY_ARRAYS = ['face_map', 'face_rmap', 'refine_map', 'vtx_map',
+                    'vtx_rmap', 'uv_map', '_base_pinned', 'pinned_verts',
+                    'evert', 'etexc', 'fvert', 'fuvs', 'face_parent',
+                    'refined_face_mask', 'vface', 'nfaces', 'vmap', 'tmap',
+                    'r_faces', '_parent_map', '_parent_map_weights',
+                    '_inverse_parent_map']
+
+def getTopologyCachePath():
+    return getpath.getPath(os.path.join('cache', 'subdivision'))
+
+def setTopologyCacheSize(maxBytes):
+    """
+    Set the disk space budget, in bytes, of the topology cache. None means no
+    limit.
+    """
+    global MAX_TOPOLOGY_CACHE_BYTES
+    MAX_TOPOLOGY_CACHE_BYTES = maxBytes
+    _pruneTopologyCache(getTopologyCachePath())
+
+def _pruneTopologyCache(cachedir):
+    """
+    Remove the least recently used files from the topology cache until their
+    total size is within MAX_TOPOLOGY_CACHE_BYTES.
+    """
+    if MAX_TOPOLOGY_CACHE_BYTES is None:
+        return
+    try:
+        files = [(os.path.getmtime(path), os.path.getsize(path), path)
+                 for path in glob.glob(os.path.join(cachedir, '*.mhsub'))]
+        files.sort()
+        nbytes = sum(size for (_, size, _) in files)
+        for (_, size, path) in files:
+            if nbytes <= MAX_TOPOLOGY_CACHE_BYTES:
+                break
+            os.remove(path)
+            nbytes -= size
+    except Exception:
+        log.notice('unable to clean up subdivision topology cache: %s', cachedir, exc_info=True)
 
 def _reverse_n_to_m_map(input, output, offset=0):
     # Using same algorithm as module3d._update_faces to construct inverse 
     # mapping with variable number of valid columns
+    if input.size == 0:
+        return
     map_ = np.argsort(input.flat)
     vi = input.flat[map_]
     fi = np.mgrid[:input.shape[0],:input.shape[1]][0].flat[map_].astype(np.uint32)
@@ -507,9 +926,21 @@ def _reverse_n_to_m_map(input, output, offset=0):
         output[ix[i], :n[i]] = offset + fi[first[i]:][:n[i]]
 
 
-def createSubdivisionObject(object, staticFaceMask=None):
-    obj = SubdivisionObject(object, staticFaceMask)
+def createSubdivisionObject(object, staticFaceMask=None, levels=1, refineFaceMask=None):
+    """
+    Subdivide object levels times. If refineFaceMask is specified (a face mask
+    valid on object, eg. from getFaceMaskForGroups()), only those faces are
+    refined on every level, the other faces are included unaltered.
+    Returns the subdivision object of the last level.
+    """
+    obj = SubdivisionObject(object, staticFaceMask, refineFaceMask)
     obj.create()
+    for level in xrange(1, levels):
+        if refineFaceMask is None:
+            obj = SubdivisionObject(obj)
+        else:
+            obj = SubdivisionObject(obj, None, obj.refined_face_mask)
+        obj.create()
     return obj
 
 def updateSubdivisionObject(object):
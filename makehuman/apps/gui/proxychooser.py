@@ -47,6 +47,7 @@ import filechooser as fc
 import log
 import getpath
 import filecache
+import libraryhandlers
 
 
 class ProxyAction(gui3d.Action):
@@ -87,7 +88,7 @@ class MultiProxyAction(gui3d.Action):
         return True
 
 
-class ProxyChooserTaskView(gui3d.TaskView, filecache.MetadataCacher):
+class ProxyChooserTaskView(gui3d.TaskView, filecache.MetadataCacher, libraryhandlers.ProxyLibraryHandlers):
     """
     Common base class for all proxy chooser libraries.
     """
@@ -447,9 +448,9 @@ class ProxyChooserTaskView(gui3d.TaskView, filecache.MetadataCacher):
         #self.filechooser.deselectAll()
         self.deselectAllProxies()
 
-    def adaptProxyToHuman(self, pxy, obj, updateSubdivided=True, fit_to_posed=False, fast=False):
+    def adaptProxyToHuman(self, pxy, obj, updateSubdivided=True, fit_to_posed=False, fast=False, coords=None):
         mesh = obj.getSeedMesh()
-        pxy.update(mesh, fit_to_posed, fast)
+        pxy.update(mesh, fit_to_posed, fast, coords)
         mesh.update()
         # Update subdivided mesh if smoothing is enabled
         if updateSubdivided and obj.isSubdivided():
@@ -500,17 +501,18 @@ class ProxyChooserTaskView(gui3d.TaskView, filecache.MetadataCacher):
 
             self.showObjects() # Make sure objects are shown again after onHumanChanging events
             #log.debug("Human changed, adapting all proxies (event: %s)", event)
-            self.adaptAllProxies()
+            self.adaptAllProxies(event=event)
         if event.change in ['poseRefresh']:
-            # Update subdivided proxies after posing
+            # Update subdivided proxies after posing, unless they were
+            # skinned directly
             for obj in self.getObjects():
-                if obj.isSubdivided():
+                if obj.isSubdivided() and not self.human.isSubdivisionSkinned(obj.mesh):
                     obj.getSubdivisionMesh()
 
     def onHumanChanging(self, event):
         if event.change == 'modifier':
             if gui3d.app.getSetting('realtimeFitting'):
-                self.adaptAllProxies(updateSubdivided=False, fit_to_posed=True, fast=True)
+                self.adaptAllProxies(updateSubdivided=False, fit_to_posed=True, fast=True, event=event)
                 for obj in self.getObjects():
                     if obj.isSubdivided():
                         obj.getSeedMesh().setVisibility(1)
@@ -518,41 +520,23 @@ class ProxyChooserTaskView(gui3d.TaskView, filecache.MetadataCacher):
             else:
                 self.hideObjects()
 
-    def adaptAllProxies(self, updateSubdivided=True, fit_to_posed=False, fast=False):
-        proxyCount = len(self.getSelection())
+    def adaptAllProxies(self, updateSubdivided=True, fit_to_posed=False, fast=False, event=None):
+        """
+        Fit all selected proxies to the human in one pass. When called in
+        response to a human event, the fitting is shared with all other
+        libraries responding to the same event.
+        """
+        proxies = self.getSelection()
+        proxyCount = len(proxies)
         if proxyCount > 0:
             pass  #log.message("Adapting all %s proxies (%s).", self.proxyName, proxyCount)
-        for pIdx, pxy in enumerate(self.getSelection()):
-            obj = self.getObjects()[pIdx]
-            self.adaptProxyToHuman(pxy, obj, updateSubdivided, fit_to_posed, fast)
-
-    def loadHandler(self, human, values, strict):
-        if values[0] == 'status':
+        else:
             return
-
-        if self._filecache is None:
-            # Init cache
-            self.loadCache()
-            self.updateFileCache(self.getSearchPaths(), self.getFileExtensions(), True)
-
-        if values[0] == self.getSaveName():
-            if len(values) >= 3:
-                name = values[1]
-                uuid = values[2]
-                proxyFile = self.findProxyByUuid(uuid)
-                if not proxyFile:
-                    if strict:
-                        raise RuntimeError("%s library could not load %s proxy with UUID %s, file not found." % (self.proxyName, name, uuid))
-                    log.warning("%s library could not load %s proxy with UUID %s, file not found.", self.proxyName, name, uuid)
-                    return
-                self.selectProxy(proxyFile)
-            else:
-                filename = values[1]
-                log.error("Not loading %s %s. Loading proxies from filename is no longer supported, they need to be referenced by UUID.", self.proxyName, filename)
-
-    def saveHandler(self, human, file):
-        for pxy in self.getSelection():
-            file.write('%s %s %s\n' % (self.getSaveName(), pxy.name, pxy.getUuid()))
+        objects = self.getObjects()
+        coords = proxy.fitProxies(self.human, proxies, fit_to_posed, fast, event)
+        for pIdx, pxy in enumerate(proxies):
+            obj = objects[pIdx]
+            self.adaptProxyToHuman(pxy, obj, updateSubdivided, fit_to_posed, fast, coords[pIdx])
 
     def findProxyMetadataByFilename(self, path):
         """
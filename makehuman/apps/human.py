@@ -36,6 +36,8 @@ Abstract
 TODO
 """
 
+import sys
+
 import numpy as np
 import algos3d
 import guicommon
@@ -72,6 +74,8 @@ class Human(guicommon.Object, animation.AnimatedMesh):
         self._resetProxies()
 
         self.targetsDetailStack = {}  # All details targets applied, with their values
+        algos3d.pinTargets(self.targetsDetailStack)
+        self._detailChanges = None    # Values of changed details before the change, while tracking changes
         self.symmetryModeEnabled = False
 
         self.setDefaultValues()
@@ -853,6 +857,8 @@ class Human(guicommon.Object, animation.AnimatedMesh):
 
     def setDetail(self, name, value):
         name = canonicalPath(name)
+        if self._detailChanges is not None and name not in self._detailChanges:
+            self._detailChanges[name] = self.targetsDetailStack.get(name, 0.0)
         if value:
             self.targetsDetailStack[name] = value
         elif name in self.targetsDetailStack:
@@ -862,6 +868,36 @@ class Human(guicommon.Object, animation.AnimatedMesh):
         name = canonicalPath(name)
         return self.targetsDetailStack.get(name, 0.0)
 
+    def beginDetailChanges(self):
+        """
+        Start tracking changes to the weights of the targets in
+        targetsDetailStack, so that the changes made by a modifier and the
+        modifiers depending on it can be applied to the mesh in one batch.
+        Returns False if changes were already being tracked, in which case the
+        caller should leave applying them to whoever started tracking.
+        """
+        if self._detailChanges is not None:
+            return False
+        self._detailChanges = {}
+        return True
+
+    def endDetailChanges(self):
+        """
+        Stop tracking changes to the target weights in targetsDetailStack.
+        Returns a dict mapping the path of every target whose weight changed
+        since beginDetailChanges() to the difference in weight.
+        """
+        changes = self._detailChanges
+        self._detailChanges = None
+        if not changes:
+            return {}
+        deltas = {}
+        for path, old in changes.items():
+            delta = self.targetsDetailStack.get(path, 0.0) - old
+            if delta:
+                deltas[path] = delta
+        return deltas
+
     def updateMacroModifiers(self):
         """Update the targetsDetailStack for this human
         determined by the macromodifier target combinations."""
@@ -1094,13 +1130,9 @@ class Human(guicommon.Object, animation.AnimatedMesh):
 
         # First call progress callback (which often processes events) before resetting mesh
         # so that mesh is not drawn in its reset state
-        algos3d.resetObj(self.meshData)  # Reset mesh is in rest pose
-
-        # Apply targets to seedmesh coordinates
-        itprog = Progress(len(self.targetsDetailStack))
-        for (targetPath, morphFactor) in self.targetsDetailStack.iteritems():
-            algos3d.loadTranslationTarget(self.meshData, targetPath, morphFactor, None, 0, 0)
-            itprog.step()
+        # Reset mesh is in rest pose, and apply targets to seedmesh coordinates
+        # (all targets are combined in one pass)
+        algos3d.resetObj(self.meshData, targets=self.targetsDetailStack)
 
         progress(0.5, 1.0)
         self.fullUpdate(update)
@@ -1153,12 +1185,14 @@ class Human(guicommon.Object, animation.AnimatedMesh):
         # (We do this after onChanged event so that proxies are already updated)
         self.refreshStaticMeshes()  # TODO document: an external plugin that modifies the rest pose verts outside of an onHumanChang(ing/ed) event should explicitly call this method (refreshStaticMeshes) on the human.
 
-        # Update subdivision mesh
+        # Update subdivision mesh, unless it was skinned directly when
+        # restoring the pose
         if self.isSubdivided():
             progress(0.5)
-            self.updateSubdivisionMesh()
-            progress(0.7)
-            self.mesh.calcNormals()
+            if not self.isSubdivisionSkinned(self.mesh):
+                self.updateSubdivisionMesh()
+                progress(0.7)
+                self.mesh.calcNormals()
             progress(0.8)
             if update:
                 self.mesh.update()
@@ -1262,6 +1296,8 @@ class Human(guicommon.Object, animation.AnimatedMesh):
         self.resetToRestPose(update=False)
 
         self.targetsDetailStack = {}
+        algos3d.pinTargets(self.targetsDetailStack)
+        self._detailChanges = None
 
         self.setMaterial(self._defaultMaterial)
 
@@ -1402,14 +1438,14 @@ class Human(guicommon.Object, animation.AnimatedMesh):
         super(Human, self).setActiveAnimation(anim_name)
         self.callEvent('onChanged', event)
 
-    def refreshPose(self, updateIfInRest=False):
+    def refreshPose(self, updateIfInRest=False, syncSkeleton=True):
         # TODO investigate why at startup this is called so often
         event = events3d.HumanEvent(self, 'poseRefresh')
         self.callEvent('onChanging', event)
         if self.skeleton:
             self.skeleton.dirty = True
-        super(Human, self).refreshPose(updateIfInRest)
-        if self.isSubdivided():
+        super(Human, self).refreshPose(updateIfInRest, syncSkeleton)
+        if self.isSubdivided() and not self.isSubdivisionSkinned(self.mesh):
             self.updateSubdivisionMesh()
             self.mesh.calcNormals()
             self.mesh.update()
@@ -1418,6 +1454,19 @@ class Human(guicommon.Object, animation.AnimatedMesh):
     def load(self, filename, update=True, strict=False):
         from codecs import open
 
+        log.message("Loading human from MHM file %s.", filename)
+        f = open(filename, 'rU', encoding="utf-8")
+        lines = f.readlines()
+        f.close()
+
+        self.loadLines(lines, filename, update, strict)
+
+    def loadLines(self, lines, filename=None, update=True, strict=False):
+        """
+        Load the human from the property lines of an MHM file that are already
+        in memory. Used by load() and by tools that build MHM properties
+        programmatically, such as the batch generator.
+        """
         def _compare_versions(mhmVersion,pgmVersion):
             """ Return true if major+minor matches, false if they do not. Ignore patch number. """
             import re
@@ -1437,7 +1486,6 @@ class Human(guicommon.Object, animation.AnimatedMesh):
                 return None
             return None
 
-        log.message("Loading human from MHM file %s.", filename)
         progress = Progress()(0.0, 0.8)
         event = events3d.HumanEvent(self, 'load')
         event.path = filename
@@ -1448,8 +1496,6 @@ class Human(guicommon.Object, animation.AnimatedMesh):
 
         subdivide = False
 
-        f = open(filename, 'rU', encoding="utf-8")
-
         for lh in G.app.loadHandlers.values():
             try:
                 lh(self, ['status', 'started'], strict)
@@ -1460,8 +1506,6 @@ class Human(guicommon.Object, animation.AnimatedMesh):
                 else:
                     log.warning("Exception while starting MHM loading.", exc_info=True)
 
-        lines = f.readlines()
-
         def _load_property(lineData):
             try:
                 _do_load_property(lineData)
@@ -1523,7 +1567,6 @@ class Human(guicommon.Object, animation.AnimatedMesh):
                     raise e[0], e[1], e[2]
                 else:
                     log.warning("Exception while finishing MHM loading.", exc_info=True)
-        f.close()
 
         self.blockEthnicUpdates = False
         self._setEthnicVals()
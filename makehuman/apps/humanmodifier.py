@@ -46,6 +46,7 @@ import operator
 import numpy as np
 import log
 import targets
+from getpath import canonicalPath
 
 
 # Gender
@@ -165,6 +166,8 @@ class Modifier(object):
         self._symmModifier = None
         self.verts = None
         self.faces = None
+        self._targetStack = None    # Packed targets changed by updateValue
+        self._targetPaths = None
         self.eventType = 'modifier'
         self.targets = []
         self.description = ""
@@ -259,35 +262,60 @@ class Modifier(object):
         if self.verts is None and self.faces is None:
             self.buildLists()
 
-        # Update detail state
-        old_detail = [self.human.getDetail(target[0]) for target in self.targets]
-        self.setValue(value, skipDependencies = True)
-        new_detail = [self.human.getDetail(target[0]) for target in self.targets]
+        # Collect the changes to target weights caused by this modifier and
+        # its dependencies, unless an outer updateValue is already doing so
+        applyChanges = self.human.beginDetailChanges()
 
-        # Apply changes
-        for target, old, new in zip(self.targets, old_detail, new_detail):
-            if new == old:
-                continue
+        try:
+            # Update detail state
+            self.setValue(value, skipDependencies = True)
+
+            if not skipUpdate:
+                # Update dependent modifiers
+                self.propagateUpdate(realtime = True)
+        finally:
+            if applyChanges:
+                deltas = self.human.endDetailChanges()
+
+        if not applyChanges:
+            # Dependency update, changes are applied by the modifier that
+            # triggered it (avoid dependency loops and double updates to human)
+            return
+
+        # Apply changes in one batch
+        changedVerts = np.zeros(0, dtype=np.uint32)
+        if deltas:
             if self.human.isPosed():
                 # Apply target with pose transformation
                 animatedMesh = self.human
             else:
                 animatedMesh = None
-            algos3d.loadTranslationTarget(self.human.meshData, target[0], new - old, None, 0, 0, animatedMesh=animatedMesh)
+            if self._targetStack is None:
+                self._targetStack = algos3d.TargetStack(self.human.meshData)
+            verts = algos3d.loadTranslationTargets(self.human.meshData, deltas, 0, 0, animatedMesh=animatedMesh, stack=self._targetStack)
+            changedVerts = verts
 
         if skipUpdate:
-            # Used for dependency updates (avoid dependency loops and double updates to human)
             return
 
-        # Update dependent modifiers
-        self.propagateUpdate(realtime = True)
-
         # Update vertices
         if updateNormals:
-            self.human.meshData.calcNormals(1, 1, self.verts, self.faces)
+            if self._targetPaths is None:
+                self._targetPaths = set([canonicalPath(t[0]) for t in self.targets])
+            if self.verts is None or self._targetPaths.issuperset(deltas.keys()):
+                # Modifier affects the entire mesh (verts is None), or only
+                # its own targets changed
+                faces = self.faces
+                verts = self.verts
+            else:
+                # Dependent modifiers changed targets outside of this modifier
+                faces = self.human.meshData.getFacesForVertices(verts)
+            self.human.meshData.calcNormals(1, 1, verts, faces)
         self.human.meshData.update()
         event = events3d.HumanEvent(self.human, self.eventType)
         event.modifier = self.fullName
+        # Vertices moved by this change, allows listeners to update incrementally
+        event.verts = changedVerts
         self.human.callEvent('onChanging', event)
 
     def getSymmetrySide(self):
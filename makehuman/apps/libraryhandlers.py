@@ -0,0 +1,304 @@
+#!/usr/bin/python2.7
+# -*- coding: utf-8 -*-
+
+"""
+**Project Name:**      MakeHuman
+
+**Product Home Page:** http://www.makehuman.org/
+
+**Code Home Page:**    https://bitbucket.org/MakeHuman/makehuman/
+
+**Copyright(c):**      MakeHuman Team 2001-2017
+
+**Licensing:**         AGPL3
+
+    This file is part of MakeHuman (www.makehuman.org).
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as
+    published by the Free Software Foundation, either version 3 of the
+    License, or (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+Abstract
+--------
+
+MHM load and save handlers of the proxy, clothes, skeleton, pose and material
+libraries.
+
+These are mixin classes shared by the library plugins of the GUI and the
+libraries of batch mode, which differ in how they select and load assets but
+read and write the same MHM properties. Each mixin documents the attributes
+and methods that the library using it has to provide.
+"""
+
+import os
+
+import numpy as np
+
+import log
+import getpath
+import material
+
+
+# Bone used for determining the pose scaling (root bone translation scale)
+COMPARE_BONE = "upperleg02.L"
+
+
+class ProxyLibraryHandlers(object):
+    """
+    MHM handlers for a library of proxies that are referenced by UUID.
+    Requires proxyName, getSaveName(), findProxyByUuid(uuid),
+    selectProxy(mhclofile) and getSelection().
+    """
+
+    def loadHandler(self, human, values, strict):
+        if values[0] == 'status':
+            return
+
+        if values[0] == self.getSaveName():
+            if len(values) >= 3:
+                name = values[1]
+                uuid = values[2]
+                proxyFile = self.findProxyByUuid(uuid)
+                if not proxyFile:
+                    if strict:
+                        raise RuntimeError("%s library could not load %s proxy with UUID %s, file not found." % (self.proxyName, name, uuid))
+                    log.warning("%s library could not load %s proxy with UUID %s, file not found.", self.proxyName, name, uuid)
+                    return
+                self.selectProxy(proxyFile)
+            else:
+                filename = values[1]
+                log.error("Not loading %s %s. Loading proxies from filename is no longer supported, they need to be referenced by UUID.", self.proxyName, filename)
+
+    def saveHandler(self, human, file):
+        for pxy in self.getSelection():
+            file.write('%s %s %s\n' % (self.getSaveName(), pxy.name, pxy.getUuid()))
+
+
+class ClothesLibraryHandlers(ProxyLibraryHandlers):
+    """
+    MHM handlers for the clothes library, which also stores whether clothes
+    hide the faces they cover. Additionally requires a blockFaceMasking
+    attribute, isFaceHiding(), setFaceHiding(enabled) and
+    updateFaceMasks(enableFaceHiding).
+    """
+
+    def loadHandler(self, human, values, strict):
+        if values[0] == 'status':
+            if values[1] == 'started':
+                # Don't update face masks during loading (optimization)
+                self.blockFaceMasking = True
+            elif values[1] == 'finished':
+                # When loading ends, update face masks
+                self.blockFaceMasking = False
+                self.updateFaceMasks(self.isFaceHiding())
+            return
+
+        if values[0] == 'clothesHideFaces':
+            enabled = values[1].lower() in ['true', 'yes']
+            self.setFaceHiding(enabled)
+            return
+
+        super(ClothesLibraryHandlers, self).loadHandler(human, values, strict)
+
+    def saveHandler(self, human, file):
+        super(ClothesLibraryHandlers, self).saveHandler(human, file)
+        file.write('clothesHideFaces %s\n' % str(self.isFaceHiding()))
+
+
+class SkeletonLibraryHandlers(object):
+    """
+    MHM handlers for the skeleton library.
+    Requires paths, selectedRig and chooseSkeleton(filename).
+    """
+
+    def loadHandler(self, human, values, strict):
+        if values[0] == "skeleton":
+            skelFile = getpath.thoroughFindFile(values[1], self.paths)
+            if not os.path.isfile(skelFile):
+                if strict:
+                    raise RuntimeError("Could not load rig %s, file does not exist." % skelFile)
+                log.warning("Could not load rig %s, file does not exist.", skelFile)
+                return
+            if not human.getBaseSkeleton():
+                if strict:
+                    raise RuntimeError("Could not load rig %s, no reference skeleton loaded." % skelFile)
+                log.warning("Could not load rig %s, no reference skeleton loaded.", skelFile)
+                return
+            self.chooseSkeleton(skelFile)
+
+    def saveHandler(self, human, file):
+        if human.getSkeleton():
+            rigFile = getpath.getRelativePath(self.selectedRig, self.paths)
+            file.write('skeleton %s\n' % rigFile)
+
+
+class PoseLibraryHandlers(object):
+    """
+    MHM handlers for the pose library, and the auto scaling of BVH poses to
+    the human. Requires human, paths, currentPose, bvh_bone_length,
+    bvh_root_translation and loadPose(filepath).
+    """
+
+    def setAutoScaleReference(self, bvh_file, anim):
+        """
+        Remember the root translation and upper leg length of the BVH file
+        from which anim was created, for scaling the pose to the human.
+        """
+        if "root" in bvh_file.joints:
+            posedata = anim.getAtFramePos(0, noBake=True)
+            root_bone_idx = 0
+            self.bvh_root_translation = posedata[root_bone_idx, :3, 3].copy()
+        else:
+            self.bvh_root_translation = np.asarray(3*[0.0], dtype=np.float32)
+        self.bvh_bone_length = self.calculateBvhBoneLength(bvh_file)
+
+    def calculateBvhBoneLength(self, bvh_file):
+        import numpy.linalg as la
+        if COMPARE_BONE not in bvh_file.joints:
+            raise RuntimeError('Failed to auto scale BVH file %s, it does not contain a joint for "%s"' % (bvh_file.name, COMPARE_BONE))
+
+        bvh_joint = bvh_file.joints[COMPARE_BONE]
+        joint_length = la.norm(bvh_joint.children[0].position - bvh_joint.position)
+        return joint_length
+
+    def autoScaleAnim(self, anim):
+        """
+        Auto scale BVH translations by comparing upper leg length to make the
+        human stand on the ground plane, independent of body length.
+        """
+        if self.bvh_bone_length is None or self.bvh_root_translation is None:
+            # Not a BVH pose
+            return
+        bone = self.human.getBaseSkeleton().getBone(COMPARE_BONE)
+        scale_factor = float(bone.length) / self.bvh_bone_length
+        trans = scale_factor * self.bvh_root_translation
+        log.debug("Scaling animation %s with factor %s", anim.name, scale_factor)
+        # It's possible to use anim.scale() as well, but by repeated scaling we accumulate error
+        # It's easier to simply set the translation, as poses only have a translation on
+        # root joint
+
+        # Set pose root bone translation
+        root_bone_idx = 0
+        posedata = anim.getAtFramePos(0, noBake=True)
+        posedata[root_bone_idx, :3, 3] = trans
+        anim.resetBaked()
+
+    def loadHandler(self, human, values, strict):
+        if values[0] == "pose":
+            poseFile = getpath.thoroughFindFile(values[1], self.paths)
+            if not os.path.isfile(poseFile):
+                if strict:
+                    raise RuntimeError("Could not load pose %s, file does not exist." % poseFile)
+                log.warning("Could not load pose %s, file does not exist.", poseFile)
+                return
+            if not human.getBaseSkeleton():
+                if strict:
+                    raise RuntimeError("Could not load pose %s, no reference skeleton loaded." % poseFile)
+                log.warning("Could not load pose %s, no reference skeleton loaded.", poseFile)
+                return
+            self.loadPose(poseFile)
+
+    def saveHandler(self, human, file):
+        if self.currentPose:
+            poseFile = getpath.getRelativePath(self.currentPose, self.paths)
+            file.write('pose %s\n' % poseFile)
+
+
+class MaterialLibraryHandlers(object):
+    """
+    MHM handlers for the skin material and the materials of proxies.
+    Override loadMaterial() to cache or otherwise customize material loading.
+    """
+
+    def loadMaterial(self, filepath):
+        return material.fromFile(filepath)
+
+    def getRelativeMaterialPath(self, filepath, objFile = None):
+        """
+        Produce a portable path for writing to file.
+        """
+        # TODO move as helper func to material module
+        if objFile:
+            objFile = getpath.canonicalPath(objFile)
+            if os.path.isfile(objFile):
+                objFile = os.path.dirname(objFile)
+            searchPaths = [ objFile ]
+        else:
+            searchPaths = []
+
+        return getpath.getJailedPath(filepath, searchPaths)
+
+    def getMaterialPath(self, relPath, objFile = None):
+        if objFile:
+            objFile = os.path.abspath(objFile)
+            if os.path.isfile(objFile):
+                objFile = os.path.dirname(objFile)
+            searchPaths = [ objFile ]
+        else:
+            searchPaths = []
+
+        return getpath.thoroughFindFile(relPath, searchPaths)
+
+    def loadHandler(self, human, values, strict):
+        if values[0] == 'status':
+            return
+
+        if values[0] == 'skinMaterial':
+            path = values[1]
+            if not os.path.isfile(path):
+                path = getpath.thoroughFindFile(path)
+                if not os.path.isfile(path):
+                    if strict:
+                        raise RuntimeError('Could not find material %s for skinMaterial parameter.' % values[1])
+                    log.warning('Could not find material %s for skinMaterial parameter.', values[1])
+                    return
+            human.material = self.loadMaterial(path)
+        elif values[0] == 'material':
+            if len(values) == 3:
+                uuid = values[1]
+                filepath = values[2]
+                name = ""
+            else:
+                name = values[1]
+                uuid = values[2]
+                filepath = values[3]
+
+            for pxy in human.getProxies(includeHumanProxy=False):
+                if pxy.getUuid() == uuid:
+                    filepath = self.getMaterialPath(filepath, pxy.file)
+                    pxy.object.material = self.loadMaterial(filepath)
+                    return
+
+            if strict:
+                raise RuntimeError("Could not load material for proxy with uuid %s (%s)! No such proxy." % (uuid, name))
+            log.error("Could not load material for proxy with uuid %s (%s)! No such proxy.", uuid, name)
+
+    def saveHandler(self, human, file):
+        file.write('skinMaterial %s\n' % self.getRelativeMaterialPath(human.material.filename))
+        for name, pxy in human.clothesProxies.items():
+            clo = pxy.object
+            if clo:
+                proxy = human.clothesProxies[name]
+                if clo.material.filename !=  proxy.material.filename:
+                    materialPath = self.getRelativeMaterialPath(clo.material.filename, proxy.file)
+                    file.write('material %s %s %s\n' % (proxy.name, proxy.getUuid(), materialPath))
+        if human.hairProxy:
+            proxy = human.hairProxy
+            hairObj = proxy.object
+            materialPath = self.getRelativeMaterialPath(hairObj.material.filename, proxy.file)
+            file.write('material %s %s %s\n' % (proxy.name, proxy.getUuid(), materialPath))
+        if human.eyesProxy:
+            proxy = human.eyesProxy
+            eyesObj = proxy.object
+            materialPath = self.getRelativeMaterialPath(eyesObj.material.filename, proxy.file)
+            file.write('material %s %s %s\n' % (proxy.name, proxy.getUuid(), materialPath))
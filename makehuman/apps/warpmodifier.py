@@ -68,7 +68,8 @@ class WarpTarget(algos3d.Target):
         self.verts = vertIndices
         self.data = vertData
 
-        self.faces = self.human.meshData.getFacesForVertices(self.verts)
+        self._obj = self.human.meshData
+        self._faces = None
 
     def apply(self, obj, morphFactor, faceGroupToUpdateName=None, update=1, calcNorm=1, scale=[1.0,1.0,1.0]):
         super(WarpTarget, self).apply(obj, morphFactor, faceGroupToUpdateName, update, calcNorm, scale)
@@ -19,3 +19,21 @@ for /r %%i in (*) do (
       del %%i
    )
 )
+
+:: And compiled animations
+
+set filetype=.mhbvh
+
+for /r %%i in (*) do (
+   if %%~xi==%filetype% (
+      del %%i
+   )
+)
+
+set filetype=.mhpz
+
+for /r %%i in (*) do (
+   if %%~xi==%filetype% (
+      del %%i
+   )
+)
@@ -16,3 +16,7 @@ find . -type f -iname \*.mhpxy -exec rm -rf {} \;
 find . -type f -iname \*.bin -exec rm -rf {} \;
 
 
+# And compiled animations
+
+find . -type f -iname \*.mhbvh -exec rm -rf {} \;
+find . -type f -iname \*.mhpz -exec rm -rf {} \;
@@ -0,0 +1,115 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+"""
+**Project Name:**      MakeHuman
+
+**Product Home Page:** http://www.makehuman.org/
+
+**Code Home Page:**    https://bitbucket.org/MakeHuman/makehuman/
+
+**Copyright(c):**      MakeHuman Team 2001-2017
+
+**Licensing:**         AGPL3
+
+    This file is part of MakeHuman (www.makehuman.org).
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as
+    published by the Free Software Foundation, either version 3 of the
+    License, or (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+Abstract
+--------
+
+Standalone script to compile all .bvh and .mhp animation and pose files into
+binary .mhbvh and .mhpz (npz) files for faster loading.
+"""
+
+import sys
+sys.path = ["./core", "./lib", "./shared", "./apps"] + sys.path
+import os
+import fnmatch
+import bvh
+import animation
+
+def getAllFiles(rootPath, filterStrArr):
+    result = [ None ]*len(filterStrArr)
+    for root, dirnames, filenames in os.walk(rootPath):
+        for i, filterStr in enumerate(filterStrArr):
+            if not result[i]:
+                result[i] = []
+            result[i].extend(getFiles(root, filenames, filterStr))
+    return result
+
+def getFiles(root, filenames, filterStr):
+    foundFiles = []
+    for filename in fnmatch.filter(filenames, filterStr):
+        foundFiles.append(os.path.join(root, filename))
+    return foundFiles
+
+
+def compileBvh(path):
+    npzpath = os.path.splitext(path)[0] + bvh.COMPILED_BVH_EXT
+    try:
+        # Compile with translations on all joints, loading with other
+        # translation options only discards some of them
+        bvh_file = bvh.BVH()
+        bvh_file.convertFromZUp = "auto"
+        bvh_file.allowTranslation = "all"
+        bvh_file.fromFile(path)
+        bvh_file.writeToBinaryFile(npzpath)
+    except:
+        print 'Unable to save compiled BVH for file %s' % path
+        import traceback
+        traceback.print_exc(file=sys.stdout)
+        if os.path.isfile(npzpath):
+            # Remove file again, in case an empty file is left
+            try:
+                os.remove(npzpath)
+            except:
+                pass
+        return False
+
+    return True
+
+def compileMhp(path):
+    npzpath = os.path.splitext(path)[0] + animation.COMPILED_MHP_EXT
+    try:
+        boneNames, mats = animation.readMhpFile(path)
+        animation.saveBinaryMhp(boneNames, mats, npzpath)
+    except:
+        print 'Unable to save compiled MHP for file %s' % path
+        import traceback
+        traceback.print_exc(file=sys.stdout)
+        if os.path.isfile(npzpath):
+            # Remove file again, in case an empty file is left
+            try:
+                os.remove(npzpath)
+            except:
+                pass
+        return False
+
+    return True
+
+
+if __name__ == '__main__':
+    allBvhs, allMhps = getAllFiles('data', ['*.bvh', '*.mhp'])
+    for (i, path) in enumerate(allBvhs):
+        compileBvh(path)
+        print "[%.0f%% done] converted BVH %s" % (100*(float(i)/float(len(allBvhs))), path)
+    for (i, path) in enumerate(allMhps):
+        compileMhp(path)
+        print "[%.0f%% done] converted MHP %s" % (100*(float(i)/float(len(allMhps))), path)
+
+    print "All done."
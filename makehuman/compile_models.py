@@ -78,6 +78,7 @@ def compileMesh(path):
             #traceback.print_exc(file=sys.stdout)
             return False
         files3d.saveBinaryMesh(obj, npzpath)
+        files3d.saveMappedMesh(obj, os.path.splitext(path)[0] + files3d.MAPPED_MESH_EXT)
     except:
         print 'Unable to save compiled mesh for file %s' % path
         #import traceback
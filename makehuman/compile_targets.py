@@ -37,9 +37,10 @@ TODO
 """
 
 import sys
-sys.path = [".", "./core", "./lib"] + sys.path
+sys.path = [".", "./core", "./lib", "./shared"] + sys.path
 import makehuman
 import algos3d
+import files3d
 import numpy as np
 import os
 import zipfile
@@ -66,7 +67,13 @@ if __name__ == '__main__':
     obj = algos3d.Target(None, None)
     allFiles = getAllFiles('data', ['*.target', '*.png'])
     npzPath = 'data/targets.npz'
-    with zipfile.ZipFile(npzPath, mode='w', compression=zipfile.ZIP_DEFLATED) as zip:
+    mmapPath = os.path.join('data', algos3d.TARGETS_MMAP_FILE)
+    mmapIndexPath = os.path.join('data', algos3d.TARGETS_MMAP_INDEX_FILE)
+    # Face lists of the targets on the base mesh are compiled into the
+    # memory-mapped container, so they need not be determined at runtime
+    baseMesh = files3d.loadMesh('data/3dobjs/base.obj', maxFaces = 5)
+    with zipfile.ZipFile(npzPath, mode='w', compression=zipfile.ZIP_DEFLATED) as zip, \
+         algos3d.TargetsMmapWriter(mmapPath, mmapIndexPath, 'data', baseMesh) as mmapWriter:
         npzdir = os.path.dirname(npzPath)
         allTargets = allFiles[0]
 
@@ -79,6 +86,7 @@ if __name__ == '__main__':
         for (i, path) in enumerate(allTargets):
             try:
                 obj._load_text(path)
+                mmapWriter.add(path, obj)
                 iname, vname, lname = obj._save_binary(path)
                 zip.write(iname, os.path.relpath(iname, npzdir))
                 zip.write(vname, os.path.relpath(vname, npzdir))
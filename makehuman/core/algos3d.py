@@ -57,11 +57,187 @@ algorithms will be coded. For example:
 __docformat__ = 'restructuredtext'
 
 import os
+import weakref
+from collections import OrderedDict
 import numpy as np
 import log
 from getpath import getSysDataPath, canonicalPath
 
-_targetBuffer = {}
+
+class TargetCache(object):
+    """
+    Cache of loaded targets, indexed by canonical target path, bounded by the
+    memory (in bytes) used by the target data.
+    When the cache exceeds its budget the least recently used targets are
+    evicted, they are loaded again when they are needed again. Targets that
+    are pinned (see pinTargets) and targets that were added directly instead
+    of through getTarget (such as generated warp targets, which can not be
+    reloaded from file) are never evicted.
+    Target stacks packed from cached targets hold a copy of their data. A
+    stack is cleared when one of its targets leaves the cache, so that the
+    data of evicted targets is freed.
+    """
+
+    def __init__(self, maxBytes=None):
+        self.maxBytes = maxBytes    # None for no limit
+        self.nbytes = 0
+        self.pinned = ()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()   # path -> [target, nbytes, evictable], least recently used first
+        self._stacks = weakref.WeakSet()    # Non-empty target stacks
+
+    def lookup(self, path):
+        """
+        Retrieve a cached target, and mark it as most recently used. Returns
+        None if the target is not cached.
+        """
+        entry = self._entries.pop(path, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries[path] = entry
+        self.hits += 1
+        return entry[0]
+
+    def add(self, path, target, evictable=True):
+        if path in self._entries:
+            del self[path]
+        nbytes = _targetSize(target)
+        self._entries[path] = [target, nbytes, evictable]
+        self.nbytes += nbytes
+        self.evict()
+
+    def resize(self, path, target):
+        """
+        Update the memory accounted for a cached target after its data grew
+        (for example when its face list was determined).
+        """
+        entry = self._entries.get(path)
+        if entry is None or entry[0] is not target:
+            return
+        nbytes = _targetSize(target)
+        self.nbytes += nbytes - entry[1]
+        entry[1] = nbytes
+
+    def evict(self, maxBytes=None):
+        """
+        Evict least recently used targets until the memory used by the cache
+        is within maxBytes (defaults to the budget of the cache).
+        """
+        if maxBytes is None:
+            maxBytes = self.maxBytes
+        if maxBytes is None or self.nbytes <= maxBytes:
+            return
+        evicted = set()
+        for path, (target, nbytes, evictable) in self._entries.items():
+            if not evictable or path in self.pinned:
+                continue
+            del self._entries[path]
+            self.nbytes -= nbytes
+            self.evictions += 1
+            evicted.add(path)
+            if self.nbytes <= maxBytes:
+                break
+        self.dropStacks(evicted)
+
+    def addStack(self, stack):
+        """
+        Register a target stack that was packed from cached targets.
+        """
+        self._stacks.add(stack)
+
+    def dropStacks(self, paths):
+        """
+        Clear the target stacks that contain any of the targets with specified
+        paths.
+        """
+        if not paths:
+            return
+        for stack in list(self._stacks):
+            if not stack.pathSet.isdisjoint(paths):
+                stack.clear()
+                self._stacks.discard(stack)
+
+    def getStackSize(self):
+        """
+        Memory used by the data of all target stacks, in bytes.
+        """
+        return sum(stack.nbytes for stack in list(self._stacks))
+
+    def getStats(self):
+        return {'targets': len(self._entries),
+                'bytes': self.nbytes,
+                'maxBytes': self.maxBytes,
+                'stacks': len([stack for stack in list(self._stacks) if stack.paths]),
+                'stackBytes': self.getStackSize(),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions}
+
+    def resetStats(self):
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, path, default=None):
+        entry = self._entries.get(path)
+        if entry is None:
+            return default
+        return entry[0]
+
+    def __getitem__(self, path):
+        return self._entries[path][0]
+
+    def __setitem__(self, path, target):
+        self.add(path, target, evictable=False)
+
+    def __delitem__(self, path):
+        entry = self._entries.pop(path)
+        self.nbytes -= entry[1]
+        self.dropStacks([path])
+
+    def __contains__(self, path):
+        return path in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries.keys())
+
+    def keys(self):
+        return self._entries.keys()
+
+    def values(self):
+        return [entry[0] for entry in self._entries.values()]
+
+    def items(self):
+        return [(path, entry[0]) for path, entry in self._entries.items()]
+
+def _targetSize(target):
+    """
+    Memory used by the arrays of a target. Arrays that are views on the
+    memory-mapped target container are not counted, their pages belong to
+    the OS page cache.
+    """
+    nbytes = 0
+    for attr in ['verts', '_data', '_faces']:
+        array = getattr(target, attr, None)
+        if isinstance(array, np.ndarray) and not isinstance(array, np.memmap):
+            nbytes += array.nbytes
+    return nbytes
+
+_targetBuffer = TargetCache()
+_targetStacks = weakref.WeakKeyDictionary()
+
+# Uncompressed, memory-mappable compiled target container (written by
+# compile_targets.py): a flat binary file with the index and vector data of
+# all targets, and an offset index locating each target within it.
+TARGETS_MMAP_FILE = 'targets.bin'
+TARGETS_MMAP_INDEX_FILE = 'targets-index.npz'
+
+# Compiled vector data is stored as int16 in units of 1/1000
+COMPILED_VECTOR_SCALE = 1e-3
 
 
 class Target(object):
@@ -74,6 +250,13 @@ class Target(object):
     npztime = None
     npzdir = None
 
+    mmapfile = None     # Raw bytes of the memory-mapped target container
+    mmapindex = None    # Maps target path to (byte offset, vertex count, face count or None)
+    mmaplicenses = None
+    mmapfacecount = None    # Face count of the mesh for which face lists were compiled
+    mmaptime = None
+    mmapdir = None
+
     def __init__(self, obj, name):
         """
         This method initializes an instance of the Target class.
@@ -93,6 +276,9 @@ class Target(object):
         """
         self.name = name
         self.morphFactor = -1
+        self._dataScale = 1.0
+        self._obj = obj
+        self._faces = None
 
         try:
             self._load(self.name)
@@ -101,11 +287,31 @@ class Target(object):
             log.error('Unable to open %s (%s)', name, e)
             return
 
-        self.faces = obj.getFacesForVertices(self.verts)
+        if self._faces is not None and obj is not None and \
+           len(obj.fvert) != Target.mmapfacecount:
+            # Face lists in the container were compiled for another mesh
+            self._faces = None
 
     def __repr__(self):
         return ( "<Target %s>" % (os.path.basename(self.name)) )
 
+    def getFaces(self):
+        """
+        Indices of the faces that use the vertices affected by this target.
+        They are only needed for updating normals, so they are determined
+        the first time they are used (unless they were read from the compiled
+        target container).
+        """
+        if self._faces is None:
+            self._faces = self._obj.getFacesForVertices(self.verts)
+            _targetBuffer.resize(self.name, self)
+        return self._faces
+
+    def setFaces(self, faces):
+        self._faces = faces
+
+    faces = property(getFaces, setFaces)
+
     @property
     def license(self):
         if hasattr(self, '_license'):
@@ -119,6 +325,22 @@ class Target(object):
     def setLicense(self, license):
         self._license = license
 
+    def getData(self):
+        """
+        The translation vectors of this target, as floats.
+        Compiled targets keep their raw (int16) data, which is only scaled when
+        applied, so this creates a new array for them on every access.
+        """
+        if self._dataScale == 1.0:
+            return self._data
+        return self._data * self._dataScale
+
+    def setData(self, data):
+        self._data = data
+        self._dataScale = 1.0
+
+    data = property(getData, setData)
+
     def _load_text(self, name):
         import makehuman
         data = []
@@ -161,7 +383,8 @@ class Target(object):
             log.message('compiled file missing: %s', vname)
             raise RuntimeError('compiled file missing: %s' % vname)
         self.verts = Target.npzfile[iname]
-        self.data = Target.npzfile[vname] * 1e-3
+        self._data = Target.npzfile[vname]
+        self._dataScale = COMPILED_VECTOR_SCALE
         if lname in Target.npzfile:
             import makehuman
             self._license = defaultTargetLicense().fromNumpyString(Target.npzfile[lname])
@@ -189,7 +412,62 @@ class Target(object):
         self.verts = np.load(iname)
         self.data = np.load(vname) * 1e-3
 
+    def _load_binary_mmap(self, name):
+        """
+        Load target from the memory-mapped target container. The index and
+        vector arrays are views on the mapped file, no data is copied.
+        """
+        if os.path.isfile(name) and Target.mmaptime < os.path.getmtime(name):
+            log.message('compiled file newer than archive: %s', name)
+            raise RuntimeError('compiled file newer than archive: %s' % name)
+        name = os.path.relpath(name, Target.mmapdir).replace('\\', '/')
+        offset, count, faceCount = Target.mmapindex[name]
+        vOffset = offset + _alignedSize(2 * count)
+        self.verts = Target.mmapfile[offset:offset + 2 * count].view(np.uint16)
+        self._data = Target.mmapfile[vOffset:vOffset + 6 * count].view(np.int16).reshape((count, 3))
+        if faceCount is not None:
+            fOffset = vOffset + _alignedSize(6 * count)
+            self._faces = Target.mmapfile[fOffset:fOffset + 4 * faceCount].view(np.uint32)
+        self._dataScale = COMPILED_VECTOR_SCALE
+        lname = 'license/%s' % name
+        if lname in Target.mmaplicenses:
+            self._license = defaultTargetLicense().fromNumpyString(Target.mmaplicenses[lname], Target.mmaplicenses[lname + '.idx'])
+
+    @staticmethod
+    def _open_mmap():
+        """
+        Map the compiled target container in memory. All processes that map the
+        same file share its pages through the OS page cache.
+        """
+        try:
+            binname = getSysDataPath(TARGETS_MMAP_FILE)
+            idxname = getSysDataPath(TARGETS_MMAP_INDEX_FILE)
+            Target.mmapdir = os.path.dirname(binname)
+            Target.mmaptime = min(os.path.getmtime(binname), os.path.getmtime(idxname))
+            with np.load(idxname) as index:
+                names = index['names']
+                offsets = index['offsets']
+                counts = index['counts']
+                if 'faceCounts' in index.files:
+                    faceCounts = index['faceCounts'].tolist()
+                    Target.mmapfacecount = int(index['meshFaceCount'])
+                else:
+                    faceCounts = [None] * len(counts)
+                Target.mmaplicenses = dict( (k, index[k]) for k in index.files if k.startswith('license/') )
+            Target.mmapindex = dict( zip(names.tolist(), zip(offsets.tolist(), counts.tolist(), faceCounts)) )
+            Target.mmapfile = np.memmap(binname, dtype=np.uint8, mode='r')
+        except:
+            log.message('no memory-mapped targets found')
+            Target.mmapindex = False
+
     def _load_binary(self, name):
+        if Target.mmapindex is None:
+            Target._open_mmap()
+        if Target.mmapindex and \
+           os.path.relpath(name, Target.mmapdir).replace('\\', '/') in Target.mmapindex:
+            self._load_binary_mmap(name)
+            return
+
         if Target.npzfile is None:
             try:
                 npzname = getSysDataPath('targets.npz')     # TODO duplicate path literal
@@ -226,6 +504,29 @@ class Target(object):
         except StandardError, _:
             log.error('error saving %s', name)
 
+    def _save_mmap(self, fd, obj=None):
+        """
+        Append the compiled data of this target to an open target container
+        file. If a base mesh obj is specified, the face list of the target
+        on that mesh is stored as well.
+        Returns the byte offset at which the data was written, and the number
+        of faces stored (None if no faces were stored).
+        """
+        offset = fd.tell()
+        index = np.ascontiguousarray(self.verts, dtype=np.uint16)
+        vector = np.ascontiguousarray(np.round(self.data * (1.0 / COMPILED_VECTOR_SCALE)), dtype=np.int16)
+        arrays = [index, vector]
+        if obj is not None:
+            faces = np.ascontiguousarray(obj.getFacesForVertices(self.verts), dtype=np.uint32)
+            arrays.append(faces)
+        for array in arrays:
+            data = array.tostring()
+            fd.write(data)
+            fd.write('\0' * (_alignedSize(len(data)) - len(data)))
+        if obj is not None:
+            return offset, len(faces)
+        return offset, None
+
     def _load(self, name):
         logger = log.getLogger('mh.load')
         logger.debug('loading target %s', name)
@@ -261,23 +562,14 @@ class Target(object):
             if morphFactor:
                 # Adding the translation vector
 
-                scale = np.array(scale) * morphFactor
+                scale = np.array(scale) * (morphFactor * self._dataScale)
                 if animatedMesh is not None:
                     # Pose the direction in which the target is applied, for fast
                     # approximate modeling of a posed model
-                    import animation
-                    vertBoneMapping = animatedMesh.getBoundMesh(obj.name)[1]
-                    if not vertBoneMapping.isCompiled(4):
-                        vertBoneMapping.compileData(animatedMesh.getBaseSkeleton(), 4)
-                    animationTrack = animatedMesh.getActiveAnimation()
-                    if not animationTrack.isBaked():
-                        animationTrack.bake(animatedMesh.getBaseSkeleton())
-                    poseData = animatedMesh.getPoseState()
-                    obj.coord[dstVerts] += animation.skinMesh( \
-                                  self.data[srcVerts] * scale[None,:], 
-                                  vertBoneMapping.compiled(4)[dstVerts], poseData )
+                    obj.coord[dstVerts] += _poseOffsets(obj, animatedMesh, dstVerts,
+                                                        self._data[srcVerts] * scale[None,:])
                 else:
-                    obj.coord[dstVerts] += self.data[srcVerts] * scale[None,:]
+                    obj.coord[dstVerts] += self._data[srcVerts] * scale[None,:]
                 obj.markCoords(dstVerts, coor=True)
 
             if calcNormals:
@@ -289,6 +581,255 @@ class Target(object):
 
         return False
 
+def _alignedSize(nbytes, alignment=8):
+    """
+    Size in bytes of a block in the compiled target container, padded so
+    that every array in the container starts at an aligned offset.
+    """
+    return (nbytes + alignment - 1) // alignment * alignment
+
+class TargetStack(object):
+    """
+    A set of targets, packed as one sparse (vertices x targets) matrix in
+    compressed column format, holding the stacked translation vectors of the
+    targets. The combined morph for a set of target weights is computed as a
+    single sparse matrix-vector product instead of applying the targets one by
+    one.
+    The translation vectors are stored as int16 with a scale per target, like
+    compiled targets. The packed matrix is rebuilt only when the set of
+    targets changes, or when one of them was removed from the target cache.
+    """
+
+    def __init__(self, obj):
+        self.nVerts = obj.getVertexCount()
+        self.clear()
+
+    def clear(self):
+        """
+        Drop the packed matrix, it is packed again on next use.
+        """
+        self.paths = []
+        self.pathSet = frozenset()
+        self.verts = np.zeros(0, dtype=np.uint32)       # Vertices affected by any of the targets
+        self.rows = np.zeros(0, dtype=np.uint32)        # Index in self.verts per entry
+        self.counts = np.zeros(0, dtype=np.uint32)      # Number of entries per target (column)
+        self.data = np.zeros((3, 0), dtype=np.int16)    # Translation vector per entry (one row per axis)
+        self.scales = np.zeros(0, dtype=np.float32)     # Data scale per target
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in [self.verts, self.rows, self.counts, self.data, self.scales])
+
+    def pack(self, obj, paths):
+        """
+        Make sure the matrix contains the targets with specified paths, in
+        that order. Targets are retrieved through the target buffer, no
+        references to them are kept.
+        """
+        if paths == self.paths:
+            return
+
+        self.clear()
+        targets = [getTarget(obj, path) for path in paths]
+        counts = np.array([len(t.verts) for t in targets], dtype=np.uint32)
+        if counts.sum() > 0:
+            rows = np.concatenate([t.verts for t in targets if len(t.verts)])
+            vmask = np.zeros(self.nVerts, dtype=bool)
+            vmask[rows] = True
+            self.verts = np.flatnonzero(vmask).astype(np.uint32)
+            # Map vertex indices to their position in self.verts
+            self.rows = (np.cumsum(vmask, dtype=np.uint32) - 1)[rows]
+            del vmask
+        data = []
+        scales = np.zeros(len(targets), dtype=np.float32)
+        for i, t in enumerate(targets):
+            data_i, scales[i] = _quantizeTargetData(t)
+            if len(data_i):
+                data.append(data_i)
+        if data:
+            self.data = np.ascontiguousarray(np.concatenate(data).T)
+        self.counts = counts
+        self.scales = scales
+        self.paths = list(paths)
+        self.pathSet = frozenset(paths)
+        if len(paths):
+            _targetBuffer.addStack(self)
+
+    def getOffsets(self, weights):
+        """
+        Multiply the packed matrix with a vector of weights (one weight per
+        target, in the order in which they were packed). Returns the combined
+        translation of the vertices in self.verts as a (len(verts), 3) array.
+        """
+        weights = np.asarray(weights, dtype=np.float64) * self.scales
+        result = np.zeros((len(self.verts), 3), dtype=np.float32)
+        if len(self.rows) == 0:
+            return result
+        w = np.repeat(weights, self.counts)
+        for i in xrange(3):
+            result[:,i] = np.bincount(self.rows, w * self.data[i], minlength=len(self.verts))
+        return result
+
+def _quantizeTargetData(target):
+    """
+    Translation vectors of a target as int16, and the scale with which they
+    have to be multiplied. Compiled targets are stored like this already,
+    other targets (loaded from text, or generated) are quantized with a scale
+    that maps their largest translation to the int16 range.
+    """
+    data = target._data
+    if len(target.verts) == 0:
+        return np.zeros((0, 3), dtype=np.int16), 1.0
+    if data.dtype == np.int16:
+        return data, target._dataScale
+    data = np.asarray(data, dtype=np.float64) * target._dataScale
+    maxabs = np.abs(data).max()
+    if maxabs == 0:
+        return np.zeros(data.shape, dtype=np.int16), 1.0
+    scale = maxabs / 32767.0
+    return np.round(data / scale).astype(np.int16), scale
+
+def getTargetStack(obj):
+    """
+    Retrieve the TargetStack cached for the specified mesh.
+    """
+    stack = _targetStacks.get(obj)
+    if stack is None or stack.nVerts != obj.getVertexCount():
+        stack = TargetStack(obj)
+        _targetStacks[obj] = stack
+    return stack
+
+def loadTranslationTargets(obj, targets, update=1, calcNorm=1, reset=False, animatedMesh=None, stack=None):
+    """
+    Apply a set of targets at once. This is equivalent to calling
+    loadTranslationTarget for each of them, but the combined morph of all
+    targets is computed in a single vectorized pass.
+    Returns the indices of the vertices that are modified.
+
+    Parameters
+    ----------
+
+    obj:
+        *3d object*. The target object to which the translations are to be applied.
+
+    targets:
+        *dict*. Maps canonical target paths to the morph factors with which they
+        are applied.
+
+    update:
+        *int flag*. A flag to indicate whether the update method on the object should be called.
+
+    calcNorm:
+        *int flag*. A flag to indicate whether the normals are to be recalculated.
+
+    reset:
+        *bool*. Apply the targets to the original coordinates of the object,
+        instead of its current coordinates.
+
+    animatedMesh:
+        *AnimatedMesh*. Posed state of the basemesh with which the targets should
+        be transformed before being applied.
+
+    stack:
+        *TargetStack*. The packed target matrix to use. Defaults to the one
+        cached for obj. Callers that repeatedly apply a different set of
+        targets than the full detail stack should keep their own, so that the
+        matrices do not need to be repacked.
+    """
+    paths = sorted(targets.keys())
+    if stack is None:
+        stack = getTargetStack(obj)
+    stack.pack(obj, paths)
+    offsets = stack.getOffsets([targets[path] for path in paths])
+    for path in paths:
+        target = _targetBuffer.get(path)
+        if target is not None:
+            target.morphFactor = targets[path]
+    verts = stack.verts
+
+    if animatedMesh is not None:
+        offsets = _poseOffsets(obj, animatedMesh, verts, offsets)
+    if reset:
+        coord = obj.orig_coord.copy()
+        coord[verts] += offsets
+        obj.changeCoords(coord)
+    else:
+        obj.coord[verts] += offsets
+        obj.markCoords(verts, coor=True)
+    if calcNorm:
+        obj.calcNormals()
+    if update:
+        obj.update()
+    return verts
+
+def _poseOffsets(obj, animatedMesh, verts, offsets):
+    """
+    Pose the direction in which target offsets are applied, for fast
+    approximate modeling of a posed model.
+    """
+    import animation
+    vertBoneMapping = animatedMesh.getBoundMesh(obj.name)[1]
+    if not vertBoneMapping.isCompiled(4):
+        vertBoneMapping.compileData(animatedMesh.getBaseSkeleton(), 4)
+    animationTrack = animatedMesh.getActiveAnimation()
+    if not animationTrack.isBaked():
+        animationTrack.bake(animatedMesh.getBaseSkeleton())
+    poseData = animatedMesh.getPoseState()
+    return animation.skinMesh(offsets, vertBoneMapping.compiled(4)[verts], poseData)
+
+class TargetsMmapWriter(object):
+    """
+    Writes compiled targets to a memory-mappable target container, consisting
+    of a flat binary file at binPath and an offset index at indexPath.
+    Target paths are stored relative to rootPath.
+    If a base mesh obj is specified, the face lists of the targets on that
+    mesh are compiled into the container as well.
+    """
+
+    def __init__(self, binPath, indexPath, rootPath, obj=None):
+        self.indexPath = indexPath
+        self.rootPath = rootPath
+        self.obj = obj
+        self.names = []
+        self.offsets = []
+        self.counts = []
+        self.faceCounts = []
+        self.licenses = {}
+        self._fd = open(binPath, 'wb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add(self, path, target):
+        name = os.path.relpath(path, self.rootPath).replace('\\', '/')
+        self.names.append(name)
+        offset, faceCount = target._save_mmap(self._fd, self.obj)
+        self.offsets.append(offset)
+        self.counts.append(len(target.verts))
+        self.faceCounts.append(faceCount)
+        if hasattr(target, '_license'):
+            text, index = target._license.toNumpyString()
+            self.licenses['license/%s' % name] = text
+            self.licenses['license/%s.idx' % name] = index
+
+    def close(self):
+        if self._fd is None:
+            return
+        self._fd.close()
+        self._fd = None
+        # The index is small, but store it uncompressed as well
+        arrays = dict(self.licenses)
+        if self.obj is not None:
+            arrays['faceCounts'] = np.array(self.faceCounts, dtype=np.uint32)
+            arrays['meshFaceCount'] = np.array(len(self.obj.fvert), dtype=np.uint32)
+        np.savez(self.indexPath, names=np.array(self.names),
+                                 offsets=np.array(self.offsets, dtype=np.uint64),
+                                 counts=np.array(self.counts, dtype=np.uint32),
+                                 **arrays)
+
 def getTarget(obj, targetPath):
     """
     This function retrieves a set of translation vectors from a morphing
@@ -322,15 +863,36 @@ def getTarget(obj, targetPath):
     """
     targetPath = canonicalPath(targetPath)
 
-    try:
-        return _targetBuffer[targetPath]
-    except KeyError:
-        pass
+    target = _targetBuffer.lookup(targetPath)
+    if target is not None:
+        return target
 
     target = Target(obj, targetPath)
-    _targetBuffer[targetPath] = target
+    _targetBuffer.add(targetPath, target)
     return target
 
+def setTargetCacheSize(maxBytes):
+    """
+    Set the memory budget, in bytes, of the target cache. None means no limit.
+    """
+    _targetBuffer.maxBytes = maxBytes
+    _targetBuffer.evict()
+
+def pinTargets(paths):
+    """
+    Protect the targets with specified canonical paths from being evicted from
+    the target cache. The container is kept by reference, so later changes to
+    it apply as well. Replaces the previously pinned paths.
+    """
+    _targetBuffer.pinned = paths
+
+def getTargetCacheStats():
+    """
+    Statistics of the target cache: the number of cached targets, the memory
+    they use and budget (in bytes), and the hit, miss and eviction counts.
+    """
+    return _targetBuffer.getStats()
+
 def refreshCachedTarget(targetPath):
     """
     Invalidate the cache for the specified target, so that it will be reloaded
@@ -463,9 +1025,11 @@ def saveTranslationTarget(obj, targetPath, groupToSave=None, epsilon=0.001):
         return None
 
 
-def resetObj(obj, update=None, calcNorm=None):
+def resetObj(obj, update=None, calcNorm=None, targets=None):
     """
     This function resets the positions of the vertices of an object to their original base positions.
+    Optionally a set of targets is applied to the reset coordinates, in the
+    same pass.
 
     Parameters
     ----------
@@ -479,8 +1043,16 @@ def resetObj(obj, update=None, calcNorm=None):
     calcNorm:
         *int*. An indicator to control whether or not the normals should be recalculated
 
+    targets:
+        *dict*. Optional: maps target paths to the morph factors with which
+        they are applied to the reset object (see loadTranslationTargets).
+
     """
 
+    if targets:
+        loadTranslationTargets(obj, targets, update, calcNorm, reset=True)
+        return
+
     originalVerts = obj.orig_coord
     obj.changeCoords(originalVerts)
     if update:
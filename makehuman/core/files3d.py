@@ -65,6 +65,7 @@ is visible to the user through the GUI.
 """
 
 import os.path
+import json
 import module3d
 import numpy as np
 import log
@@ -156,6 +157,115 @@ def loadBinaryMesh(obj, path):
     obj.updateIndexBuffer()
     #log.debug('loadBinaryMesh: built index buffer for rendering')
 
+# Uncompressed, memory-mappable mesh cache: a header describing the stored
+# arrays, followed by the raw array data. Besides the mesh data it stores the
+# normals and the unwelded render buffers, so loading a mesh from it needs no
+# decompression nor any calculation.
+MAPPED_MESH_EXT = '.bin'
+MAPPED_MESH_MAGIC = 'MHMESH\x00\x01'
+_MAPPED_MESH_ALIGNMENT = 16
+
+def _alignedSize(nbytes):
+    return -(-nbytes // _MAPPED_MESH_ALIGNMENT) * _MAPPED_MESH_ALIGNMENT
+
+def saveMappedArrays(path, magic, header, arrays):
+    """
+    Write named arrays to a memory-mappable container: magic, the size of the
+    JSON header, the header (the specified header dict, extended with an
+    'arrays' entry describing the stored arrays), and the raw array data, all
+    aligned. arrays is a list of (name, array) tuples.
+    """
+    entries = []
+    offset = 0
+    contiguous = []
+    for name, array in arrays:
+        array = np.ascontiguousarray(array)
+        contiguous.append(array)
+        entries.append( (name, array.dtype.str, array.shape, offset) )
+        offset += _alignedSize(array.nbytes)
+
+    header = dict(header)
+    header['arrays'] = entries
+    header = json.dumps(header)
+    with open(path, 'wb') as f:
+        f.write(magic)
+        f.write(np.array([len(header)], dtype='<u8').tostring())
+        f.write(header)
+        f.write('\0' * (_alignedSize(len(header)) - len(header)))
+        for array in contiguous:
+            data = array.tostring()
+            f.write(data)
+            f.write('\0' * (_alignedSize(len(data)) - len(data)))
+    os.utime(path, None)  # Ensure modification time is updated
+
+def loadMappedArrays(path, magic):
+    """
+    Map a container written by saveMappedArrays copy-on-write. Returns the
+    header dict and a dict of the arrays, which are views sharing the pages of
+    the file until they are modified.
+    Raises RuntimeError if the file is not a valid container.
+    """
+    data = np.memmap(path, dtype=np.uint8, mode='c')
+    if data[:len(magic)].tostring() != magic:
+        raise RuntimeError('not a compiled file: %s' % path)
+    start = len(magic) + 8
+    headerSize = int(data[len(magic):start].view('<u8')[0])
+    header = json.loads(data[start:start+headerSize].tostring())
+    start += _alignedSize(headerSize)
+
+    arrays = {}
+    for name, dtype, shape, offset in header['arrays']:
+        dtype = np.dtype(str(dtype))
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        offset += start
+        if offset + nbytes > len(data):
+            raise RuntimeError('truncated compiled file: %s' % path)
+        arrays[name] = data[offset:offset+nbytes].view(dtype).reshape(shape).view(np.ndarray)
+    return header, arrays
+
+def saveMappedMesh(obj, path):
+    """
+    Save a mesh, with its normals and index buffer calculated, to the
+    memory-mappable mesh cache format.
+    """
+    names = ['coord', 'vface', 'nfaces', 'texco', 'fvert', 'group',
+             'fnorm', 'vnorm', 'vtang', 'vmap', 'tmap', 'r_faces']
+    if obj.has_uv:
+        names.append('fuvs')
+
+    header = {'MAX_FACES': obj.MAX_FACES,
+              'faceGroups': [fg.name for fg in obj._faceGroups]}
+    saveMappedArrays(path, MAPPED_MESH_MAGIC, header,
+                     [(name, getattr(obj, name)) for name in names])
+
+def loadMappedMesh(obj, path):
+    """
+    Load a mesh from the memory-mappable mesh cache format. The file is
+    mapped copy-on-write, so all loaded arrays are views sharing the pages of
+    the file until they are modified.
+    The file is validated before obj is modified.
+    """
+    log.debug("Loading mapped mesh %s.", path)
+
+    header, arrays = loadMappedArrays(path, MAPPED_MESH_MAGIC)
+
+    obj.MAX_FACES = header['MAX_FACES']
+    obj.setCoords(arrays['coord'])
+    obj.setUVs(arrays['texco'])
+    obj.setFaces(arrays['fvert'], arrays.get('fuvs'), arrays['group'], skipUpdate=True)
+    obj.vface = arrays['vface']
+    obj.nfaces = arrays['nfaces']
+
+    for name in header['faceGroups']:
+        obj.createFaceGroup(name)
+
+    obj.fnorm = arrays['fnorm']
+    obj.vnorm = arrays['vnorm']
+    obj.vtang = arrays['vtang']
+
+    obj.setIndexBufferVerts(arrays['vmap'], arrays['tmap'], arrays['r_faces'])
+    obj.updateIndexBufferFaces()
+
 def loadTextMesh(obj, path):
     """
     Parse and load a Wavefront OBJ file as mesh.
@@ -192,6 +302,16 @@ def loadMesh(path, loadColors=1, maxFaces=None, obj=None):
 
     try:
         npzpath = os.path.splitext(path)[0] + '.npz'
+        mappedpath = os.path.splitext(path)[0] + MAPPED_MESH_EXT
+        try:
+            if os.path.isfile(mappedpath) and \
+               not (os.path.isfile(path) and os.path.getmtime(path) > os.path.getmtime(mappedpath)):
+                loadMappedMesh(obj, mappedpath)
+                return obj
+        except Exception as e:
+            showTrace = not isinstance(e, RuntimeError)
+            log.warning("Problem loading mapped mesh: %s", e, exc_info=showTrace)
+
         try:
             if not os.path.isfile(npzpath):
                 log.message('compiled file missing: %s', npzpath)
@@ -208,6 +328,7 @@ def loadMesh(path, loadColors=1, maxFaces=None, obj=None):
                 # Only write compiled binary meshes to user data path
                 try:
                     saveBinaryMesh(obj, npzpath)
+                    saveMappedMesh(obj, mappedpath)
                 except StandardError:
                     log.notice('unable to save compiled mesh: %s', npzpath)
             else:
@@ -224,6 +224,7 @@ class MHApplication(gui3d.Application, mh.Application):
                 'invertMouseWheel': False,
                 'lowspeed': 1,
                 'preloadTargets': True,
+                'targetCacheSize': 512,
                 'cameraAutoZoom': False,
                 'language': 'english',
                 'highspeed': 5,
@@ -249,6 +250,7 @@ class MHApplication(gui3d.Application, mh.Application):
                 'sliderImages': True,
                 'guiTheme': 'makehuman',
                 'preloadTargets': False,
+                'targetCacheSize': 512,
                 'restoreWindowSize': True,
                 'windowGeometry': ''
             }
@@ -381,6 +383,9 @@ class MHApplication(gui3d.Application, mh.Application):
     # TO THINK: Maybe move guisave's saveMHM here as saveHumanMHM?
 
     def loadHuman(self):
+        # Memory budget (in MB) for loaded targets
+        algos3d.setTargetCacheSize(self.getSetting('targetCacheSize') * 1024 * 1024)
+
         # Set a lower than default MAX_FACES value because we know the human has a good topology (will make it a little faster)
         # (we do not lower the global limit because that would limit the selection of meshes that MH would accept too much)
         self.selectedHuman = self.addObject(human.Human(files3d.loadMesh(mh.getSysDataPath("3dobjs/base.obj"), maxFaces = 5)))
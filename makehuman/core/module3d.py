@@ -356,18 +356,47 @@ class Object3D(object):
         """
         Calculate per-vertex normals from the face normals for smooth shading
         the model. Requires face normals to be calculated first.
+        The normals are the product of the vertex-face incidence matrix with
+        the face normals, normalized.
         """
         self.markCoords(ix, norm=True)
+        starts, counts, rows, faces = self.getVertexFaceIncidence()
         if ix is None:
             ix = np.s_[:]
-
-        vface = self.vface[ix]
-        norms = self.fnorm[vface]
-        norms *= np.arange(self.MAX_FACES)[None,:,None] < self.nfaces[ix][:,None,None]
-        norms = np.sum(norms, axis=1)
+            nverts = len(counts)
+        else:
+            ix = np.asarray(ix)
+            if ix.dtype == bool:
+                ix = np.flatnonzero(ix)
+            # Select the rows of the incidence matrix for ix
+            n = counts[ix]
+            faces = faces[np.repeat(starts[ix] - (np.cumsum(n) - n), n) + np.arange(np.sum(n))]
+            nverts = len(ix)
+            rows = np.repeat(np.arange(nverts), n)
+
+        fnorm = self.fnorm[faces]
+        norms = np.empty((nverts, 3), dtype=np.float64)
+        for i in xrange(3):
+            norms[:,i] = np.bincount(rows, fnorm[:,i], minlength=nverts)
         norms /= np.sqrt(np.sum(norms ** 2, axis=-1))[:,None]
         self.vnorm[ix] = norms
 
+    def getVertexFaceIncidence(self):
+        """
+        The sparse vertex-face incidence matrix of this mesh, derived from
+        vface and nfaces once for every topology, in compressed row format.
+        Returns starts, counts (per vertex), rows and faces (per entry): the
+        faces vertex i belongs to are faces[starts[i]:starts[i]+counts[i]].
+        """
+        if self._vertexFaces is None or self._vertexFaces[0] is not self.vface:
+            counts = np.asarray(self.nfaces, dtype=np.int64)
+            valid = np.arange(self.vface.shape[1])[None,:] < counts[:,None]
+            faces = self.vface[valid]
+            starts = np.cumsum(counts) - counts
+            rows = np.repeat(np.arange(len(counts)), counts)
+            self._vertexFaces = (self.vface, starts, counts, rows, faces)
+        return self._vertexFaces[1:]
+
     def calcVertexTangents(self, ix = None):
         """
         Calculate vertex tangents using Lengyel’s Method.
@@ -495,6 +524,9 @@ class Object3D(object):
         self.color = []         # Vertex colors (idx = vertex idx)
         self.vface = []         # References the faces that a vertex belongs to (limited to MAX_FACES) (idx = vertex idx)
         self.nfaces = 0         # Polycount
+        self._vertexFaces = None    # Cached vertex-face incidence matrix, derived from vface
+
+        self.movedVerts = False # Vertices moved since the vertex normals were calculated (False, True for all, or a mask), see calcNormals
 
         self.ucoor = False      # Update flags for updating to OpenGL renderbuffers
         self.unorm = False
@@ -568,6 +600,13 @@ class Object3D(object):
                     self.ucoor = np.zeros(nverts, dtype=bool)
                 if self.ucoor is not True:
                     self.ucoor[indices] = True
+            if indices is None:
+                self.movedVerts = True
+            else:
+                if self.movedVerts is False:
+                    self.movedVerts = np.zeros(nverts, dtype=bool)
+                if self.movedVerts is not True:
+                    self.movedVerts[indices] = True
 
         if norm:
             if indices is None:
@@ -688,6 +727,8 @@ class Object3D(object):
         return self._inverse_vmap
 
     def _update_faces(self):
+        self._vertexFaces = None
+        self.movedVerts = True
         # Construct vface: arrange face indices for same v_idx in different columns
         # Every row in the vface matrix contains a variable number of valid columns
         # (the number of valid columns for each row is stored in the nfaces array)
@@ -764,14 +805,22 @@ class Object3D(object):
 
         unwelded = u[:,None] >> np.array([[32,0]], dtype=np.uint64)
         unwelded = unwelded.astype(np.uint32)
-        nverts = len(unwelded)
         iverts = rev.reshape(self.fvert.shape)
         del rev, u
 
-        self.vmap = unwelded[:,0]
-        self.tmap = unwelded[:,1]
+        self.setIndexBufferVerts(unwelded[:,0], unwelded[:,1], np.array(iverts, dtype=np.uint32))
+
+    def setIndexBufferVerts(self, vmap, tmap, r_faces):
+        """
+        Set the mapping between the vertices of this mesh and its unwelded
+        render vertices (one for each unique combination of vertex and UV
+        coordinate), as calculated by updateIndexBufferVerts or loaded from a
+        compiled mesh, and allocate the render buffers.
+        """
+        nverts = len(vmap)
+        self.vmap = vmap
+        self.tmap = tmap
         self._inverse_vmap = None
-        del unwelded
 
         self.r_coord = np.empty((nverts, 3), dtype=np.float32)
         self.r_texco = np.empty((nverts, 2), dtype=np.float32)
@@ -779,7 +828,7 @@ class Object3D(object):
         self.r_vtang = np.zeros((nverts, 4), dtype=np.float32)
         self.r_color = np.zeros((nverts, 4), dtype=np.uint8) + 255
 
-        self.r_faces = np.array(iverts, dtype=np.uint32)
+        self.r_faces = r_faces
 
     def updateIndexBufferFaces(self):
         index = self.r_faces[self.face_mask]
@@ -1143,7 +1192,24 @@ class Object3D(object):
         :type verticesToUpdate: list of :py:class:`module3d.Vert`
         :param facesToUpdate: The list of faces to be updated, if None all faces are updated.
         :type facesToUpdate: list of :py:class:`module3d.Face`
+
+        If no vertices and faces are specified, and only some vertices were
+        marked as moved (see markCoords) since the normals were last
+        calculated, only the normals of the faces connected to those vertices,
+        and of the vertices of these faces, are updated. If no vertices were
+        marked, or most of them, all normals are updated.
         """
+        if verticesToUpdate is None and facesToUpdate is None and \
+           recalcFaceNormals and recalcVertexNormals:
+            moved = self.movedVerts
+            if moved is not True and moved is not False:
+                moved = np.flatnonzero(moved)
+                if len(moved) == 0:
+                    return
+                if len(moved) < len(self.coord) // 2:
+                    facesToUpdate = self.getFacesForVertices(moved)
+                    verticesToUpdate = np.flatnonzero(self.getVertexMaskForFaceMask(facesToUpdate))
+            self.movedVerts = False
 
         if recalcFaceNormals:
             self.calcFaceNormals(facesToUpdate)
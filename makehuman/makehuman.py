@@ -441,6 +441,9 @@ def parse_arguments():
     parser.add_argument("--fullloggingopengl", action="store_true", help="log all OpenGL calls (very slow)")
     parser.add_argument("--debugnumpy", action="store_true", help="enable numpy runtime error messages")
     parser.add_argument("--home-location", action="store", help="set alternative home path")
+    parser.add_argument("--batch", action="store", metavar="OUTDIR", help="generate models without GUI and export them to OUTDIR. Models are read from mhmFile, which can be an .mhm file, a .json file with parameter sets or a text file listing one of these per line, or from standard input if mhmFile is omitted or -")
+    parser.add_argument("--batch-workers", action="store", type=int, default=1, metavar="N", help="number of worker processes used with --batch, 0 uses one per CPU core")
+    parser.add_argument("--batch-target-cache", action="store", type=int, default=None, metavar="MB", help="memory budget for loaded targets used with --batch (default: no limit)")
     if not isRelease():
         parser.add_argument("-t", "--runtests", action="store_true", help="run test suite (for developers)")
 
@@ -810,6 +813,19 @@ def main():
     os.environ['MH_FROZEN'] = "Yes" if isBuild() else "No"
     os.environ['MH_RELEASE'] = "Yes" if isRelease() else "No"
 
+    if G.args.get('batch', None):
+        # Headless batch generation, the Qt GUI and OpenGL are not started
+        if not G.args.get('debugnumpy', False):
+            import numpy
+            numpy.seterr(all = 'ignore')
+        import batchmode
+        failed = batchmode.run(G.args)
+        close_standard_streams()
+        if failed:
+            # Let the caller detect failed models
+            sys.exit(1)
+        return
+
     debug_dump()
     
            
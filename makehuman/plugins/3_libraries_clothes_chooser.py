@@ -37,6 +37,7 @@ Clothes library.
 """
 
 import proxychooser
+import libraryhandlers
 
 import gui3d
 import gui
@@ -48,7 +49,7 @@ import numpy as np
 #   Clothes
 #
 
-class ClothesTaskView(proxychooser.ProxyChooserTaskView):
+class ClothesTaskView(proxychooser.ProxyChooserTaskView, libraryhandlers.ClothesLibraryHandlers):
 
     def __init__(self, category):
         super(ClothesTaskView, self).__init__(category, 'clothes', multiProxy = True, tagFilter = True)
@@ -151,23 +152,11 @@ class ClothesTaskView(proxychooser.ProxyChooserTaskView):
         super(ClothesTaskView, self).onHide(event)
         self.visualizeFaceMasks(False)
 
-    def loadHandler(self, human, values, strict):
-        if values[0] == 'status':
-            if values[1] == 'started':
-                # Don't update face masks during loading (optimization)
-                self.blockFaceMasking = True
-            elif values[1] == 'finished':
-                # When loading ends, update face masks
-                self.blockFaceMasking = False
-                self.updateFaceMasks(self.faceHidingTggl.selected)
-            return
-
-        if values[0] == 'clothesHideFaces':
-            enabled = values[1].lower() in ['true', 'yes']
-            self.faceHidingTggl.setChecked(enabled)
-            return
+    def isFaceHiding(self):
+        return self.faceHidingTggl.selected
 
-        super(ClothesTaskView, self).loadHandler(human, values, strict)
+    def setFaceHiding(self, enabled):
+        self.faceHidingTggl.setChecked(enabled)
 
     def onHumanChanged(self, event):
         super(ClothesTaskView, self).onHumanChanged(event)
@@ -178,10 +167,6 @@ class ClothesTaskView(proxychooser.ProxyChooserTaskView):
             # Update face masks if topology was changed
             self.updateFaceMasks(self.faceHidingTggl.selected)
 
-    def saveHandler(self, human, file):
-        super(ClothesTaskView, self).saveHandler(human, file)
-        file.write('clothesHideFaces %s\n' % str(self.faceHidingTggl.selected))
-
     def registerLoadSaveHandlers(self):
         super(ClothesTaskView, self).registerLoadSaveHandlers()
         gui3d.app.addLoadHandler('clothesHideFaces', self.loadHandler)
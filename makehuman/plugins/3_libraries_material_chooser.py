@@ -49,6 +49,7 @@ from humanobjchooser import HumanObjectSelector
 import log
 import getpath
 import filecache
+import libraryhandlers
 
 class MaterialAction(gui3d.Action):
     def __init__(self, obj, after):
@@ -66,7 +67,7 @@ class MaterialAction(gui3d.Action):
         return True
 
 
-class MaterialTaskView(gui3d.TaskView, filecache.MetadataCacher):
+class MaterialTaskView(gui3d.TaskView, filecache.MetadataCacher, libraryhandlers.MaterialLibraryHandlers):
 
     def __init__(self, category):
         gui3d.TaskView.__init__(self, category, 'Material', label='Skin/Material')
@@ -187,109 +188,11 @@ class MaterialTaskView(gui3d.TaskView, filecache.MetadataCacher):
     def onHide(self, event):
         gui3d.TaskView.onHide(self, event)
 
-    def loadHandler(self, human, values, strict):
-        if values[0] == 'status':
-            return
-
-        if values[0] == 'skinMaterial':
-            path = values[1]
-            if os.path.isfile(path):
-                mat = material.fromFile(path)
-                human.material = mat
-                return
-            else:
-                absP = getpath.thoroughFindFile(path)
-                if not os.path.isfile(absP):
-                    if strict:
-                        raise RuntimeError('Could not find material %s for skinMaterial parameter.' % values[1])
-                    log.warning('Could not find material %s for skinMaterial parameter.', values[1])
-                    return
-                mat = material.fromFile(absP)
-                human.material = mat
-                return
-        elif values[0] == 'material':
-            if len(values) == 3:
-                uuid = values[1]
-                filepath = values[2]
-                name = ""
-            else:
-                name = values[1]
-                uuid = values[2]
-                filepath = values[3]
-
-            if human.hairProxy and human.hairProxy.getUuid() == uuid:
-                proxy = human.hairProxy
-                filepath = self.getMaterialPath(filepath, proxy.file)
-                proxy.object.material = material.fromFile(filepath)
-                return
-            elif human.eyesProxy and human.eyesProxy.getUuid() == uuid:
-                proxy = human.eyesProxy
-                filepath = self.getMaterialPath(filepath, proxy.file)
-                proxy.object.material = material.fromFile(filepath)
-                return
-            elif not uuid in human.clothesProxies.keys():
-                if strict:
-                    raise RuntimeError("Could not load material for proxy with uuid %s (%s)! No such proxy." % (uuid, name))
-                log.error("Could not load material for proxy with uuid %s (%s)! No such proxy.", uuid, name)
-                return
-
-            proxy = human.clothesProxies[uuid]
-            proxy = human.clothesProxies[uuid]
-            filepath = self.getMaterialPath(filepath, proxy.file)
-            self.applyClothesMaterial(uuid, filepath)
-            return
-
-    def getRelativeMaterialPath(self, filepath, objFile = None):
-        """
-        Produce a portable path for writing to file.
-        """
-        # TODO move as helper func to material module
-        if objFile:
-            objFile = getpath.canonicalPath(objFile)
-            if os.path.isfile(objFile):
-                objFile = os.path.dirname(objFile)
-            searchPaths = [ objFile ]
-        else:
-            searchPaths = []
-
-        return getpath.getJailedPath(filepath, searchPaths)
-
-    def getMaterialPath(self, relPath, objFile = None):
-        if objFile:
-            objFile = os.path.abspath(objFile)
-            if os.path.isfile(objFile):
-                objFile = os.path.dirname(objFile)
-            searchPaths = [ objFile ]
-        else:
-            searchPaths = []
-
-        return getpath.thoroughFindFile(relPath, searchPaths)
-
     def onHumanChanged(self, event):
         if event.change == 'reset':
             self.humanObjSelector.refresh()
             self.reloadMaterialChooser()
 
-    def saveHandler(self, human, file):
-        file.write('skinMaterial %s\n' % self.getRelativeMaterialPath(human.material.filename))
-        for name, pxy in human.clothesProxies.items():
-            clo = pxy.object
-            if clo:
-                proxy = human.clothesProxies[name]
-                if clo.material.filename !=  proxy.material.filename:
-                    materialPath = self.getRelativeMaterialPath(clo.material.filename, proxy.file)
-                    file.write('material %s %s %s\n' % (proxy.name, proxy.getUuid(), materialPath))
-        if human.hairProxy:
-            proxy = human.hairProxy
-            hairObj = proxy.object
-            materialPath = self.getRelativeMaterialPath(hairObj.material.filename, proxy.file)
-            file.write('material %s %s %s\n' % (proxy.name, proxy.getUuid(), materialPath))
-        if human.eyesProxy:
-            proxy = human.eyesProxy
-            eyesObj = proxy.object
-            materialPath = self.getRelativeMaterialPath(eyesObj.material.filename, proxy.file)
-            file.write('material %s %s %s\n' % (proxy.name, proxy.getUuid(), materialPath))
-
 
 # This method is called when the plugin is loaded into makehuman
 # The app reference is passed so that a plugin can attach a new category, task, or other GUI elements
@@ -47,11 +47,7 @@ import os
 from core import G
 import getpath
 import filecache
-import numpy as np
-
-
-# Bone used for determining the pose scaling (root bone translation scale)
-COMPARE_BONE = "upperleg02.L"
+import libraryhandlers
 
 
 class PoseAction(gui3d.Action):
@@ -70,7 +66,7 @@ class PoseAction(gui3d.Action):
         return True
 
 
-class PoseLibraryTaskView(gui3d.TaskView, filecache.MetadataCacher):
+class PoseLibraryTaskView(gui3d.TaskView, filecache.MetadataCacher, libraryhandlers.PoseLibraryHandlers):
 
     def __init__(self, category):
         gui3d.TaskView.__init__(self, category, 'Pose')
@@ -173,47 +169,12 @@ class PoseLibraryTaskView(gui3d.TaskView, filecache.MetadataCacher):
     def loadBvh(self, filepath, convertFromZUp="auto"):
         bvh_file = bvh.load(filepath, convertFromZUp)
         anim = bvh_file.createAnimationTrack(self.human.getBaseSkeleton())
-        if "root" in bvh_file.joints:
-            posedata = anim.getAtFramePos(0, noBake=True)
-            root_bone_idx = 0
-            self.bvh_root_translation = posedata[root_bone_idx, :3, 3].copy()
-        else:
-            self.bvh_root_translation = np.asarray(3*[0.0], dtype=np.float32)
-        self.bvh_bone_length = self.calculateBvhBoneLength(bvh_file)
+        self.setAutoScaleReference(bvh_file, anim)
         self.autoScaleAnim(anim)
         _, _, _, license = self.getMetadata(filepath)
         anim.license = license
         return anim
 
-    def calculateBvhBoneLength(self, bvh_file):
-        import numpy.linalg as la
-        if COMPARE_BONE not in bvh_file.joints:
-            raise RuntimeError('Failed to auto scale BVH file %s, it does not contain a joint for "%s"' % (bvh_file.name, COMPARE_BONE))
-
-        bvh_joint = bvh_file.joints[COMPARE_BONE]
-        joint_length = la.norm(bvh_joint.children[0].position - bvh_joint.position)
-        return joint_length
-
-    def autoScaleAnim(self, anim):
-        """
-        Auto scale BVH translations by comparing upper leg length to make the
-        human stand on the ground plane, independent of body length.
-        """
-        import numpy.linalg as la
-        bone = self.human.getBaseSkeleton().getBone(COMPARE_BONE)
-        scale_factor = float(bone.length) / self.bvh_bone_length
-        trans = scale_factor * self.bvh_root_translation
-        log.message("Scaling animation %s with factor %s" % (anim.name, scale_factor))
-        # It's possible to use anim.scale() as well, but by repeated scaling we accumulate error
-        # It's easier to simply set the translation, as poses only have a translation on
-        # root joint
-
-        # Set pose root bone translation
-        root_bone_idx = 0
-        posedata = anim.getAtFramePos(0, noBake=True)
-        posedata[root_bone_idx, :3, 3] = trans
-        anim.resetBaked()
-
     def onShow(self, event):
         self.filechooser.refresh()
         self.filechooser.selectItem(self.currentPose)
@@ -242,23 +203,6 @@ class PoseLibraryTaskView(gui3d.TaskView, filecache.MetadataCacher):
             if self.isShown():
                 self.onShow(event)
 
-    def loadHandler(self, human, values, strict):
-        if values[0] == "pose":
-            poseFile = values[1]
-            poseFile = getpath.thoroughFindFile(poseFile, self.paths)
-            if not os.path.isfile(poseFile):
-                if strict:
-                    raise RuntimeError("Could not load pose %s, file does not exist." % poseFile)
-                log.warning("Could not load pose %s, file does not exist.", poseFile)
-            else:
-                self.loadPose(poseFile)
-            return
-
-    def saveHandler(self, human, file):
-        if self.currentPose:
-            poseFile = getpath.getRelativePath(self.currentPose, self.paths)
-            file.write('pose %s\n' % poseFile)
-
 
 category = None
 taskview = None
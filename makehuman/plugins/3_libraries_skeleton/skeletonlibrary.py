@@ -50,6 +50,7 @@ import skeleton
 import skeleton_drawing
 import getpath
 import material
+import libraryhandlers
 
 import numpy as np
 import os
@@ -80,7 +81,7 @@ class SkeletonAction(gui3d.Action):
 #   class SkeletonLibrary
 #------------------------------------------------------------------------------------------
 
-class SkeletonLibrary(gui3d.TaskView, filecache.MetadataCacher):
+class SkeletonLibrary(gui3d.TaskView, filecache.MetadataCacher, libraryhandlers.SkeletonLibraryHandlers):
 
     def __init__(self, category):
         gui3d.TaskView.__init__(self, category, 'Skeleton')
@@ -318,21 +319,3 @@ class SkeletonLibrary(gui3d.TaskView, filecache.MetadataCacher):
             self.skelObj.setPosition(gui3d.app.selectedHuman.getPosition())
         if self.jointsObj:
             self.jointsObj.setPosition(gui3d.app.selectedHuman.getPosition())
-
-    def loadHandler(self, human, values, strict):
-        if values[0] == "skeleton":
-            skelFile = values[1]
-
-            skelFile = getpath.thoroughFindFile(skelFile, self.paths)
-            if not os.path.isfile(skelFile):
-                if strict:
-                    raise RuntimeError("Could not load rig %s, file does not exist." % skelFile)
-                log.warning("Could not load rig %s, file does not exist.", skelFile)
-            else:
-                self.chooseSkeleton(skelFile)
-            return
-
-    def saveHandler(self, human, file):
-        if human.getSkeleton():
-            rigFile = getpath.getRelativePath(self.selectedRig, self.paths)
-            file.write('skeleton %s\n' % rigFile)
@@ -48,6 +48,17 @@ import transformations as tm
 from math import pi
 D = pi/180
 
+COMPILED_BVH_EXT = '.mhbvh'
+COMPILED_BVH_VERSION = 1
+
+
+class CompiledBVHOptionsError(RuntimeError):
+    """
+    A compiled BVH file is up to date, but was compiled with options that
+    do not match the ones requested.
+    """
+    pass
+
 
 class BVH():
     """
@@ -59,12 +70,14 @@ class BVH():
         self.joints = {}    # Lookup dict to find joints by name
         self.bvhJoints = [] # List of joints in the order in which they were defined in the BVH file (important for MOTION data parsing)
         self.jointslist = []    # Cached breadth-first list of all joints
+        self._canonicalNames = None # Cached lookup dict of joint names by canonical name
         self.rootJoint = None   # TODO we assume only one root joint. Useful to allow multiple? (BVH spec allows multiple roots in theory)
 
         self.frameTime = -1
         self.frames = []
 
         self.convertFromZUp = False     # Set to true to convert the coordinates from a Z-is-up coordinate system. Most motion capture data uses Y-is-up, though.
+        self._autoAxis = False          # True if the coordinate system was guessed automatically when loading
         self.allowTranslation = "onlyroot"  # Joints to accept translation animation data for
 
     def addRootJoint(self, name):
@@ -86,6 +99,7 @@ class BVH():
         joint = BVHJoint(name, self)
         if joint.name != "End effector":
             self.joints[name] = joint
+            self._canonicalNames = None
         self.bvhJoints.append(joint)
         return joint
 
@@ -241,11 +255,14 @@ class BVH():
         return self.joints[name]
 
     def getJointByCanonicalName(self, canonicalName):
-        canonicalName = canonicalName.lower().replace(' ','_').replace('-','_')
-        for jointName in self.joints.keys():
-            if canonicalName == jointName.lower().replace(' ','_').replace('-','_'):
-                return self.getJoint(jointName)
-        return None
+        if self._canonicalNames is None:
+            self._canonicalNames = {}
+            for jointName in self.joints.keys():
+                self._canonicalNames.setdefault(_canonicalName(jointName), jointName)
+        jointName = self._canonicalNames.get(_canonicalName(canonicalName))
+        if jointName is None:
+            return None
+        return self.getJoint(jointName)
 
     def containsJoint(self, name):
         return name in self.joints
@@ -289,6 +306,7 @@ class BVH():
             raise RuntimeError('Cannot load BVH, illegal option for "convertFromZUp" (%s)' % self.convertFromZUp)
         else:
             autoAxis = False
+        self._autoAxis = autoAxis
 
         fp = open(filepath, "rU")
 
@@ -317,12 +335,7 @@ class BVH():
         words = self.__expectKeyword('Frame', fp) # Time:
         self.frameTime = float(words[2])
 
-        for i in range(self.frameCount):
-            line = fp.readline()
-            words = line.split()
-            data = [float(word) for word in words]
-            for joint in self.getJointsBVHOrder():
-                data = self.__processChannelData(joint, data)
+        self.__readMotion(fp)
 
         self.__cacheGetJoints()
 
@@ -330,6 +343,90 @@ class BVH():
         for joint in self.getJoints():
             joint.calculateFrames()     # TODO we don't need to calculate pose matrices for end effectors
 
+    def fromBinaryFile(self, filepath):
+        """
+        Load a compiled BVH file, written by writeToBinaryFile(), which stores
+        the decoded joint structure and pose matrices of a BVH file.
+        Raises a RuntimeError if the compiled file has an unsupported version,
+        and a CompiledBVHOptionsError if it is not compatible with the
+        convertFromZUp and allowTranslation options set on this BVH.
+        """
+        import os
+        import json
+        with np.load(filepath) as npzfile:
+            header = json.loads(npzfile['header'].tostring())
+            frames = npzfile['frames']
+            poses = npzfile['poses']
+
+        if header['version'] != COMPILED_BVH_VERSION:
+            raise RuntimeError('Compiled BVH file %s has unsupported version %s' % (filepath, header['version']))
+        if not (self.convertFromZUp == header['convertFromZUp'] or \
+                (self.convertFromZUp == "auto" and header['autoAxis'])):
+            raise CompiledBVHOptionsError('Compiled BVH file %s was compiled with different axis conversion' % filepath)
+        if not (self.allowTranslation == header['allowTranslation'] or header['allowTranslation'] == "all"):
+            raise CompiledBVHOptionsError('Compiled BVH file %s was compiled with different translation options' % filepath)
+
+        self.name = os.path.splitext(os.path.basename(filepath))[0]
+        self.frameCount = header['frameCount']
+        self.frameTime = header['frameTime']
+
+        # Stored joint offsets are already converted to the Y-up axis system
+        self.convertFromZUp = False
+        for jointDef in header['joints']:
+            name = jointDef['name'].encode('utf-8')
+            if jointDef['parent'] < 0:
+                joint = self.addRootJoint(name)
+            else:
+                joint = self.addJoint(self.bvhJoints[jointDef['parent']].name, name)
+            joint.channels = [str(channel) for channel in jointDef['channels']]
+            self.__calcPosition(joint, jointDef['offset'])
+        self.convertFromZUp = header['convertFromZUp']
+        self._autoAxis = header['autoAxis']
+
+        self.__distributeMotion(frames)
+        self.__cacheGetJoints()
+
+        pIdx = 0
+        for joint in self.getJointsBVHOrder():
+            if joint.isEndConnector():
+                joint.matrixPoses = animation.emptyTrack(self.frameCount)
+                continue
+            joint.matrixPoses = poses[pIdx]
+            pIdx += 1
+            if self.allowTranslation != header['allowTranslation']:
+                # Compiled with translations on all joints
+                if self.allowTranslation == "none" or (self.allowTranslation == "onlyroot" and joint.parent):
+                    joint.matrixPoses[:,:3,3] = 0
+
+    def writeToBinaryFile(self, filepath):
+        """
+        Write the decoded joint structure and pose matrices of this BVH to a
+        compiled BVH file (npz), that is faster to load than a BVH file.
+        """
+        import os
+        import json
+        joints = self.getJointsBVHOrder()
+        jointIdx = dict([(joint, idx) for idx, joint in enumerate(joints)])
+        header = dict(
+            version = COMPILED_BVH_VERSION,
+            frameCount = self.frameCount,
+            frameTime = self.frameTime,
+            convertFromZUp = bool(self.convertFromZUp),
+            autoAxis = self._autoAxis,
+            allowTranslation = self.allowTranslation,
+            joints = [dict(name = joint.name,
+                           parent = jointIdx[joint.parent] if joint.parent else -1,
+                           offset = [float(o) for o in joint.offset],
+                           channels = joint.channels) for joint in joints]
+        )
+        frames = np.hstack([joint.frames.reshape((self.frameCount, len(joint.channels))) for joint in joints])
+        poses = np.asarray([joint.matrixPoses for joint in joints if not joint.isEndConnector()], dtype=np.float32)
+
+        fp = open(filepath, 'wb')
+        np.savez(fp, header=np.fromstring(json.dumps(header), dtype='S1'), frames=frames, poses=poses)
+        fp.close()
+        os.utime(filepath, None)  # Ensure modification time is updated
+
     def _autoGuessCoordinateSystem(self):
         """
         Guesses whether this BVH rig uses a Y-up or Z-up axis system, using the
@@ -567,16 +664,37 @@ class BVH():
             else:
                 raise RuntimeError('Expected %s found %s' % ('JOINT, End Site or }', words[0]))
 
-    def __processChannelData(self, joint, data):
+    def __readMotion(self, fp):
         """
-        Distribute animation channel data for one frame or motion sample, 
-        loaded from a BVH file, among the joints of the skeleton structure.
+        Read the motion data of all frames at once, and distribute it among
+        the joints of the skeleton structure.
         """
-        nChannels = len(joint.channels)
-        joint.frames.extend(data[:nChannels])
-        data = data[nChannels:]
-
-        return data
+        joints = self.getJointsBVHOrder()
+        nChannels = sum([len(joint.channels) for joint in joints])
+        text = fp.read()
+
+        data = np.fromstring(text, dtype=np.float64, sep=' ')
+        if len(data) != self.frameCount * nChannels:
+            # Irregular motion data (eg. trailing values on some lines), fall
+            # back to parsing line by line
+            log.debug("Irregular BVH motion data, parsing frames line by line")
+            lines = text.splitlines()[:self.frameCount]
+            data = [[float(word) for word in line.split()[:nChannels]] for line in lines]
+            if len(data) < self.frameCount or min([len(frame) for frame in data]) < nChannels:
+                raise RuntimeError('Expected %s frames with %s channels of motion data' % (self.frameCount, nChannels))
+            data = np.asarray(data, dtype=np.float64)
+        self.__distributeMotion(data.astype(np.float32).reshape((self.frameCount, nChannels)))
+
+    def __distributeMotion(self, data):
+        """
+        Distribute the motion data of all frames, one row per frame, among the
+        joints of the skeleton structure.
+        """
+        offset = 0
+        for joint in self.getJointsBVHOrder():
+            nJointChannels = len(joint.channels)
+            joint.frames = data[:,offset:offset+nJointChannels].ravel()
+            offset += nJointChannels
 
     def __calcPosition(self, joint, offset):
         """
@@ -727,15 +845,7 @@ class BVHJoint():
             # TODO allow partial rotation channels too?
             pass
         elif len(rotAngles) >= 3:
-            for frameIdx in range(nFrames):
-                self.matrixPoses[frameIdx,:3,:3] = tm.euler_matrix(rotAngles[2][frameIdx], rotAngles[1][frameIdx], rotAngles[0][frameIdx], axes=rotOrder)[:3,:3]
-
-            # TODO eliminate loop with numpy?
-            '''
-            for rotAngle in rotAngles:  
-                self.matrixPoses[:] = tm.euler_matrix(rotAngle[2], rotAngle[1], rotAngle[0], axes=rotOrder))
-            # unfortunately tm.euler_matrix is not a np ufunc
-            '''
+            self.matrixPoses[:,:3,:3] = eulerMatrices(rotAngles[2], rotAngles[1], rotAngles[0], axes=rotOrder)
 
         # Add translations to pose matrices
         # Allow partial transformation channels too
@@ -776,6 +886,66 @@ class BVHJoint():
         return not self.hasChildren()
 
 
+def eulerMatrices(ai, aj, ak, axes='sxyz'):
+    """
+    Vectorized version of transformations.euler_matrix(), calculates the
+    rotation matrices for arrays of Euler angles all at once.
+
+    ai, aj, ak  arrays of n Euler angles (in radians)
+    axes        one of the 24 axis sequences as string or encoded tuple
+
+    returns     np.array((n, 3, 3), dtype=float64)
+    """
+    try:
+        firstaxis, parity, repetition, frame = tm._AXES2TUPLE[axes]
+    except (AttributeError, KeyError):
+        tm._TUPLE2AXES[axes]  # validation
+        firstaxis, parity, repetition, frame = axes
+
+    i = firstaxis
+    j = tm._NEXT_AXIS[i+parity]
+    k = tm._NEXT_AXIS[i-parity+1]
+
+    ai = np.asarray(ai, dtype=np.float64)
+    aj = np.asarray(aj, dtype=np.float64)
+    ak = np.asarray(ak, dtype=np.float64)
+    if frame:
+        ai, ak = ak, ai
+    if parity:
+        ai, aj, ak = -ai, -aj, -ak
+
+    si, sj, sk = np.sin(ai), np.sin(aj), np.sin(ak)
+    ci, cj, ck = np.cos(ai), np.cos(aj), np.cos(ak)
+    cc, cs = ci*ck, ci*sk
+    sc, ss = si*ck, si*sk
+
+    M = np.empty((len(ai), 3, 3), dtype=np.float64)
+    if repetition:
+        M[:, i, i] = cj
+        M[:, i, j] = sj*si
+        M[:, i, k] = sj*ci
+        M[:, j, i] = sj*sk
+        M[:, j, j] = -cj*ss+cc
+        M[:, j, k] = -cj*cs-sc
+        M[:, k, i] = -sj*ck
+        M[:, k, j] = cj*sc+cs
+        M[:, k, k] = cj*cc-ss
+    else:
+        M[:, i, i] = cj*ck
+        M[:, i, j] = sj*sc-cs
+        M[:, i, k] = sj*cc+ss
+        M[:, j, i] = cj*sk
+        M[:, j, j] = sj*ss+cc
+        M[:, j, k] = sj*cs-sc
+        M[:, k, i] = -sj
+        M[:, k, j] = cj*si
+        M[:, k, k] = cj*ci
+    return M
+
+
+def _canonicalName(name):
+    return name.lower().replace(' ','_').replace('-','_')
+
 def load(filename, convertFromZUp="auto", allowTranslation="onlyroot"):
     """
     convertFromZUp      determine whether to convert the joint structure from
@@ -784,11 +954,61 @@ def load(filename, convertFromZUp="auto", allowTranslation="onlyroot"):
                         (allowed values: "auto", True, False)
     allowTranslation    determine which should receive translation animation 
                         (allowed values: "onlyroot", "all", "none")
+
+    Loads the compiled version of the BVH file if it is available and up to
+    date, and compiles it otherwise (only for files in the user data path).
     """
+    import os
+    import getpath
+
+    compiledPath = os.path.splitext(filename)[0] + COMPILED_BVH_EXT
+    compiledUpToDate = False
+    try:
+        if not os.path.isfile(compiledPath):
+            raise RuntimeError('compiled BVH file missing: %s' % compiledPath)
+        if os.path.isfile(filename) and os.path.getmtime(filename) > os.path.getmtime(compiledPath):
+            raise RuntimeError('compiled BVH file out of date: %s' % compiledPath)
+        result = BVH()
+        result.convertFromZUp = convertFromZUp
+        result.allowTranslation = allowTranslation
+        result.fromBinaryFile(compiledPath)
+        return result
+    except CompiledBVHOptionsError as e:
+        # Requested options differ from the compiled ones, parse the BVH file
+        # but keep the compiled file, that suits the default options
+        log.debug("Not loading compiled BVH: %s", e)
+        compiledUpToDate = True
+    except Exception as e:
+        showTrace = not isinstance(e, RuntimeError)
+        log.debug("Not loading compiled BVH: %s", e, exc_info=showTrace)
+
     result = BVH()
     result.convertFromZUp = convertFromZUp
     result.allowTranslation = allowTranslation
     result.fromFile(filename)
+
+    if not compiledUpToDate and getpath.isSubPath(compiledPath, getpath.getPath()):
+        # Only write compiled BVH files to user data path
+        try:
+            log.debug('Compiling BVH file %s', compiledPath)
+            # Compile with the options that suit every caller, like
+            # compile_animations.py does
+            if convertFromZUp == "auto" and allowTranslation == "all":
+                compiled = result
+            else:
+                compiled = BVH()
+                compiled.convertFromZUp = "auto"
+                compiled.allowTranslation = "all"
+                compiled.fromFile(filename)
+            compiled.writeToBinaryFile(compiledPath)
+        except StandardError:
+            log.notice('unable to save compiled BVH file: %s', compiledPath, exc_info=True)
+            if os.path.isfile(compiledPath):
+                # Remove file again, in case an empty file is left
+                try:
+                    os.remove(compiledPath)
+                except Exception as e:
+                    log.warning("Could not remove empty file %s that was left behind (%s).", compiledPath, e)
     return result
 
 def createFromSkeleton(skel, animationTrack=None, dummyJoints=True):
@@ -38,11 +38,11 @@ TODO
 
 import os
 import math
+import weakref
 import numpy as np
 from core import G
 import getpath
 import log
-from collections import OrderedDict
 import makehuman
 
 import material
@@ -92,6 +92,8 @@ class Proxy:
         self.ref_vIdxs = None       # (Vidx1,Vidx2,Vidx3,(Vidx4)) list with references to human vertex indices, indexed by proxy vert
         self.weights = None         # (w1,w2,w3) list, with weights per human vertex (mapped by ref_vIdxs), indexed by proxy vert
         self.vertWeights = {}       # (proxy-vert, weight) list for each parent vert (reverse mapping of self.weights, indexed by human vertex)
+        self._vertexMapping = None  # Cached sparse matrix form of vertWeights, see getVertexMapping()
+        self._transferredWeights = weakref.WeakKeyDictionary()  # Cached vertex bone weights by human weights
         self.offsets = None         # (x,y,z) list of vertex offsets, indexed by proxy vert
 
         self.vertexBoneWeights = None   # Explicitly defined custom vertex-to-bone weights, connecting the proxy mesh to the reference skeleton (optional)
@@ -182,6 +184,7 @@ class Proxy:
         Final step in parsing/loading a proxy file. Initializes numpy structures
         for performance improvement.
         """
+        self._clearVertexMapping()
         self.weights = np.asarray([v._weights for v in refVerts], dtype=np.float32)
         self.ref_vIdxs = np.asarray([v._verts for v in refVerts], dtype=np.uint32)
         if self.new_fitting:
@@ -198,6 +201,7 @@ class Proxy:
         """
         Reconstruct reverse vertex (and weights) mapping
         """
+        self._clearVertexMapping()
         self.vertWeights = {}
         if self.new_fitting:
             w = 1.0 / self.human.meshData.vertsPerPrimitive
@@ -212,6 +216,29 @@ class Proxy:
                 _addProxyVertWeight(self.vertWeights, self.ref_vIdxs[pxy_vIdx, 1], pxy_vIdx, self.weights[pxy_vIdx, 1])
                 _addProxyVertWeight(self.vertWeights, self.ref_vIdxs[pxy_vIdx, 2], pxy_vIdx, self.weights[pxy_vIdx, 2])
 
+    def _clearVertexMapping(self):
+        self._vertexMapping = None
+        self._transferredWeights = weakref.WeakKeyDictionary()
+
+    def getVertexMapping(self):
+        """
+        The mapping of human vertices to proxy vertices used for transferring
+        vertex bone weights (the same mapping as self.vertWeights), as a sparse
+        proxy verts x human verts matrix in coordinate format:
+        (proxy vertex indices, human vertex indices, weights)
+        """
+        if self._vertexMapping is None:
+            nRefs = self.ref_vIdxs.shape[1]
+            if self.new_fitting:
+                # Influence of vertex weights is equally divided over the
+                # verts of the face a proxy vert is fitted against
+                weights = np.repeat(1.0 / self.human.meshData.vertsPerPrimitive, self.ref_vIdxs.size)
+            else:
+                weights = self.weights[:,:nRefs].ravel()
+            pxy_vIdxs = np.repeat(np.arange(len(self.ref_vIdxs), dtype=np.uint32), nRefs)
+            self._vertexMapping = (pxy_vIdxs, self.ref_vIdxs.ravel(), weights)
+        return self._vertexMapping
+
     def getCoords(self, fit_to_posed=False):
         if fit_to_posed:
             hcoord = self.human.meshData.coord
@@ -238,66 +265,26 @@ class Proxy:
         but most importantly, it's a lot easier to create proxies using this
         fitting technique.
         """
-        def average_basis_matrices(vec0, vec1, vec2, normalize=True):
-            if normalize:
-                vec0 /= np.sqrt(np.sum(vec0 ** 2, axis=-1))[:,None]
-                vec1 /= np.sqrt(np.sum(vec1 ** 2, axis=-1))[:,None]
-                vec2 /= np.sqrt(np.sum(vec2 ** 2, axis=-1))[:,None]
-
-            M = np.zeros((len(vec0), 3,3), dtype=np.float32)
-            M[:,:,0] = vec0
-            M[:,:,1] = vec1
-            M[:,:,2] = vec2
-            return M
-
-        hmesh = self.human.meshData
         if fit_to_posed:
             hcoord = self.human.meshData.coord
         else:
             hcoord = self.human.getRestposeCoordinates()
-
-        # Inputs:
-        # ref_vIdxs: basemesh vertex indices (a quad), format: [[vidx1,vidx2,vidx3,vidx4], ...] every inner list a face
-        # deltas: delta vectors in face-local space, format: [[d1,d2,d3], ...]
-        verts = hcoord[self.ref_vIdxs]
-
-        # Calculate polygon centers (naive way: take the average, same as Blender)
-        centers = np.sum(verts, axis=1) / hmesh.vertsPerPrimitive
-
-        # Calculate normals
-        v1 = verts[:,0,:]
-        v2 = verts[:,1,:]
-        v3 = verts[:,2,:]
-        va = v1 - v2
-        vb = v1 - v3
-        normals = np.cross(va, vb)
-        if not fast and hmesh.vertsPerPrimitive == 4:
-            # In case of quads
-            # TODO we can speed up if we assume planar quads, so triangle normal should be enough
-            v4 = verts[:,3,:]
-            vc = v3 - v4
-            normals2 = np.cross(vb, vc)
-            normals = np.sqrt(normals **2 + normals2 **2)  # average normals
-
-        # Calculate local base matrix
-        vec0 = normals
-        vec1 = centers - v1
-        vec2 = np.cross(centers, vec1)
-        M = average_basis_matrices(vec0, vec1, vec2)
-
-        # Calculate proxy mesh coordinates (delta_vectors = M * deltas)
-        #delta_vectors = np.sum(M * deltas[:,None,:], axis=-1)
-        # Might be slightly faster:
-        delta_vectors = np.einsum('ijk,ikl -> ij', M, self.deltas[:,:,None])
-        return centers + delta_vectors
+        return _fitToFaces(hcoord, self.ref_vIdxs, self.deltas,
+                           self.human.meshData.vertsPerPrimitive, fast)
 
     @property
     def new_fitting(self):
         return self.version >= 120
 
-    def update(self, mesh, fit_to_posed=False, fast=False):
+    def update(self, mesh, fit_to_posed=False, fast=False, coords=None):
+        """
+        Fit the proxy mesh to the human. Coordinates already fitted for this
+        proxy, as returned by fitProxies(), can be passed using coords.
+        """
         #log.debug("Updating proxy %s.", self.name)
-        if self.new_fitting:
+        if coords is not None:
+            proxy_coords = coords
+        elif self.new_fitting:
             proxy_coords = self.getCoordsNew(fit_to_posed, fast)
         else:
             # Old v1.0 fitting algorithm
@@ -345,33 +332,253 @@ class Proxy:
         # The current skeleton is retrieved from the human object linked to this
         # proxy.
         if self.hasCustomVertexWeights():
-            # TODO we could introduce caching of weights here as long as the skeleton is not changed
             if skel is None:
                 return self.human.getBaseSkeleton().getVertexWeights(self.vertexBoneWeights, force_remap=True)
             else:
                 return skel.getVertexWeights(self.vertexBoneWeights, force_remap=True)
 
         # Remap weights through proxy mapping
-        WEIGHT_THRESHOLD = 1e-4  # Threshold for including bone weight
-        weights = OrderedDict()
+        weights = self._transferredWeights.get(humanWeights)
+        if weights is None:
+            weights = humanWeights.transferred(self.getVertexMapping())#, vertexCount)
+            self._transferredWeights[humanWeights] = weights
+        return weights
 
-        for bname, (indxs, wghts) in humanWeights.data.items():
-            vgroup = []
-            empty = True
-            for (v,wt) in zip(indxs, wghts):
-                try:
-                    vlist = self.vertWeights[v]
-                except KeyError:
-                    vlist = []
-                for (pv, w) in vlist:
-                    pw = w*wt
-                    if (pw > WEIGHT_THRESHOLD):
-                        vgroup.append((pv, pw))
-                        empty = False
-            if not empty:
-                weights[bname] = vgroup
-        
-        return humanWeights.create(weights)#, vertexCount)
+
+def _faceBases(hcoord, ref_vIdxs, vertsPerPrimitive, fast=False):
+    """
+    Calculate the centers and the local base matrices of the basemesh faces
+    referenced by the rows of ref_vIdxs, as used by the new proxy fitting
+    technique.
+    """
+    def average_basis_matrices(vec0, vec1, vec2, normalize=True):
+        if normalize:
+            vec0 /= np.sqrt(np.sum(vec0 ** 2, axis=-1))[:,None]
+            vec1 /= np.sqrt(np.sum(vec1 ** 2, axis=-1))[:,None]
+            vec2 /= np.sqrt(np.sum(vec2 ** 2, axis=-1))[:,None]
+
+        M = np.zeros((len(vec0), 3,3), dtype=np.float32)
+        M[:,:,0] = vec0
+        M[:,:,1] = vec1
+        M[:,:,2] = vec2
+        return M
+
+    # Inputs:
+    # ref_vIdxs: basemesh vertex indices (a quad), format: [[vidx1,vidx2,vidx3,vidx4], ...] every inner list a face
+    verts = hcoord[ref_vIdxs]
+
+    # Calculate polygon centers (naive way: take the average, same as Blender)
+    centers = np.sum(verts, axis=1) / vertsPerPrimitive
+
+    # Calculate normals
+    v1 = verts[:,0,:]
+    v2 = verts[:,1,:]
+    v3 = verts[:,2,:]
+    va = v1 - v2
+    vb = v1 - v3
+    normals = np.cross(va, vb)
+    if not fast and vertsPerPrimitive == 4:
+        # In case of quads
+        # TODO we can speed up if we assume planar quads, so triangle normal should be enough
+        v4 = verts[:,3,:]
+        vc = v3 - v4
+        normals2 = np.cross(vb, vc)
+        normals = np.sqrt(normals **2 + normals2 **2)  # average normals
+
+    # Calculate local base matrix
+    vec0 = normals
+    vec1 = centers - v1
+    vec2 = np.cross(centers, vec1)
+    M = average_basis_matrices(vec0, vec1, vec2)
+    return centers, M
+
+def _fitToFaces(hcoord, ref_vIdxs, deltas, vertsPerPrimitive, fast=False, faceIdxs=None):
+    """
+    Place proxy vertices at their offset (deltas, in face-local space) from
+    the basemesh faces they reference.
+    If faceIdxs is given, ref_vIdxs contains only the unique reference faces
+    and faceIdxs maps every proxy vertex to its face in ref_vIdxs.
+    """
+    centers, M = _faceBases(hcoord, ref_vIdxs, vertsPerPrimitive, fast)
+    if faceIdxs is not None:
+        centers = centers[faceIdxs]
+        M = M[faceIdxs]
+    return _applyOffsets(centers, M, deltas)
+
+def _applyOffsets(centers, M, deltas):
+    """
+    Transform face-local offsets to mesh coordinates, given the center and
+    local base matrix of the face referenced by each proxy vertex.
+    """
+    # Calculate proxy mesh coordinates (delta_vectors = M * deltas)
+    #delta_vectors = np.sum(M * deltas[:,None,:], axis=-1)
+    # Might be slightly faster:
+    delta_vectors = np.einsum('ijk,ikl -> ij', M, deltas[:,:,None])
+    return centers + delta_vectors
+
+
+class ProxyFitter(object):
+    """
+    Fits a set of proxies to their human in a single vectorized pass.
+    The reference faces and offsets of all proxies using the new fitting
+    technique are stacked into one problem, in which the local base of every
+    basemesh face shared between proxies is calculated only once, and the
+    results are split back per proxy.
+    Proxies using the old fitting technique are fitted one by one.
+
+    The face bases of the last fit are kept, so that a following fit can be
+    restricted to the proxy vertices referencing faces of which a vertex
+    moved, as reported by a modifier while a slider is being dragged. This
+    assumes the human mesh was not changed in any other way in between. Any
+    fit without a set of changed vertices, or with different fitting options,
+    recalculates everything.
+    """
+
+    def __init__(self, human):
+        self.human = human
+        self._proxies = []
+        self._refVIdxs = []
+        self._refFaces = None
+        self._faceIdxs = None
+        self._deltas = None
+        self._offsets = None
+        self._fitted = None
+        self._fittedKey = None
+        self._bases = None
+
+    def _build(self, proxies):
+        """
+        (Re)build the stacked fitting problem for the specified proxies.
+        """
+        newProxies = [pxy for pxy in proxies if pxy.new_fitting]
+        self._proxies = list(proxies)
+        self._bases = None
+        self._refVIdxs = [pxy.ref_vIdxs for pxy in newProxies]
+        if not newProxies:
+            self._refFaces = self._faceIdxs = self._deltas = None
+            self._offsets = {}
+            return
+
+        # Reference faces shared between proxy vertices are fitted only once
+        refVIdxs = np.ascontiguousarray(np.concatenate([pxy.ref_vIdxs for pxy in newProxies]))
+        rows = refVIdxs.view(np.dtype((np.void, refVIdxs.dtype.itemsize * refVIdxs.shape[1])))[:,0]
+        _, firstIdxs, self._faceIdxs = np.unique(rows, return_index=True, return_inverse=True)
+        self._refFaces = refVIdxs[firstIdxs]
+        self._deltas = np.concatenate([pxy.deltas for pxy in newProxies])
+        counts = [len(pxy.ref_vIdxs) for pxy in newProxies]
+        ends = np.cumsum(counts)
+        self._offsets = dict( (id(pxy), (end-count, end)) for pxy, count, end in zip(newProxies, counts, ends) )
+
+    def _isBuilt(self, proxies):
+        if len(proxies) != len(self._proxies):
+            return False
+        if any(p is not q for p, q in zip(proxies, self._proxies)):
+            return False
+        newProxies = [pxy for pxy in proxies if pxy.new_fitting]
+        return len(newProxies) == len(self._refVIdxs) and \
+               all(pxy.ref_vIdxs is r for pxy, r in zip(newProxies, self._refVIdxs))
+
+    def invalidate(self):
+        """
+        Discard the face bases kept from the last fit.
+        """
+        self._bases = None
+        self._fitted = None
+        self._fittedKey = None
+
+    def fit(self, proxies, fit_to_posed=False, fast=False, changedVerts=None):
+        """
+        Calculate the fitted mesh coordinates of the specified proxies.
+        Returns a list with the coordinates of each proxy, in the same order.
+        If changedVerts is specified, only the proxy vertices referencing
+        faces containing one of these human vertices are refitted, if
+        possible.
+        """
+        proxies = list(proxies)
+        if not self._isBuilt(proxies):
+            self._build(proxies)
+
+        if self._refFaces is not None:
+            if fit_to_posed:
+                hcoord = self.human.meshData.coord
+            else:
+                hcoord = self.human.getRestposeCoordinates()
+            vertsPerPrimitive = self.human.meshData.vertsPerPrimitive
+            options = (fit_to_posed, fast)
+            if changedVerts is not None and self._bases is not None and \
+               self._bases[0] == options:
+                # Only refit around the faces that moved
+                _, centers, M, coords = self._bases
+                vmask = np.zeros(len(hcoord), dtype=bool)
+                vmask[changedVerts] = True
+                faceMask = vmask[self._refFaces].any(axis=1)
+                faces = np.flatnonzero(faceMask)
+                rows = np.flatnonzero(faceMask[self._faceIdxs])
+                if len(rows):
+                    centers, M, coords = centers.copy(), M.copy(), coords.copy()
+                    centers[faces], M[faces] = _faceBases(hcoord, self._refFaces[faces], vertsPerPrimitive, fast)
+                    faceIdxs = self._faceIdxs[rows]
+                    coords[rows] = _applyOffsets(centers[faceIdxs], M[faceIdxs], self._deltas[rows])
+            else:
+                centers, M = _faceBases(hcoord, self._refFaces, vertsPerPrimitive, fast)
+                coords = _applyOffsets(centers[self._faceIdxs], M[self._faceIdxs], self._deltas)
+            self._bases = (options, centers, M, coords)
+
+        result = []
+        for pxy in proxies:
+            if pxy.new_fitting:
+                start, end = self._offsets[id(pxy)]
+                result.append(coords[start:end])
+            else:
+                # Old v1.0 fitting algorithm
+                result.append(pxy.getCoords(fit_to_posed))
+        return result
+
+    def fitForEvent(self, event, proxies, fit_to_posed=False, fast=False):
+        """
+        Calculate the fitted coordinates of the specified proxies in response
+        to a human event. The first request for an event fits all proxies of
+        the human at once, so that every library responding to the same event
+        reuses the result of that single pass.
+        Modifier events carrying the human vertices they moved (verts) are
+        fitted incrementally.
+        """
+        if self._fittedKey is None or self._fittedKey[0] is not event or \
+           self._fittedKey[1:] != (fit_to_posed, fast):
+            self._fitted = None
+
+        proxies = list(proxies)
+        if self._fitted is None or any(id(pxy) not in self._fitted for pxy in proxies):
+            allProxies = self.human.getProxies(includeHumanProxy=False)
+            allProxies += [pxy for pxy in proxies if not any(pxy is p for p in allProxies)]
+            coords = self.fit(allProxies, fit_to_posed, fast, getattr(event, 'verts', None))
+            self._fitted = dict( (id(pxy), c) for pxy, c in zip(allProxies, coords) )
+            self._fittedKey = (event, fit_to_posed, fast)
+        return [self._fitted[id(pxy)] for pxy in proxies]
+
+_fitters = weakref.WeakKeyDictionary()
+
+def getProxyFitter(human):
+    """
+    Get the proxy fitter shared by all users of the specified human.
+    """
+    fitter = _fitters.get(human)
+    if fitter is None:
+        fitter = ProxyFitter(human)
+        _fitters[human] = fitter
+    return fitter
+
+def fitProxies(human, proxies, fit_to_posed=False, fast=False, event=None):
+    """
+    Fit the specified proxies to the human in one vectorized pass, returns
+    the list of fitted coordinates for the proxies.
+    When an event is specified, the result is shared with other requests
+    made in response to the same event.
+    """
+    fitter = getProxyFitter(human)
+    if event is None:
+        return fitter.fit(proxies, fit_to_posed, fast)
+    return fitter.fitForEvent(event, proxies, fit_to_posed, fast)
 
 
 doRefVerts = 1
@@ -75,6 +75,7 @@ class Skeleton(object):
 
         self.bones = {}     # Bone lookup list by name
         self.boneslist = None  # Breadth-first ordered list of all bones
+        self._boneHierarchy = None  # Cached parent indices and hierarchy levels of boneslist
         self.roots = []     # Root bones of this skeleton, a skeleton can have multiple root bones.
 
         self.joint_pos_idxs = {}  # Lookup by joint name referencing vertex indices on the human, to determine joint position
@@ -84,6 +85,17 @@ class Skeleton(object):
         self.vertexWeights = None  # Source vertex weights, defined on the basemesh, for this skeleton
         self.has_custom_weights = False  # True if this skeleton has its own .mhw file
 
+        self._clearWeightsCache()
+
+    def _clearWeightsCache(self):
+        """
+        Invalidate the cached weight reference mappings and remapped vertex
+        weights, needs to be called when bones or weight references change.
+        """
+        import weakref
+        self._weightMappings = {}    # Weight reference mapping matrices by reference bone names
+        self._remappedWeights = weakref.WeakKeyDictionary()  # Remapped vertex weights by reference weights
+
     def fromFile(self, filepath, mesh=None):
         """
         Load skeleton from json rig file.
@@ -201,25 +213,49 @@ class Skeleton(object):
         When force_remap is True, weights will always be returned as referenceWeights
         remapped to this skeleton, this is for example needed when passing proxy
         vertexweights through this method.
+        Remapped weights are cached per referenceWeights object.
         Returns the vertex weights for this skeleton.
         """
-        from collections import OrderedDict
         if referenceWeights is None:
             return self.vertexWeights
         if not force_remap and self.vertexWeights is not None:
             return self.vertexWeights
 
         # Remap vertex weights from reference bones
-        weights = OrderedDict()
+        vertWeights = self._remappedWeights.get(referenceWeights)
+        if vertWeights is None:
+            boneNames = [bone.name for bone in self.getBones()]
+            mapping = self.getWeightReferenceMapping(referenceWeights.data.keys())
+            vertWeights = referenceWeights.remapped(boneNames, mapping, rootBone=self.roots[0].name)
+            self._remappedWeights[referenceWeights] = vertWeights
+        if self.vertexWeights is None:
+            self.vertexWeights = vertWeights
+        return vertWeights
 
-        for bone in self.getBones():
-            b_weights = []
+    def getWeightReferenceMapping(self, referenceBoneNames):
+        """
+        Mapping of the bones of a reference skeleton (with the specified bone
+        names) to the bones of this skeleton, for remapping vertex weights.
+        Returns the mapping as a sparse nBones x len(referenceBoneNames) matrix
+        in coordinate format (rows, cols), with rows the indices of bones in
+        getBones() and cols the indices of their weight reference bones in
+        referenceBoneNames. The mapping is cached until the bones or their
+        weight references change.
+        """
+        key = tuple(referenceBoneNames)
+        if key in self._weightMappings:
+            return self._weightMappings[key]
+
+        refIdxs = dict([(rbname, idx) for idx, rbname in enumerate(referenceBoneNames)])
+        rows = []
+        cols = []
+        for bIdx, bone in enumerate(self.getBones()):
             if len(bone.weight_reference_bones) > 0:
                 add_count = 0
                 for rbname in bone.weight_reference_bones:
-                    if rbname in referenceWeights.data:
-                        vrts,wghs = referenceWeights.data[rbname]
-                        b_weights.extend( zip(vrts,wghs) )
+                    if rbname in refIdxs:
+                        rows.append(bIdx)
+                        cols.append(refIdxs[rbname])
                         add_count += 1
                     else:
                         if not makehuman.isRelease():
@@ -240,10 +276,10 @@ class Skeleton(object):
                         log.warning("No weights could be mapped to bone %s because all of its weight reference bones had no weights. This bone will not have any weights.", bone.name)
             else:
                 # Try to map by bone name
-                if bone.name in referenceWeights.data:
+                if bone.name in refIdxs:
                     # Implicitly map bone by name to reference skeleton weights
-                    vrts,wghs = referenceWeights.data[bone.name]
-                    b_weights = zip(vrts,wghs)
+                    rows.append(bIdx)
+                    cols.append(refIdxs[bone.name])
                 else:
                     if not makehuman.isRelease():
                         # This warning is emitted when no matching bones in the reference skeleton can be found, and
@@ -254,13 +290,9 @@ class Skeleton(object):
                         # weights.
                         log.warning("No explicit weight reference bone mapping for bone %s, and cannot implicitly map by name. This bone will not have any weights. This might be normal if this is for example a proxy only weighted to a few bones.", bone.name)
 
-            if len(b_weights) > 0:
-                weights[bone.name] = b_weights
-
-        vertWeights = referenceWeights.create(weights, vertexCount=referenceWeights.vertexCount, rootBone=self.roots[0].name)
-        if self.vertexWeights is None:
-            self.vertexWeights = vertWeights
-        return vertWeights
+        mapping = (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64))
+        self._weightMappings[key] = mapping
+        return mapping
 
     def hasCustomVertexWeights(self):
         return self.has_custom_weights
@@ -279,6 +311,7 @@ class Skeleton(object):
         :param referenceSkel: Reference skeleton to obtain structure from.
          This is the default or master skeleton.
         """
+        self._clearWeightsCache()
         included = dict()
         for bone in self.getBones():
             if bone._weight_reference_bones is None:
@@ -510,6 +543,7 @@ class Skeleton(object):
             raise RuntimeError("The skeleton %s already contains a bone named %s." % (self.__repr__(), name))
         bone = Bone(self, name, parentName, headJoint, tailJoint, roll, reference_bones, weight_reference_bones)
         self.bones[name] = bone
+        self._clearWeightsCache()
         if not parentName:
             self.roots.append(bone)
         return bone
@@ -646,6 +680,95 @@ class Skeleton(object):
             result.append(bone)
             queue.extend(bone.children)
         self.boneslist = result
+        self._boneHierarchy = None
+
+    def getBoneHierarchy(self):
+        """
+        Returns the hierarchy of this skeleton as a tuple (parents, levels),
+        with parents an array with the index of the parent of each bone in
+        getBones() (-1 for root bones), and levels a list of (start, end) index
+        ranges in getBones(), one per depth in the hierarchy. As bones are
+        ordered breadth-first, the bones of one level are contiguous and all
+        their parents are contained in the previous levels.
+        """
+        bones = self.getBones()
+        if self._boneHierarchy is None:
+            parents = np.array([bone.parent.index if bone.parent else -1 for bone in bones], dtype=np.int32)
+            depths = np.zeros(len(bones), dtype=np.int32)
+            for bIdx, pIdx in enumerate(parents):
+                if pIdx >= 0:
+                    depths[bIdx] = depths[pIdx] + 1
+            bounds = np.flatnonzero(np.diff(depths)) + 1
+            starts = [0] + bounds.tolist()
+            ends = bounds.tolist() + [len(bones)]
+            self._boneHierarchy = (parents, zip(starts, ends))
+        return self._boneHierarchy
+
+    def getPoseChain(self, poseData):
+        """
+        Accumulate the pose matrices of one or more frames down the bone
+        hierarchy, for all frames at once. The result depends only on the pose
+        data and the hierarchy of this skeleton, not on its joint positions,
+        and can be reused by getSkinningMatrices() as long as only the joint
+        positions change.
+
+        poseData    np.array((nFrames*nBones, 3, 4)) or np.array((nFrames*nBones, 4, 4))
+            pose matrices ordered per frame - per bone, as stored in an
+            AnimationTrack
+
+        returns     (rotations, translations) with
+                    rotations np.array((nFrames, nBones, 3, 3), dtype=float64)
+                    translations np.array((nFrames, nBones, 3), dtype=float64)
+        """
+        parents, levels = self.getBoneHierarchy()
+        nBones = len(parents)
+        poseData = np.asarray(poseData)
+        nFrames = len(poseData) // nBones
+        poseData = poseData[:nFrames*nBones,:3,:4].reshape((nFrames, nBones, 3, 4))
+
+        rotations = np.empty((nFrames, nBones, 3, 3), dtype=np.float64)
+        translations = np.empty((nFrames, nBones, 3), dtype=np.float64)
+        for start, end in levels:
+            if start == 0:
+                # Root bones
+                rotations[:,start:end] = poseData[:,start:end,:,:3]
+                translations[:,start:end] = poseData[:,start:end,:,3]
+                continue
+            parentRotations = rotations[:,parents[start:end]]
+            rotations[:,start:end] = np.matmul(parentRotations, poseData[:,start:end,:,:3])
+            translations[:,start:end] = translations[:,parents[start:end]] + \
+                np.einsum('fbij,fbj->fbi', parentRotations, poseData[:,start:end,:,3])
+        return rotations, translations
+
+    def getSkinningMatrices(self, poseChain):
+        """
+        Calculate the skinning matrices (matPoseVerts) of all bones for all
+        frames of a pose chain returned by getPoseChain(), using the current
+        joint positions of this skeleton. Gives the same result as setting the
+        pose of each frame with setPose() and collecting the matPoseVerts of
+        all bones, without modifying the pose of this skeleton.
+
+        returns     np.array((nFrames, nBones, 3, 4), dtype=float64)
+        """
+        rotations, translations = poseChain
+        parents, levels = self.getBoneHierarchy()
+        nFrames, nBones = rotations.shape[:2]
+        restHeads = np.array([bone.matRestGlobal[:3,3] for bone in self.getBones()], dtype=np.float64)
+
+        # Each bone rotates around its rest head position: the offset of bone
+        # b is (R_parent - R_b) * restHead_b, accumulated down the hierarchy
+        restFactors = -rotations
+        isChild = parents >= 0
+        restFactors[:,isChild] += rotations[:,parents[isChild]]
+        restFactors[:,~isChild] += np.identity(3)
+        offsets = np.einsum('fbij,bj->fbi', restFactors, restHeads)
+        for start, end in levels[1:]:
+            offsets[:,start:end] += offsets[:,parents[start:end]]
+
+        result = np.empty((nFrames, nBones, 3, 4), dtype=np.float64)
+        result[:,:,:,:3] = rotations
+        result[:,:,:,3] = translations + offsets
+        return result
 
     def getJointNames(self):
         """
@@ -38,12 +38,22 @@ Abstract
 """
 
 import os
+import re
+import itertools
 import module3d
 import codecs
 import math
 import numpy as np
 from codecs import open  # TODO should Wavefront OBJ files contain unicode characters, or would it be better to strip them?
 
+# Records of a Wavefront OBJ file, matched over the whole file buffer
+_vertexRe = re.compile(r'^[ \t]*v[ \t]+(\S+[ \t]+\S+[ \t]+\S+)', re.M)
+_uvRe = re.compile(r'^[ \t]*vt[ \t]+(\S+[ \t]+\S+)', re.M)
+_faceRe = re.compile(r'^[ \t]*f[ \t]+([^\n]*)', re.M)
+_groupRe = re.compile(r'^[ \t]*(g|o)[ \t]+(\S+)', re.M)
+# A face vertex (v, v/vt, v/vt/vn or v//vn), or the end of a face record
+_faceVertexRe = re.compile(r'(-?\d+)(?:/(-?\d*))?(?:/-?\d*)?|(\n)')
+
 def loadObjFile(path, obj = None):
     """
     Parse and load a Wavefront OBJ file as mesh.
@@ -54,89 +64,50 @@ def loadObjFile(path, obj = None):
         name = os.path.splitext( os.path.basename(path) )[0]
         obj = module3d.Object3D(name)
 
-    objFile = open(path, 'rU', encoding="utf-8")
+    with open(path, 'rb') as objFile:
+        data = objFile.read()
+    if '\r' in data:
+        data = data.replace('\r\n', '\n').replace('\r', '\n')
 
-    fg = None
-    mtl = None
+    verts = _parseFloats(path, _vertexRe.findall(data), 3)
+    uvs = _parseFloats(path, _uvRe.findall(data), 2)
 
-    verts = []
-    uvs = []
-    fverts = []
-    fuvs = []
-    groups = []
-    has_uv = False
-    materials = {}
+    # Face records are collected per stretch between group (g) and object (o)
+    # records, which determine the face group of the faces that follow them
+    fg = None
     faceGroups = {}
+    faceRecords = []
+    groups = []
+    pos = 0
+    for match in itertools.chain(_groupRe.finditer(data), [None]):
+        end = len(data) if match is None else match.start()
+        records = _faceRe.findall(data, pos, end)
+        if records:
+            if not fg:
+                if 0 not in faceGroups:
+                    faceGroups[0] = obj.createFaceGroup('default-dummy-group')
+                fg = faceGroups[0]
+            faceRecords.extend(records)
+            groups.append(np.repeat(fg.idx, len(records)))
+        if match is None:
+            break
+
+        command, name = match.group(1), match.group(2).decode('utf-8')
+        if command == 'g':
+            if name not in faceGroups:
+                faceGroups[name] = obj.createFaceGroup(name)
+            fg = faceGroups[name]
+        else:
+            obj.name = name
+        pos = match.end()
 
-    for objData in objFile:
-
-        lineData = objData.split()
-        if len(lineData) > 0:
-
-            command = lineData[0]
-
-            # Vertex coordinate
-            if command == 'v':
-                verts.append((float(lineData[1]), float(lineData[2]), float(lineData[3])))
-
-            # Vertex texture (UV) coordinate
-            elif command == 'vt':
-                uvs.append((float(lineData[1]), float(lineData[2])))
-
-            # Face definition (reference to vertex attributes)
-            elif command == 'f':
-                if not fg:
-                    if 0 not in faceGroups:
-                        faceGroups[0] = obj.createFaceGroup('default-dummy-group')
-                    fg = faceGroups[0]
-
-                uvIndices = []
-                vIndices = []
-                for faceData in lineData[1:]:
-                    vInfo = faceData.split('/')
-                    vIdx = int(vInfo[0]) - 1  # -1 because obj is 1 based list
-                    vIndices.append(vIdx)
-
-                    # If there are other data (uv, normals, etc)
-                    if len(vInfo) > 1 and vInfo[1] != '':
-                        uvIndex = int(vInfo[1]) - 1  # -1 because obj is 1 based list
-                        uvIndices.append(uvIndex)
-
-                if len(vIndices) == 3:
-                    vIndices.append(vIndices[0])
-                fverts.append(tuple(vIndices))
-
-                if len(uvIndices) > 0:
-                    if len(uvIndices) == 3:
-                        uvIndices.append(uvIndices[0])
-                    has_uv = True
-                if len(uvIndices) < 4:
-                    uvIndices = [0, 0, 0, 0]
-                fuvs.append(tuple(uvIndices))
-
-                groups.append(fg.idx)
-
-            elif command == 'g':
-                fgName = lineData[1]
-                if fgName not in faceGroups:
-                    faceGroups[fgName] = obj.createFaceGroup(fgName)
-                fg =  faceGroups[fgName]
-
-            elif command == 'usemtl':
-                pass # ignore materials
-
-            elif command == 'o':
-
-                obj.name = lineData[1]
-
-    objFile.close()
+    fverts, fuvs, has_uv = _parseFaces(path, faceRecords)
+    groups = np.concatenate(groups) if groups else np.zeros(0, dtype=np.uint16)
 
     # Sanity check for loose vertices
-    strayVerts = []
-    referencedVerts = set([ v for fvert in fverts for v in fvert ])
-    for vIdx in xrange(len(verts)):
-        if vIdx not in referencedVerts:
-            strayVerts.append(vIdx)
+    referenced = fverts.ravel()
+    referenced = np.bincount(referenced[referenced >= 0], minlength=len(verts))
+    strayVerts = np.flatnonzero(referenced[:len(verts)] == 0).tolist()
     if len(strayVerts) > 0:
         import log
         msg = "Error loading OBJ file %s: Contains loose vertices, not connected to a face (%s)"
@@ -152,6 +123,66 @@ def loadObjFile(path, obj = None):
 
     return obj
 
+def _parseFloats(path, records, ncols):
+    """
+    Convert the matched coordinate records of an OBJ file to an array with
+    ncols columns.
+    """
+    if not records:
+        return np.zeros(0, dtype=np.float64)
+    values = np.fromstring(' '.join(records), dtype=np.float64, sep=' ')
+    if len(values) != len(records) * ncols:
+        raise RuntimeError("Error loading OBJ file %s: Invalid coordinates" % path)
+    return values.reshape((len(records), ncols))
+
+def _stringLengths(strings):
+    return np.fromiter(itertools.imap(len, strings), dtype=np.int64, count=len(strings))
+
+def _parseIndices(strings):
+    """
+    Convert OBJ indices to zero-based indices. Empty strings are skipped.
+    """
+    return np.fromstring(' '.join(strings), dtype=np.int64, sep=' ') - 1  # -1 because obj is 1 based list
+
+def _parseFaces(path, records):
+    """
+    Convert the matched face records of an OBJ file to (nfaces, 4) arrays of
+    zero-based vertex and UV indices. Triangles are stored as quads that
+    repeat their first vertex. Faces that do not reference a UV coordinate
+    for at least three of their vertices get UV indices 0.
+    Returns the vertex indices, UV indices and whether any face referenced
+    UV coordinates.
+    """
+    nfaces = len(records)
+    if nfaces == 0:
+        return np.zeros((0, 4), dtype=np.int64), np.zeros((0, 4), dtype=np.int64), False
+
+    vIndices, uvIndices, ends = zip(*_faceVertexRe.findall('\n'.join(records) + '\n'))
+    isEnd = _stringLengths(ends) > 0
+    counts = np.diff(np.append(-1, np.flatnonzero(isEnd))) - 1
+    if counts.min() < 3 or counts.max() > 4:
+        raise RuntimeError("Error loading OBJ file %s: Only triangles and quads are supported" % path)
+
+    # Column indices within each face, triangles repeat their first vertex
+    columns = np.arange(4)[None,:]
+    starts = np.cumsum(counts) - counts
+    vIndices = _parseIndices(vIndices)
+    fverts = vIndices[starts[:,None] + np.where(columns < counts[:,None], columns, 0)]
+
+    hasUV = _stringLengths(uvIndices)[~isEnd] > 0
+    fuvs = np.zeros((nfaces, 4), dtype=np.int64)
+    if not hasUV.any():
+        return fverts, fuvs, False
+
+    # UV indices are taken in order from the vertices that specify one
+    uvIndices = _parseIndices(uvIndices)
+    uvCounts = np.add.reduceat(hasUV.astype(np.int64), starts)
+    uvStarts = np.cumsum(uvCounts) - uvCounts
+    valid = uvCounts >= 3
+    fuvs[valid] = uvIndices[uvStarts[valid,None] +
+                            np.where(columns < uvCounts[valid,None], columns, 0)]
+    return fverts, fuvs, True
+
 
 def writeObjFile(path, meshes, writeMTL=True, config=None, filterMaskedFaces=True):
     if not isinstance(meshes, list):
@@ -187,17 +218,17 @@ def writeObjFile(path, meshes, writeMTL=True, config=None, filterMaskedFaces=Tru
 
     # Vertices
     for mesh in meshes:
-        fp.write("".join( ["v %.4f %.4f %.4f\n" % tuple(co + offset) for co in mesh.coord] ))
+        _writeRows(fp, "v %.4f %.4f %.4f\n", mesh.coord, offset)
 
     # Vertex normals
     if config is None or config.useNormals:
         for mesh in meshes:
-            fp.write("".join( ["vn %.4f %.4f %.4f\n" % tuple(no) for no in mesh.vnorm] ))
+            _writeRows(fp, "vn %.4f %.4f %.4f\n", mesh.vnorm)
 
     # UV vertices
     for mesh in meshes:
         if mesh.has_uv:
-            fp.write("".join( ["vt %.6f %.6f\n" % tuple(uv) for uv in mesh.texco] ))
+            _writeRows(fp, "vt %.6f %.6f\n", mesh.texco)
 
     # Faces
     nVerts = 1
@@ -206,34 +237,28 @@ def writeObjFile(path, meshes, writeMTL=True, config=None, filterMaskedFaces=Tru
         fp.write("usemtl %s\n" % mesh.material.name)
         fp.write("g %s\n" % mesh.name)
 
+        fverts = mesh.fvert[mesh.face_mask].astype(np.int64) + nVerts
+        if mesh.has_uv:
+            fuvs = mesh.fuvs[mesh.face_mask].astype(np.int64) + nTexVerts
+
+        # Interleave the indices of the face vertices in the order in which
+        # they are formatted
         if config is None or config.useNormals:
             if mesh.has_uv:
-                for fn,fv in enumerate(mesh.fvert):
-                    if not mesh.face_mask[fn]:
-                        continue
-                    fuv = mesh.fuvs[fn]
-                    line = [" %d/%d/%d" % (fv[n]+nVerts, fuv[n]+nTexVerts, fv[n]+nVerts) for n in range(4)]
-                    fp.write("f" + "".join(line) + "\n")
+                fmt = " %d/%d/%d"
+                indices = [fverts, fuvs, fverts]
             else:
-                for fn,fv in enumerate(mesh.fvert):
-                    if not mesh.face_mask[fn]:
-                        continue
-                    line = [" %d//%d" % (fv[n]+nVerts, fv[n]+nVerts) for n in range(4)]
-                    fp.write("f" + "".join(line) + "\n")
+                fmt = " %d//%d"
+                indices = [fverts, fverts]
         else:
             if mesh.has_uv:
-                for fn,fv in enumerate(mesh.fvert):
-                    if not mesh.face_mask[fn]:
-                        continue
-                    fuv = mesh.fuvs[fn]
-                    line = [" %d/%d" % (fv[n]+nVerts, fuv[n]+nTexVerts) for n in range(4)]
-                    fp.write("f" + "".join(line) + "\n")
+                fmt = " %d/%d"
+                indices = [fverts, fuvs]
             else:
-                for fn,fv in enumerate(mesh.fvert):
-                    if not mesh.face_mask[fn]:
-                        continue
-                    line = [" %d" % (fv[n]+nVerts) for n in range(4)]
-                    fp.write("f" + "".join(line) + "\n")
+                fmt = " %d"
+                indices = [fverts]
+        faces = np.dstack(indices).reshape((len(fverts), 4 * len(indices)))
+        _writeRows(fp, "f" + fmt * 4 + "\n", faces)
 
         nVerts += len(mesh.coord)
         nTexVerts += len(mesh.texco)
@@ -250,6 +275,23 @@ def writeObjFile(path, meshes, writeMTL=True, config=None, filterMaskedFaces=Tru
         fp.close()
 
 
+# Number of rows formatted at once by the OBJ writer
+OBJ_WRITE_CHUNK_SIZE = 16384
+
+def _writeRows(fp, fmt, data, offset=None):
+    """
+    Write the rows of a 2D array to fp, each row formatted with format string
+    fmt. Rows are formatted and written in chunks of OBJ_WRITE_CHUNK_SIZE rows,
+    so the memory needed for the formatted text does not grow with the size
+    of the array. If offset is specified, it is added to each row.
+    """
+    for start in xrange(0, len(data), OBJ_WRITE_CHUNK_SIZE):
+        chunk = data[start:start+OBJ_WRITE_CHUNK_SIZE]
+        if offset is not None:
+            chunk = chunk + offset
+        fp.write((fmt * len(chunk)) % tuple(chunk.ravel().tolist()))
+
+
 #
 #   writeMaterial(fp, mat, config):
 #
@@ -0,0 +1,695 @@
+#!/usr/bin/python2.7
+# -*- coding: utf-8 -*-
+
+"""
+Performance benchmarks
+
+**Project Name:**      MakeHuman
+
+**Product Home Page:** http://www.makehuman.org/
+
+**Code Home Page:**    https://bitbucket.org/MakeHuman/makehuman/
+
+**Copyright(c):**      MakeHuman Team 2001-2017
+
+**Licensing:**         AGPL3
+
+    This file is part of MakeHuman (www.makehuman.org).
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as
+    published by the Free Software Foundation, either version 3 of the
+    License, or (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+Abstract
+--------
+
+Standalone script that benchmarks optimized code paths against the
+straightforward implementations they replace, and verifies that both produce
+the same results. Each benchmark returns whether the results agree, or None
+if it was skipped because the data it needs is not available.
+Run from the makehuman folder:
+
+    python testsuite/benchmark.py [benchmark ...]
+"""
+
+import sys
+sys.path = [".", "./core", "./lib", "./shared", "./apps"] + sys.path
+import os
+import time
+import tempfile
+import numpy as np
+from codecs import open
+
+
+def timeit(func, repeat=3):
+    """
+    Best wall clock time of repeat calls to func, and the result of the last
+    call.
+    """
+    best = None
+    for _ in xrange(repeat):
+        t = time.time()
+        result = func()
+        t = time.time() - t
+        if best is None or t < best:
+            best = t
+    return best, result
+
+def report(name, tOld, tNew, identical, tolerance=False):
+    """
+    Print the timings of a benchmark. Identical tells whether the results of
+    the old and new code agree, or if tolerance is True, whether they differ
+    no more than the benchmark allows.
+    """
+    if tolerance:
+        result = 'within tolerance' if identical else 'OUT OF TOLERANCE'
+    else:
+        result = 'identical' if identical else 'DIFFERENT'
+    print '%-45s old %8.3fs  new %8.3fs  speedup %6.1fx  %s' % \
+        (name, tOld, tNew, tOld / max(tNew, 1e-9), result)
+    return identical
+
+def loadBaseObject():
+    """
+    Object with the base mesh. Keep a reference to the object for as long as
+    the mesh is used, it provides the material of the mesh.
+    """
+    import files3d
+    import guicommon
+    import getpath
+    mesh = files3d.loadMesh(getpath.getSysDataPath("3dobjs/base.obj"), maxFaces = 5)
+    return guicommon.Object(mesh)
+
+
+### OBJ export
+
+def _writeObjFileReference(path, meshes, config=None):
+    """
+    Per row OBJ writer, as wavefront.writeObjFile was implemented before
+    it formatted whole arrays at once.
+    """
+    fp = open(path, 'w', encoding="utf-8")
+    fp.write(
+        "# MakeHuman exported OBJ\n" +
+        "# www.makehuman.org\n\n")
+    scale = config.scale if config is not None else 1.0
+    meshes = [m.clone(scale=scale, filterMaskedVerts=True) for m in meshes]
+    offset = [0,0,0]
+
+    for mesh in meshes:
+        fp.write("".join( ["v %.4f %.4f %.4f\n" % tuple(co + offset) for co in mesh.coord] ))
+    if config is None or config.useNormals:
+        for mesh in meshes:
+            fp.write("".join( ["vn %.4f %.4f %.4f\n" % tuple(no) for no in mesh.vnorm] ))
+    for mesh in meshes:
+        if mesh.has_uv:
+            fp.write("".join( ["vt %.6f %.6f\n" % tuple(uv) for uv in mesh.texco] ))
+
+    nVerts = 1
+    nTexVerts = 1
+    for mesh in meshes:
+        fp.write("usemtl %s\n" % mesh.material.name)
+        fp.write("g %s\n" % mesh.name)
+        for fn,fv in enumerate(mesh.fvert):
+            if not mesh.face_mask[fn]:
+                continue
+            if config is None or config.useNormals:
+                if mesh.has_uv:
+                    fuv = mesh.fuvs[fn]
+                    line = [" %d/%d/%d" % (fv[n]+nVerts, fuv[n]+nTexVerts, fv[n]+nVerts) for n in range(4)]
+                else:
+                    line = [" %d//%d" % (fv[n]+nVerts, fv[n]+nVerts) for n in range(4)]
+            else:
+                if mesh.has_uv:
+                    fuv = mesh.fuvs[fn]
+                    line = [" %d/%d" % (fv[n]+nVerts, fuv[n]+nTexVerts) for n in range(4)]
+                else:
+                    line = [" %d" % (fv[n]+nVerts) for n in range(4)]
+            fp.write("f" + "".join(line) + "\n")
+        nVerts += len(mesh.coord)
+        nTexVerts += len(mesh.texco)
+    fp.close()
+
+def benchmarkObjExport():
+    """
+    Export the base mesh and its subdivided version (with part of the faces
+    masked) to OBJ with both writers, and compare the files byte for byte.
+    """
+    import wavefront
+    import catmull_clark_subdivision as cks
+
+    class Config(object):
+        scale = 1.0
+        feetOnGround = False
+        def __init__(self, useNormals):
+            self.useNormals = useNormals
+
+    obj = loadBaseObject()
+    mesh = obj.mesh
+    subdivided = cks.createSubdivisionObject(mesh)
+    # Hide faces as clothes with delete groups do
+    mask = np.ones(mesh.getFaceCount(), dtype=bool)
+    mask[::3] = False
+    mesh.changeFaceMask(mask)
+    subdivided.changeFaceMask(mask)
+    meshes = [mesh, subdivided]
+
+    tmpdir = tempfile.mkdtemp()
+    refPath = os.path.join(tmpdir, 'reference.obj')
+    newPath = os.path.join(tmpdir, 'new.obj')
+    ok = True
+    try:
+        for useNormals in [True, False]:
+            config = Config(useNormals)
+            tOld, _ = timeit(lambda: _writeObjFileReference(refPath, meshes, config))
+            tNew, _ = timeit(lambda: wavefront.writeObjFile(newPath, meshes, False, config))
+            with open(refPath, 'rb') as f:
+                ref = f.read()
+            with open(newPath, 'rb') as f:
+                new = f.read()
+            ok &= report('OBJ export (normals %s)' % useNormals, tOld, tNew, ref == new)
+    finally:
+        for path in [refPath, newPath]:
+            if os.path.isfile(path):
+                os.remove(path)
+        os.rmdir(tmpdir)
+    return ok
+
+
+### Vertex bone weights
+
+def _compileVertexWeightsReference(vertBoneMapping, skel, nWeights, vertexCount):
+    """
+    Per vertex weights compilation, as VertexBoneWeights._compileVertexWeights
+    was implemented before it was vectorized.
+    """
+    dtype = [('b_idx%s' % (i+1), np.uint32) for i in xrange(nWeights)] + \
+            [('wght%s' % (i+1), np.float32) for i in xrange(nWeights)]
+    compiled_vertweights = np.zeros(vertexCount, dtype=dtype)
+
+    _ws = dict()
+    b_lookup = dict([(b.name,b_idx) for b_idx,b in enumerate(skel.getBones())])
+    for bname, mapping in vertBoneMapping.items():
+        if bname not in b_lookup:
+            continue
+        b_idx = b_lookup[bname]
+        verts,weights = mapping
+        for v_idx, wght in zip(verts, weights):
+            if v_idx not in _ws:
+                _ws[v_idx] = []
+            _ws[v_idx].append( (wght, b_idx) )
+    for v_idx in _ws:
+        if len(_ws[v_idx]) > nWeights:
+            _ws[v_idx] = sorted(_ws[v_idx], reverse=True)[:nWeights]
+            weightvals = np.asarray( [e[0] for e in _ws[v_idx]], dtype=np.float32)
+            weightvals /= np.sum(weightvals)
+            for i in xrange(nWeights):
+                _ws[v_idx][i] = (weightvals[i], _ws[v_idx][i][1])
+        else:
+            _ws[v_idx] = sorted(_ws[v_idx], reverse=True)
+
+    for v_idx, wghts in _ws.items():
+        for i, (w, bidx) in enumerate(wghts):
+            compiled_vertweights[v_idx]['wght%s' % (i+1)] = w
+            compiled_vertweights[v_idx]['b_idx%s' % (i+1)] = bidx
+
+    return compiled_vertweights
+
+def loadHumanWithSkeleton():
+    """
+    Human with the default skeleton, or None if the skeleton or its weights
+    are not available.
+    """
+    import files3d
+    import getpath
+    import human
+    import skeleton
+    import batchmode
+    from core import G
+    try:
+        G.app = batchmode.BatchApplication()
+        hm = human.Human(files3d.loadMesh(getpath.getSysDataPath("3dobjs/base.obj"), maxFaces = 5))
+        G.app.selectedHuman = hm
+        skel = skeleton.load(getpath.getSysDataPath('rigs/default.mhskel'), hm.meshData)
+        hm.setBaseSkeleton(skel)
+    except Exception as e:
+        print 'Default skeleton could not be loaded (%s)' % e
+        return None
+    return hm
+
+def loadLargestProxy(hm):
+    """
+    The proxy mesh with the most vertices, or None if none are available.
+    """
+    import fnmatch
+    import getpath
+    import proxy
+    largest = None
+    root = getpath.getSysDataPath('proxymeshes')
+    for dirpath, _, filenames in os.walk(root):
+        for filename in fnmatch.filter(filenames, '*.proxy'):
+            pxy = proxy.loadProxy(hm, os.path.join(dirpath, filename), type='Proxymeshes')
+            if pxy and (largest is None or len(pxy.ref_vIdxs) > len(largest.ref_vIdxs)):
+                largest = pxy
+    return largest
+
+def benchmarkVertexWeights():
+    """
+    Compile the vertex weights of the default skeleton for the base mesh and
+    for the largest proxy mesh, and compare with the reference implementation.
+    """
+    hm = loadHumanWithSkeleton()
+    if hm is None:
+        print 'Skipped vertex weights benchmark'
+        return None
+    skel = hm.getBaseSkeleton()
+    weights = [('base mesh', skel.getVertexWeights())]
+    pxy = loadLargestProxy(hm)
+    if pxy is not None:
+        weights.append(('proxy %s' % pxy.name, pxy.getVertexWeights(weights[0][1])))
+
+    ok = True
+    for name, vertWeights in weights:
+        for nWeights in sorted(set([4, vertWeights.getMaxNumberVertexWeights()])):
+            args = (vertWeights.data, skel, nWeights, vertWeights.vertexCount)
+            tOld, ref = timeit(lambda: _compileVertexWeightsReference(*args))
+            tNew, new = timeit(lambda: vertWeights._compileVertexWeights(*args))
+            refBones = np.column_stack([ref['b_idx%s' % (i+1)] for i in xrange(nWeights)])
+            refWeights = np.column_stack([ref['wght%s' % (i+1)] for i in xrange(nWeights)])
+            ok &= report('Vertex weights %s (%s weights)' % (name, nWeights), tOld, tNew,
+                         np.array_equal(refBones, new.boneIdxs) and np.array_equal(refWeights, new.weights))
+    return ok
+
+
+### Skinning
+
+def randomPose(nBones, seed=0):
+    """
+    Random rigid skinning matrices (nBones x 3 x 4).
+    """
+    import transformations as tm
+    rng = np.random.RandomState(seed)
+    poseData = np.zeros((nBones, 3, 4), dtype=np.float32)
+    for b_idx in xrange(nBones):
+        poseData[b_idx,:3,:3] = tm.random_rotation_matrix(rng.rand(3))[:3,:3]
+        poseData[b_idx,:3,3] = rng.rand(3) - 0.5
+    return poseData
+
+def benchmarkSkinning():
+    """
+    Skin the base mesh with the default skeleton weights (or random weights
+    if the skeleton is not available) in a random pose, with linear blend and
+    dual quaternion skinning. Both must agree for vertices influenced by a
+    single bone. For blended weights, dual quaternion skinning must exactly
+    apply a transform shared by all bones (even if the quaternions of some
+    bones have the opposite sign), and its blended rotations must preserve
+    the length of vectors.
+    """
+    import animation
+
+    hm = loadHumanWithSkeleton()
+    if hm is not None:
+        skel = hm.getBaseSkeleton()
+        nBones = len(skel.getBones())
+        weights = skel.getVertexWeights().compiled(6, skel)
+        coords = hm.meshData.coord
+    else:
+        print 'Using random weights'
+        obj = loadBaseObject()
+        coords = obj.mesh.coord
+        nBones = 60
+        rng = np.random.RandomState(0)
+        w = rng.rand(len(coords), 4).astype(np.float32)
+        w /= np.sum(w, axis=1)[:,None]
+        weights = animation.CompiledVertexWeights(rng.randint(0, nBones, (len(coords), 4)).astype(np.uint32), w)
+    coords4 = np.ones((len(coords), 4), dtype=np.float32)
+    coords4[:,:3] = coords[:,:3]
+    poseData = randomPose(nBones)
+    out = np.zeros((len(coords), 3), dtype=np.float32)
+
+    tOld, _ = timeit(lambda: animation.skinMesh(coords4, weights, poseData, out=out))
+    tNew, _ = timeit(lambda: animation.skinMeshDualQuaternion(coords4, weights, poseData, out=out))
+
+    single = animation.CompiledVertexWeights(weights.boneIdxs[:,:1], np.ones((len(coords), 1), dtype=np.float32))
+    lbs = animation.skinMesh(coords4, single, poseData)
+    dqs = animation.skinMeshDualQuaternion(coords4, single, poseData)
+    identical = np.allclose(lbs, dqs, atol=1e-4)
+
+    shared = np.repeat(poseData[:1], nBones, axis=0)
+    realQuats, dualQuats = animation.matricesToDualQuaternions(shared)
+    sign = np.where(np.arange(nBones) % 2, -1, 1).astype(realQuats.dtype)[:,None]
+    dqs = animation.skinMeshDualQuaternion(coords4, weights, (sign * realQuats, sign * dualQuats))
+    exact = np.dot(coords4, shared[0].T)
+    sharedOk = np.allclose(dqs, exact, atol=1e-4)
+
+    vectors = coords4.copy()
+    vectors[:,3] = 0
+    dqs = animation.skinMeshDualQuaternion(vectors, weights, poseData)
+    rigidOk = np.allclose(np.sqrt(np.sum(dqs ** 2, axis=-1)), np.sqrt(np.sum(vectors ** 2, axis=-1)), rtol=1e-4, atol=1e-5)
+
+    print 'Dual quaternion skinning: single bone %s, shared transform %s, unit rotations %s' % \
+        (identical, sharedOk, rigidOk)
+    return report('Skinning (linear blend vs dual quaternion)', tOld, tNew, identical and sharedOk and rigidOk)
+
+
+### BVH import
+
+def _eulerMatricesReference(ai, aj, ak, axes='sxyz'):
+    """
+    Per frame euler to matrix conversion, as BVHJoint.calculateFrames was
+    implemented before it used bvh.eulerMatrices.
+    """
+    import transformations as tm
+    return np.array([tm.euler_matrix(ai[f], aj[f], ak[f], axes=axes)[:3,:3] for f in xrange(len(ai))])
+
+def _loadBvhReference(path):
+    """
+    Load a BVH file the way bvh.load did before motion data was read and
+    converted to matrices all at once.
+    """
+    import bvh
+
+    class BVHReference(bvh.BVH):
+        def _BVH__readMotion(self, fp):
+            joints = self.getJointsBVHOrder()
+            for i in range(self.frameCount):
+                data = [float(word) for word in fp.readline().split()]
+                for joint in joints:
+                    nChannels = len(joint.channels)
+                    joint.frames.extend(data[:nChannels])
+                    data = data[nChannels:]
+
+    eulerMatrices = bvh.eulerMatrices
+    bvh.eulerMatrices = _eulerMatricesReference
+    try:
+        result = BVHReference()
+        result.convertFromZUp = "auto"
+        result.fromFile(path)
+    finally:
+        bvh.eulerMatrices = eulerMatrices
+    return result
+
+def writeSyntheticBvh(path, nFrames, seed=0):
+    """
+    Write a BVH file with the hierarchy of one of the bundled animations and
+    nFrames frames of random motion.
+    """
+    import bvh
+    import getpath
+    srcPath = getpath.getSysDataPath('animations/walks/walk1.bvh')
+    nChannels = sum([len(joint.channels) for joint in bvh.load(srcPath).getJointsBVHOrder()])
+    hierarchy = open(srcPath, 'rU', encoding="utf-8").read().split('MOTION')[0]
+
+    rng = np.random.RandomState(seed)
+    motion = rng.uniform(-180, 180, (nFrames, nChannels))
+    fp = open(path, 'w', encoding="utf-8")
+    fp.write(hierarchy)
+    fp.write('MOTION\nFrames: %d\nFrame Time: 0.033333\n' % nFrames)
+    fp.write("".join(["%s\n" % " ".join(["%.6f" % v for v in frame]) for frame in motion]))
+    fp.close()
+
+def benchmarkBvhImport(nFrames=5000):
+    import bvh
+    fd, path = tempfile.mkstemp(suffix='.bvh')
+    os.close(fd)
+    try:
+        writeSyntheticBvh(path, nFrames)
+        tOld, old = timeit(lambda: _loadBvhReference(path), repeat=1)
+        tNew, new = timeit(lambda: bvh.load(path), repeat=1)
+    finally:
+        os.remove(path)
+
+    identical = all([np.allclose(o.matrixPoses, n.matrixPoses, atol=1e-6) for o, n in zip(old.getJoints(), new.getJoints())])
+    return report('BVH import (%s frames)' % nFrames, tOld, tNew, identical)
+
+
+### Subdivision
+
+def _subdivisionVertEdges(sub):
+    """
+    Edges connected to each base vert of a subdivision object, as the
+    subdivision used to build them (vedge, nedges).
+    """
+    nverts = sub.cbase
+    vedge = np.zeros((nverts, sub.MAX_FACES), dtype=np.uint32)
+    nedges = np.zeros(nverts, dtype=np.uint8)
+    map_ = np.argsort(sub.evert[:,0,:].flat)
+    vi = sub.evert[:,0,:].flat[map_]
+    ei = np.mgrid[:len(sub.evert),:2][0].flat[map_].astype(np.uint32)
+    ix, first = np.unique(vi, return_index=True)
+    n = first[1:] - first[:-1]
+    n = np.hstack((n, np.array([len(vi) - first[-1]])))
+    nedges[ix] = n.astype(np.uint8)
+    for i in xrange(len(ix)):
+        vedge[ix[i],:n[i]] = ei[first[i]:][:n[i]]
+    return vedge, nedges
+
+def _updateSubdivisionCoordsReference(sub, vedge, nedges):
+    """
+    Catmull-Clark refinement of the parent coordinates, as
+    SubdivisionObject.update_coords was implemented before it was expressed
+    as a sparse operator.
+    """
+    parent = sub.parent
+    coord = np.zeros((sub.getVertexCount(), 3), dtype=np.float32)
+    bvert = coord[:sub.cbase]
+    cvert = coord[sub.cbase:sub.ebase]
+    evert = coord[sub.ebase:]
+
+    cvert[...] = np.sum(parent.coord[parent.fvert[sub.face_map]], axis=1) / 4
+    pcoord = parent.coord[sub.vtx_map]
+
+    ic1 = sub.evert[:,1,0]
+    ic2 = sub.evert[:,1,1]
+    mvert = pcoord[sub.evert[:,0,0]] + pcoord[sub.evert[:,0,1]]
+    vc = cvert[ic1] + cvert[ic2]
+    inedge = (ic1 == ic2)
+    evert[...] = np.where(inedge[:,None], mvert / 2, (mvert + vc) / 4)
+
+    nvface = parent.nfaces[sub.vtx_map]
+    edgewt = np.arange(sub.MAX_FACES)[None,:,None] < nedges[:,None,None]
+    edgewt2 = edgewt * inedge[vedge][:,:,None]
+    edgewt = edgewt / nedges.astype(np.float32)[:,None,None]
+    nvedge = np.sum(edgewt2, axis=1)
+    oevert = np.sum(mvert[vedge] * edgewt / 2, axis=1)
+    oevert2 = np.sum(mvert[vedge] * edgewt2 / 2, axis=1)
+    facewt = np.arange(sub.MAX_FACES)[None,:,None] < nvface[:,None,None]
+    facewt = facewt / nvface.astype(np.float32)[:,None,None]
+    ofvert = np.sum(cvert[sub.face_rmap[parent.vface[sub.vtx_map]]] * facewt, axis=1)
+    opvert = pcoord
+
+    valid = nvface >= 3
+    bvert[...] = np.where(valid[:,None],
+                          np.where((nedges == nvface)[:,None],
+                                   (ofvert + 2 * oevert + (nvface[:,None] - 3) * opvert) / nvface[:,None],
+                                   (oevert2 + opvert) / (nvedge + 1)),
+                          (3 * oevert - ofvert) / 2)
+    return coord
+
+def benchmarkSubdivision():
+    """
+    Refine the coordinates of the subdivided base mesh with the reference
+    implementation and the sparse refinement operator.
+    """
+    import catmull_clark_subdivision as cks
+
+    obj = loadBaseObject()
+    mesh = obj.mesh
+    mesh.coord[...] += np.random.RandomState(0).normal(scale=0.01, size=mesh.coord.shape)
+    subdivided = cks.createSubdivisionObject(mesh)
+    vedge, nedges = _subdivisionVertEdges(subdivided)
+
+    def update():
+        subdivided.update_coords()
+        return subdivided.coord.copy()
+    tOld, old = timeit(lambda: _updateSubdivisionCoordsReference(subdivided, vedge, nedges), repeat=10)
+    tNew, new = timeit(update, repeat=10)
+    identical = np.allclose(old, new, rtol=0, atol=1e-5)
+    return report('Subdivision coordinates update', tOld, tNew, identical)
+
+def _closeupFaceMask(mesh):
+    """
+    Faces of the head and the hands of the base mesh, selected by position as
+    the base mesh body is one face group.
+    """
+    centers = np.mean(mesh.coord[mesh.fvert], axis=1)
+    bmin, bmax = mesh.calcBBox()
+    height = bmax[1] - bmin[1]
+    width = max(abs(bmin[0]), abs(bmax[0]))
+    return (centers[:,1] > bmax[1] - 0.13 * height) | (np.abs(centers[:,0]) > 0.75 * width)
+
+def _meshBytes(mesh):
+    """
+    Memory used by the arrays of a mesh and the levels it was subdivided from.
+    """
+    total = 0
+    while mesh is not None:
+        total += sum([v.nbytes for v in mesh.__dict__.values() if isinstance(v, np.ndarray)])
+        mesh = getattr(mesh, 'parent', None) if hasattr(mesh, 'level') else None
+    return total
+
+def benchmarkSubdivisionLevels():
+    """
+    Memory and timings of subdividing the base mesh over multiple levels,
+    entirely and adaptively (only the head and the hands).
+    """
+    import catmull_clark_subdivision as cks
+
+    obj = loadBaseObject()
+    mesh = obj.mesh
+    staticFaceMask = mesh.getFaceMaskForGroups(['body'])
+    closeup = _closeupFaceMask(mesh) & staticFaceMask
+
+    print '%-10s %5s %9s %9s %10s %9s %9s %9s' % \
+        ('mode', 'level', 'verts', 'faces', 'entries', 'mem (MB)', 'create', 'update')
+    for mode, refineFaceMask, levels in [('full', None, 2), ('adaptive', closeup, 3)]:
+        for level in xrange(1, levels+1):
+            cks._operatorCache.clear()
+            tCreate, sub = timeit(lambda: cks.createSubdivisionObject(mesh, staticFaceMask, level, refineFaceMask), repeat=1)
+            tUpdate, _ = timeit(sub.update_coords)
+            entries = sum([op.rows.size for op in sub._coordOperators + sub._uvOperators])
+            nbytes = _meshBytes(sub) + sum([op.nbytes for op in sub._coordOperators + sub._uvOperators])
+            print '%-10s %5d %9d %9d %10d %9.1f %8.3fs %8.3fs' % \
+                (mode, level, sub.getVertexCount(), sub.getFaceCount(), entries,
+                 nbytes / 1024.0**2, tCreate, tUpdate)
+            del sub
+    return True
+
+def benchmarkPosedSubdivision():
+    """
+    Play the frames of a BVH clip on the subdivided human, subdividing the
+    posed base mesh after every frame (old) or skinning the subdivided mesh
+    directly with the weights transferred through the subdivision (new).
+    The results are not identical, as skinning is not linear in the
+    vertices, the largest distance between them must stay small compared to
+    the size of the human. The one-off transfer of the weights (about 0.35s
+    for the default human) is not timed. Both paths still update the normals
+    and tangents of the base and subdivided mesh, which dominate the time,
+    so the gain is modest: 2.0s (old) against 1.3-1.5s (new) for 14 frames.
+    """
+    import bvh
+    import getpath
+
+    hm = loadHumanWithSkeleton()
+    if hm is None:
+        print 'Skipped posed subdivision benchmark'
+        return None
+    bvhFile = bvh.load(getpath.getSysDataPath('animations/walks/walk1.bvh'), convertFromZUp="auto")
+    anim = bvhFile.createAnimationTrack(hm.getBaseSkeleton())
+    hm.addAnimation(anim)
+    hm.setActiveAnimation(anim.name)
+    hm.setPosed(True)
+    hm.setSubdivided(True)
+    frames = range(anim.nFrames)
+
+    def play():
+        result = []
+        for frame in frames:
+            hm.setToFrame(frame, update=False)
+            hm.refreshPose()
+            result.append(hm.mesh.coord.copy())
+        return np.array(result)
+
+    def warmUp(skinSubdivided):
+        # Not timed: the one-off transfer of the weights to the subdivided
+        # mesh (new), and compiling the weights (both)
+        hm.skinSubdivided = skinSubdivided
+        hm.setToFrame(0, update=False)
+        hm.refreshPose()
+
+    warmUp(False)
+    tOld, old = timeit(play, repeat=3)
+    warmUp(True)
+    tNew, new = timeit(play, repeat=3)
+
+    bmin, bmax = hm.meshData.calcBBox()
+    deviation = np.max(np.sqrt(np.sum((old - new) ** 2, axis=-1)))
+    print 'Largest distance between subdivided and skinned vertices: %.4f (human height %.2f)' % \
+        (deviation, bmax[1] - bmin[1])
+    return report('Posed subdivision (%s frames)' % len(frames), tOld, tNew,
+                  deviation < 0.01 * (bmax[1] - bmin[1]), tolerance=True)
+
+
+### Normals
+
+def _calcVertexNormalsReference(mesh):
+    """
+    Vertex normals the way calcVertexNormals calculated them before it used
+    the vertex-face incidence matrix.
+    """
+    norms = mesh.fnorm[mesh.vface]
+    norms *= np.arange(mesh.MAX_FACES)[None,:,None] < mesh.nfaces[:,None,None]
+    norms = np.sum(norms, axis=1)
+    norms /= np.sqrt(np.sum(norms ** 2, axis=-1))[:,None]
+    return norms
+
+def benchmarkNormals():
+    """
+    Calculate the vertex normals of the base mesh with the reference
+    implementation and the incidence matrix. Then move the head, and
+    update all normals or only the normals around the moved vertices.
+    """
+    obj = loadBaseObject()
+    mesh = obj.mesh
+    mesh.calcNormals()
+
+    def calcVertexNormals():
+        mesh.calcVertexNormals()
+        return mesh.vnorm.copy()
+    tOld, old = timeit(lambda: _calcVertexNormalsReference(mesh), repeat=10)
+    tNew, new = timeit(calcVertexNormals, repeat=10)
+    valid = np.all(np.isfinite(old), axis=1)
+    identical = np.allclose(old[valid], new[valid], rtol=0, atol=1e-6)
+    if not report('Vertex normals', tOld, tNew, identical):
+        return False
+
+    head = np.flatnonzero(mesh.coord[:,1] > np.max(mesh.coord[:,1]) - 2.0)
+    offsets = np.random.RandomState(0).normal(scale=0.01, size=(len(head), 3)).astype(np.float32)
+    def update(incremental):
+        mesh.changeCoords(mesh.coord[head] + offsets, head)
+        if not incremental:
+            mesh.markCoords(coor=True)
+        mesh.calcNormals()
+    tOld, _ = timeit(lambda: update(False), repeat=10)
+    tNew, _ = timeit(lambda: update(True), repeat=10)
+
+    # The incremental update must match recalculating all normals
+    update(True)
+    new = mesh.vnorm.copy()
+    mesh.markCoords(coor=True)
+    mesh.calcNormals()
+    identical = np.allclose(new, mesh.vnorm, rtol=0, atol=1e-6)
+    return report('Normals update (%s of %s verts moved)' % (len(head), len(mesh.coord)),
+                  tOld, tNew, identical)
+
+
+BENCHMARKS = {
+    'bvhimport': benchmarkBvhImport,
+    'normals': benchmarkNormals,
+    'objexport': benchmarkObjExport,
+    'posedsubdivision': benchmarkPosedSubdivision,
+    'skinning': benchmarkSkinning,
+    'subdivision': benchmarkSubdivision,
+    'subdivisionlevels': benchmarkSubdivisionLevels,
+    'vertexweights': benchmarkVertexWeights,
+}
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or sorted(BENCHMARKS.keys())
+    results = [BENCHMARKS[name]() for name in names]
+    passed = [name for name, result in zip(names, results) if result]
+    skipped = [name for name, result in zip(names, results) if result is None]
+    failed = [name for name, result in zip(names, results) if result is not None and not result]
+    print '%d passed, %d failed, %d skipped%s' % \
+        (len(passed), len(failed), len(skipped), (' (%s)' % ', '.join(skipped)) if skipped else '')
+    sys.exit(1 if failed else 0)